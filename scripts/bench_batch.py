@@ -0,0 +1,66 @@
+"""Benchmark the consensus of many small sets of trees, comparing one
+`python -m primconstree -f` invocation per set with the batch mode
+(batch_consensus()) for several numbers of processes, in sets per second.
+"""
+
+import glob
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from primconstree import batch_consensus
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+INPUTS = "datasets/kmedoids/cluster*.txt"  # the sets of trees
+REPEAT = 200  # number of times each set is given to the batch
+NB_SUBPROCESS = 20  # number of sets run with one invocation each
+JOBS = [1, 2, 4, 8]  # number of processes, values above the cpu count are skipped
+CRITS = ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"]
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    files = sorted(glob.glob(INPUTS)) * REPEAT
+    logging.info("%-20s %8s %10s %10s", "mode", "sets", "time (s)", "sets/s")
+
+    start = time.perf_counter()
+    for f in files[:NB_SUBPROCESS]:
+        subprocess.run(
+            [sys.executable, "-m", "primconstree", "-f", f],
+            capture_output=True,
+            check=True,
+        )
+    duration = time.perf_counter() - start
+    logging.info(
+        "%-20s %8i %10.2f %10.1f",
+        "one process per set",
+        NB_SUBPROCESS,
+        duration,
+        NB_SUBPROCESS / duration,
+    )
+
+    for jobs in [j for j in JOBS if j <= (os.cpu_count() or 1)]:
+        start = time.perf_counter()
+        for _, _, error in batch_consensus(files, CRITS, jobs):
+            if error is not None:
+                raise Exception(error)
+        duration = time.perf_counter() - start
+        logging.info(
+            "%-20s %8i %10.2f %10.1f",
+            f"batch, {jobs} jobs",
+            len(files),
+            duration,
+            len(files) / duration,
+        )
@@ -0,0 +1,118 @@
+"""Benchmark the disk engine (-e disk, see diskgraph.py) against the in-memory
+engines on discordant trees, whose supergraph grows with the number of trees
+times the number of taxa, each run in a process whose memory is limited.
+
+The limit is set with RLIMIT_DATA (Linux), which counts the heap and private
+mappings but not the memory mapped supergraph file, whose pages are evictable
+page cache. numpy (imported by ete3) is limited to one thread, as the buffers
+of its other threads would count. The consensus of each engine is checked to
+be the same as the one of the csr engine without limit.
+"""
+
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import ete3
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+NB_TREES = 2000  # number of random input trees
+NB_TAXA = 200  # number of taxa of each tree
+MEMORY_LIMIT = 256 << 20  # in bytes, for the limited runs
+ENGINES = ["networkx", "csr", "disk"]
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def run(input_file: str, engine: str, limit: int | None) -> tuple:
+    """Run the command line on the input file in a new process, with a
+    memory limit in bytes or None
+
+    Return:
+        tuple: the consensus or None if the process failed, the time in
+            seconds and the peak resident memory in bytes
+    """
+
+    def set_limit() -> None:
+        if limit is not None:
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+    with tempfile.TemporaryFile() as output:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "primconstree", "-f", input_file, "-e", engine],
+            stdout=output,
+            stderr=subprocess.DEVNULL,
+            preexec_fn=set_limit,
+            env={**os.environ, "OPENBLAS_NUM_THREADS": "1"},
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        duration = time.perf_counter() - start
+        output.seek(0)
+        consensus = output.read().decode().strip() if status == 0 else None
+    return consensus, duration, usage.ru_maxrss * 1024
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    taxa = [f"T{i}" for i in range(NB_TAXA)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "trees.txt")
+        with open(input_file, "w") as file:
+            for _ in range(NB_TREES):
+                t = ete3.Tree()
+                t.populate(
+                    NB_TAXA,
+                    names_library=random.sample(taxa, NB_TAXA),
+                    random_branches=True,
+                )
+                file.write(t.write(dist_formatter="%r") + "\n")
+
+        reference, _, _ = run(input_file, "csr", None)
+        logging.info(
+            "%i trees on %i taxa, memory limit %i MiB",
+            NB_TREES,
+            NB_TAXA,
+            MEMORY_LIMIT >> 20,
+        )
+        logging.info(
+            "%-10s %-8s %10s %16s %8s",
+            "engine",
+            "limit",
+            "time (s)",
+            "peak rss (MiB)",
+            "result",
+        )
+        for engine in ENGINES:
+            for limit in [None, MEMORY_LIMIT]:
+                consensus, duration, peak = run(input_file, engine, limit)
+                if consensus is None:
+                    result = "failed"
+                elif consensus == reference:
+                    result = "same"
+                else:
+                    result = "DIFFERENT"
+                logging.info(
+                    "%-10s %-8s %10.2f %16.0f %8s",
+                    engine,
+                    "yes" if limit else "no",
+                    duration,
+                    peak / (1 << 20),
+                    result,
+                )
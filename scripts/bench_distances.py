@@ -0,0 +1,169 @@
+"""Benchmark the batched RF, branch score, Kendall-Colijn, triplet and quartet
+distances (TreeClades in utils/distances.py, KCVectors in utils/kcdist.py)
+against comparing each input tree with the consensus through ete3
+robinson_foulds(), bsd(), KC_dist() for each lambda, and the triplet_dist and
+quartet_dist programs of tqDist if TQDIST is set.
+
+Encoding the input trees is timed apart, as scripts/eval.py encodes them once
+for every consensus and metric. The distances of both are checked to be equal
+within TOLERANCE (relative for KC, with branch lengths written in full for
+KC_dist()).
+"""
+
+import glob
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import ete3
+import numpy as np
+
+from primconstree.utils import read_trees
+from utils.distances import (
+    TreeClades,
+    bsd,
+    bsd_distances,
+    rf_distances,
+    tq_distances,
+)
+from utils.kcdist import KC_dist, KCVectors
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+INPUTS = "datasets/simulated/Trex_trees*.txt"  # files of real inputs
+N = [50, 200]  # number of taxa of the synthetic inputs
+NB_TREES = 500  # number of trees of the synthetic inputs
+LAMBDAS = [0.0, 0.5, 1.0]  # lambdas of the KC distance
+TOLERANCE = 1e-12
+TQDIST = None  # directory of the tqDist programs to compare with, None to skip
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def timed(f) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def naive_rf(trees: list[ete3.Tree], consensus: ete3.Tree) -> list[float]:
+    distances = []
+    for tree in trees:
+        rf, max_rf = tree.robinson_foulds(consensus, unrooted_trees=True)[:2]
+        distances.append(rf / max_rf)
+    return distances
+
+
+def naive_kc(trees: list[ete3.Tree], consensus: ete3.Tree) -> list[list[float]]:
+    cons = consensus.write(dist_formatter="%0.17g")
+    newicks = [t.write(dist_formatter="%0.17g") for t in trees]
+    return [[KC_dist(cons, nwk, lam) for nwk in newicks] for lam in LAMBDAS]
+
+
+def naive_tq(trees: list[ete3.Tree], consensus: ete3.Tree) -> list[list[int]]:
+    """The triplet and quartet distances computed by tqDist, a process each"""
+    distances = []
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [os.path.join(tmp, "tree"), os.path.join(tmp, "consensus")]
+        with open(files[1], "w") as file:
+            file.write(consensus.write(format=9) + "\n")
+        for program in ["triplet_dist", "quartet_dist"]:
+            distances.append([])
+            for tree in trees:
+                with open(files[0], "w") as file:
+                    file.write(tree.write(format=9) + "\n")
+                cmd = [os.path.join(TQDIST, program), *files]
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                distances[-1].append(int(result.stdout))
+    return distances
+
+
+def bench(name: str, trees: list[ete3.Tree]) -> None:
+    """Log the timings of a list of trees, in ms, against the first one"""
+    consensus = trees[0]
+    rf_naive, rf_ref = timed(lambda: naive_rf(trees, consensus))
+    bsd_naive, bsd_ref = timed(lambda: [bsd(t, consensus) for t in trees])
+
+    encode, clades = timed(lambda: TreeClades(trees))
+    rf_batch, rf = timed(lambda: rf_distances(clades, consensus))
+    bsd_batch, bsd_ = timed(lambda: bsd_distances(clades, consensus))
+
+    kc_naive, kc_ref = timed(lambda: naive_kc(trees, consensus))
+    kc_encode, vectors = timed(lambda: KCVectors(trees))
+    kc_batch, kc = timed(lambda: vectors.distances(consensus, LAMBDAS))
+
+    triplet_batch, triplet = timed(lambda: tq_distances(clades, consensus, 3))
+    quartet_batch, quartet = timed(lambda: tq_distances(clades, consensus, 4))
+    tq_naive, tq_ref = float("nan"), [triplet.tolist(), quartet.tolist()]
+    if TQDIST is not None:
+        tq_naive, tq_ref = timed(lambda: naive_tq(trees, consensus))
+    same = (
+        np.allclose(rf, rf_ref, rtol=0, atol=TOLERANCE)
+        and np.allclose(bsd_, bsd_ref, rtol=0, atol=TOLERANCE)
+        and np.allclose(kc, kc_ref, rtol=TOLERANCE, atol=TOLERANCE)
+        and [triplet.tolist(), quartet.tolist()] == tq_ref
+    )
+
+    logging.info(
+        "%-28s %6i %6i %9.1f %9.1f %9.1f %9.2f %9.2f %9.1f %9.1f %9.2f %9.1f "
+        "%9.2f %9.2f %s",
+        name,
+        len(trees),
+        len(clades.taxa),
+        1000 * rf_naive,
+        1000 * bsd_naive,
+        1000 * encode,
+        1000 * rf_batch,
+        1000 * bsd_batch,
+        1000 * kc_naive,
+        1000 * kc_encode,
+        1000 * kc_batch,
+        1000 * tq_naive,
+        1000 * triplet_batch,
+        1000 * quartet_batch,
+        "same" if same else "DIFFERENT",
+    )
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    logging.info(
+        "%-28s %6s %6s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s %9s",
+        "input (times in ms)",
+        "trees",
+        "taxa",
+        "rf ete3",
+        "bsd",
+        "encode",
+        "rf batch",
+        "bsd batch",
+        "kc",
+        "kc encode",
+        "kc batch",
+        "tqdist",
+        "triplets",
+        "quartets",
+    )
+    for input_file in sorted(glob.glob(INPUTS)):
+        bench(os.path.basename(input_file), read_trees(input_file))
+
+    for n in N:
+        names = [f"T{i}" for i in range(n)]
+        trees = []
+        for _ in range(NB_TREES):
+            tree = ete3.Tree()
+            tree.populate(n, names_library=names, random_branches=True)
+            trees.append(tree)
+        bench(f"synthetic n={n}", trees)
@@ -0,0 +1,80 @@
+"""Benchmark the time to incorporate one tree into the supergraph
+with respect to the number of taxa, comparing the postorder bitmask
+encoding of add_tree_to_graph() with the former per-node clade_to_id() encoding.
+"""
+
+import logging
+import random
+import timeit
+from typing import Generator, cast
+
+import ete3
+import networkx as nx
+
+from primconstree.algorithm import add_tree_to_graph
+from primconstree.utils import clade_to_id
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+N = [25, 50, 100, 200, 400, 800, 1600]  # values for number of taxa
+NB_TREES = 20  # number of random trees per number of taxa
+MAX_N_LEGACY = 400  # the legacy encoding is skipped above this number of taxa
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def add_tree_to_graph_legacy(t: ete3.Tree, taxa: list[str], graph: nx.Graph) -> None:
+    """Former add_tree_to_graph(), encoding each node with get_leaf_names()"""
+    for node in cast(Generator[ete3.Tree, None, None], t.traverse(strategy="preorder")):
+        nid = clade_to_id(node.get_leaf_names(), taxa)
+        if nid not in graph.nodes:
+            graph.add_node(nid, node_freq=0, is_leaf=node.is_leaf())
+        if node.up:
+            graph.nodes[nid]["node_freq"] += 1
+            pid = clade_to_id(node.up.get_leaf_names(), taxa)
+            if nid not in graph[pid]:
+                graph.add_edge(pid, nid, avglen=0, edge_freq=0)
+            graph[pid][nid]["avglen"] += node.dist
+            graph[pid][nid]["edge_freq"] += 1
+
+
+def per_tree_time(add_tree, trees: list[ete3.Tree], taxa: list[str]) -> float:
+    """Average time in seconds to incorporate one tree in a fresh graph"""
+    graph = nx.Graph()
+    duration = timeit.timeit(
+        lambda: [add_tree(t, taxa, graph) for t in trees], number=1
+    )
+    return duration / len(trees)
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    logging.info(
+        "%6s %14s %14s %14s", "n", "us/tree", "ns/tree/taxon", "legacy us/tree"
+    )
+    for n in N:
+        taxa = [f"T{i}" for i in range(n)]
+        trees = []
+        for _ in range(NB_TREES):
+            t = ete3.Tree()
+            t.populate(n, names_library=random.sample(taxa, n), random_branches=True)
+            trees.append(t)
+
+        new = per_tree_time(add_tree_to_graph, trees, taxa)
+        legacy = (
+            per_tree_time(add_tree_to_graph_legacy, trees, taxa)
+            if n <= MAX_N_LEGACY
+            else float("nan")
+        )
+        logging.info(
+            "%6i %14.1f %14.1f %14.1f", n, new * 1e6, new * 1e9 / n, legacy * 1e6
+        )
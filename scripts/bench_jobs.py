@@ -0,0 +1,107 @@
+"""Benchmark the supergraph construction with respect to the number of
+processes (--jobs), and check that every parallel build gives the same
+graph as the serial one.
+
+The merge of the partial supergraphs (see parallel.py) runs in the parent
+after the workers, so it bounds the speed-up. Its time and the size of the
+pickled shards are measured for every number of shards, building the shards
+in process, including numbers above the cpu count whose builds are not timed.
+"""
+
+import logging
+import os
+import pickle
+import random
+import timeit
+
+import ete3
+import networkx as nx
+
+from primconstree.algorithm import build_graph
+from primconstree.parallel import build_shard, merge_shards
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+NB_TREES = 5000  # number of random input trees
+NB_TAXA = 50  # number of taxa of each tree
+JOBS = [1, 2, 4, 8, 16]  # number of processes, values above the cpu count are skipped
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def build(newicks: list[str], taxa: list[str], jobs: int) -> nx.Graph:
+    """Parse and incorporate the trees as the CLI does for a given number of jobs"""
+    if jobs == 1:
+        return build_graph([ete3.Tree(t) for t in newicks], taxa)
+    return build_graph(newicks, taxa, jobs)
+
+
+def merge_cost(newicks: list[str], taxa: list[str], jobs: int) -> tuple[float, int]:
+    """Time of merging the shards of <jobs> workers and size of the shards
+    sent back by the workers, in bytes
+    """
+    size = max(1, -(-len(newicks) // jobs))
+    chunks = [newicks[i : i + size] for i in range(0, len(newicks), size)]
+    shards = [build_shard(chunk, taxa) for chunk in chunks]
+    payload = sum(len(pickle.dumps(shard)) for shard in shards)
+    duration = min(timeit.repeat(lambda: merge_shards(shards), number=1, repeat=3))
+    return duration, payload
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    taxa = [f"T{i}" for i in range(NB_TAXA)]
+    newicks = []
+    for _ in range(NB_TREES):
+        t = ete3.Tree()
+        t.populate(
+            NB_TAXA, names_library=random.sample(taxa, NB_TAXA), random_branches=True
+        )
+        newicks.append(t.write(dist_formatter="%r"))
+    taxa.sort()
+
+    reference = build(newicks, taxa, 1)
+    serial = 0.0
+    logging.info(
+        "%6s %10s %10s %10s %12s",
+        "jobs",
+        "time (s)",
+        "speed-up",
+        "merge (s)",
+        "shards (MB)",
+    )
+    for jobs in JOBS:
+        merge, payload = merge_cost(newicks, taxa, jobs)
+        if jobs > (os.cpu_count() or 1):
+            logging.info(
+                "%6i %10s %10s %10.2f %12.1f", jobs, "-", "-", merge, payload / 1e6
+            )
+            continue
+
+        graph = build(newicks, taxa, jobs)
+        if list(graph.nodes(data=True)) != list(reference.nodes(data=True)) or list(
+            graph.edges(data=True)
+        ) != list(reference.edges(data=True)):
+            raise Exception(f"Supergraph built with {jobs} jobs differs from serial")
+
+        duration = min(
+            timeit.repeat(lambda: build(newicks, taxa, jobs), number=1, repeat=3)
+        )
+        serial = serial or duration
+        logging.info(
+            "%6i %10.2f %10.2f %10.2f %12.1f",
+            jobs,
+            duration,
+            serial / duration,
+            merge,
+            payload / 1e6,
+        )
@@ -0,0 +1,78 @@
+"""Benchmark the throughput of the Newick reader of primconstree (newick.py)
+against parsing with ete3 then encoding the ete3 tree, and check both give
+the same clade-edge records.
+"""
+
+import glob
+import logging
+import random
+import timeit
+
+import ete3
+
+from primconstree.newick import newick_taxa, parse_newick
+from primconstree.utils import get_taxa_ids, tree_to_records
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+INPUTS = "datasets/simulated/Trex_trees*.txt"  # files of real inputs
+N = [50, 200, 1000]  # number of taxa of the synthetic inputs
+NB_TREES = 200  # number of trees of the synthetic inputs
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def bench(name: str, newicks: list[str]) -> None:
+    """Log the number of trees parsed per second by both readers"""
+    taxa_ids = get_taxa_ids(sorted(newick_taxa(newicks[0])))
+    for nwk in newicks:
+        if parse_newick(nwk, taxa_ids) != tree_to_records(ete3.Tree(nwk), taxa_ids):
+            raise Exception(f"Readers disagree on {nwk}")
+
+    fast = min(
+        timeit.repeat(
+            lambda: [parse_newick(nwk, taxa_ids) for nwk in newicks],
+            number=1,
+            repeat=3,
+        )
+    )
+    slow = min(
+        timeit.repeat(
+            lambda: [tree_to_records(ete3.Tree(nwk), taxa_ids) for nwk in newicks],
+            number=1,
+            repeat=3,
+        )
+    )
+    logging.info(
+        "%-40s %12.0f %12.0f %8.1f",
+        name,
+        len(newicks) / fast,
+        len(newicks) / slow,
+        slow / fast,
+    )
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    logging.info("%-40s %12s %12s %8s", "input", "trees/s", "ete3 trees/s", "speed-up")
+    for file in sorted(glob.glob(INPUTS)):
+        with open(file, "r") as f:
+            bench(file, [line.strip() for line in f if line.strip()])
+
+    random.seed(SEED)
+    for n in N:
+        taxa = [f"T{i}" for i in range(n)]
+        newicks = []
+        for _ in range(NB_TREES):
+            t = ete3.Tree()
+            t.populate(n, names_library=random.sample(taxa, n), random_branches=True)
+            newicks.append(t.write(dist_formatter="%r"))
+        bench(f"synthetic n={n}", newicks)
@@ -0,0 +1,283 @@
+"""Benchmark each phase of primconstree (read_trees, build_graph, build_mst
+split into run_mst, attach_leaves and mst_to_tree, remove_unecessary_nodes)
+and the end-to-end primconstree(), in time and peak memory, on the simulated
+datasets and on synthetic inputs scaling the number of trees k and of taxa n
+independently.
+
+Results are saved as JSON and compared with a stored baseline, entries slower
+or larger than the baseline beyond a tolerance are reported as regressions
+(exit code 1). Set SAVE_BASELINE to store the results as the new baseline.
+Times are the best of REPEAT runs, peak memory is measured in a separate run
+with tracemalloc, as the allocated memory above the start of the phase.
+"""
+
+import gc
+import glob
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import ete3
+
+from primconstree import algorithm, supergraph
+from primconstree.algorithm import mst_to_tree, remove_unecessary_nodes, run_mst
+from primconstree.newick import get_taxa
+from primconstree.primconstree import build_supergraph, primconstree
+from primconstree.utils import get_root_id, read_newicks, read_trees
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+DATASETS = "datasets/simulated/Trex_trees*.txt"  # real inputs
+K = [100, 500, 2000]  # values for number of trees, with N_FIXED taxa
+N = [50, 200, 500]  # values for number of taxa, with K_FIXED trees
+K_FIXED = 100
+N_FIXED = 50
+NB_SWAPS = 5  # number of leaf swaps turning the base tree into each synthetic tree
+ENGINES = ["networkx", "csr"]
+CRITS = ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"]
+REPEAT = 3  # number of timed runs, the best time is kept
+
+RESULTS_FILE = "outputs/bench/phases.json"  # file to output the results
+BASELINE_FILE = "scripts/bench_phases_baseline.json"  # results to compare with
+SAVE_BASELINE = False  # if True, save the results as the new baseline
+TIME_TOLERANCE = 0.25  # relative slow-down reported as a regression
+MEMORY_TOLERANCE = 0.10  # relative memory increase reported as a regression
+MIN_TIME = 0.005  # phases faster than this (s) are too noisy to compare
+MIN_MEMORY = 1 << 20  # phases allocating less than this (bytes) are not compared
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+PHASES = [
+    "read_trees",
+    "build_graph",
+    "run_mst",
+    "attach_leaves",
+    "mst_to_tree",
+    "remove_unecessary_nodes",
+    "primconstree",
+]
+
+
+class PhaseRecorder:
+    """Record the time or the peak memory of (possibly nested) phases"""
+
+    def __init__(self, memory: bool) -> None:
+        self.memory = memory
+        self.results: dict[str, float] = {}
+        # [memory at the start, peak so far before nested resets] of open phases
+        self._stack: list[list[int]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.memory:
+            start = time.perf_counter()
+            yield
+            self.results[name] = time.perf_counter() - start
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # reset_peak() below forgets the peak of the enclosing phase
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        self._stack.append([current, 0])
+        tracemalloc.reset_peak()
+        yield
+        start, saved = self._stack.pop()
+        self.results[name] = max(tracemalloc.get_traced_memory()[1], saved) - start
+
+
+def run_phases(input_file: str, engine: str, memory: bool) -> dict[str, float]:
+    """Run every phase on the input file, see PhaseRecorder"""
+    recorder = PhaseRecorder(memory)
+    gc.collect()
+
+    # attach_leaves() is called by run_mst(), record it as a nested phase
+    module = supergraph if engine == "csr" else algorithm
+    attach_leaves = module.attach_leaves
+
+    def recorded_attach_leaves(*args):
+        with recorder.phase("attach_leaves"):
+            attach_leaves(*args)
+
+    module.attach_leaves = recorded_attach_leaves
+    try:
+        with recorder.phase("read_trees"):
+            trees = read_trees(input_file)
+        taxa = get_taxa(trees[0])
+        with recorder.phase("build_graph"):
+            graph = build_supergraph(trees, taxa, engine)
+        with recorder.phase("run_mst"):
+            run_mst(graph, get_root_id(taxa), taxa, CRITS, SEED)
+        with recorder.phase("mst_to_tree"):
+            mst = mst_to_tree(graph)
+        with recorder.phase("remove_unecessary_nodes"):
+            remove_unecessary_nodes(mst, taxa)
+    finally:
+        module.attach_leaves = attach_leaves
+
+    del trees, graph, mst
+    gc.collect()
+    with recorder.phase("primconstree"):
+        primconstree(read_newicks(input_file), CRITS, engine=engine)
+
+    return recorder.results
+
+
+def make_trees(k: int, n: int) -> list[str]:
+    """k random trees on n taxa sharing most of their clades, obtained by
+    swapping leaves of a random base tree
+    """
+    base = ete3.Tree()
+    base.populate(n, names_library=[f"T{i}" for i in range(n)], random_branches=True)
+    leaves = base.get_leaves()
+    names = [leaf.name for leaf in leaves]
+
+    trees = []
+    for _ in range(k):
+        swapped = names.copy()
+        for _ in range(NB_SWAPS):
+            i, j = random.sample(range(n), 2)
+            swapped[i], swapped[j] = swapped[j], swapped[i]
+        for leaf, name in zip(leaves, swapped):
+            leaf.name = name
+        trees.append(base.write(dist_formatter="%0.4f"))
+    return trees
+
+
+def compare(results: list[dict], baseline: dict) -> int:
+    """Log the entries of results regressing from the baseline,
+    and return their number
+    """
+    if baseline["machine"] != results_machine():
+        logging.warning(
+            "baseline recorded on another machine (%s), comparison is indicative",
+            baseline["machine"],
+        )
+    reference = {(r["input"], r["engine"], r["phase"]): r for r in baseline["results"]}
+    regressions = 0
+    for r in results:
+        ref = reference.get((r["input"], r["engine"], r["phase"]))
+        if ref is None:
+            continue
+        for key, tolerance, minimum in [
+            ("time", TIME_TOLERANCE, MIN_TIME),
+            ("memory", MEMORY_TOLERANCE, MIN_MEMORY),
+        ]:
+            if max(r[key], ref[key]) >= minimum and r[key] > ref[key] * (1 + tolerance):
+                logging.warning(
+                    "regression %s %s %s %s: %.4g -> %.4g (%+.0f%%)",
+                    r["input"],
+                    r["engine"],
+                    r["phase"],
+                    key,
+                    ref[key],
+                    r[key],
+                    100 * (r[key] / ref[key] - 1),
+                )
+                regressions += 1
+    return regressions
+
+
+def results_machine() -> str:
+    """Description of the machine and interpreter running the benchmark"""
+    return (
+        f"{platform.machine()} {platform.system()} {os.cpu_count()} cpu, "
+        f"python {platform.python_version()}"
+    )
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    with tempfile.TemporaryDirectory() as tmp:
+        # (name, k, n, input file)
+        inputs = []
+        for input_file in sorted(glob.glob(DATASETS)):
+            newicks = read_newicks(input_file)
+            inputs.append(
+                (
+                    os.path.basename(input_file),
+                    len(newicks),
+                    len(get_taxa(newicks[0])),
+                    input_file,
+                )
+            )
+        cases = [(k, N_FIXED) for k in K] + [(K_FIXED, n) for n in N]
+        for k, n in dict.fromkeys(cases):
+            input_file = os.path.join(tmp, f"k{k}_n{n}.txt")
+            with open(input_file, "w") as file:
+                file.write("\n".join(make_trees(k, n)) + "\n")
+            inputs.append((f"synthetic_k{k}_n{n}", k, n, input_file))
+
+        logging.info(
+            "%-22s %6s %6s %-9s %-24s %10s %12s",
+            "input",
+            "k",
+            "n",
+            "engine",
+            "phase",
+            "time (s)",
+            "memory (KiB)",
+        )
+        results = []
+        for name, k, n, input_file in inputs:
+            for engine in ENGINES:
+                runs = [run_phases(input_file, engine, False) for _ in range(REPEAT)]
+                tracemalloc.start()
+                memory = run_phases(input_file, engine, True)
+                tracemalloc.stop()
+
+                for phase in PHASES:
+                    r = {
+                        "input": name,
+                        "k": k,
+                        "n": n,
+                        "engine": engine,
+                        "phase": phase,
+                        "time": min(run[phase] for run in runs),
+                        "memory": memory[phase],
+                    }
+                    results.append(r)
+                    logging.info(
+                        "%-22s %6i %6i %-9s %-24s %10.4f %12.0f",
+                        name,
+                        k,
+                        n,
+                        engine,
+                        phase,
+                        r["time"],
+                        r["memory"] / 1024,
+                    )
+
+    output = {"machine": results_machine(), "results": results}
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "w") as file:
+        json.dump(output, file, indent=1)
+    logging.info("results saved in %s", RESULTS_FILE)
+
+    if SAVE_BASELINE:
+        with open(BASELINE_FILE, "w") as file:
+            json.dump(output, file, indent=1)
+        logging.info("baseline saved in %s", BASELINE_FILE)
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as file:
+            regressions = compare(results, json.load(file))
+        logging.info("%i regressions from %s", regressions, BASELINE_FILE)
+        sys.exit(1 if regressions else 0)
+    else:
+        logging.warning("no baseline %s to compare with", BASELINE_FILE)
@@ -0,0 +1,106 @@
+"""Benchmark the resampling mode (--resample) against computing the consensus
+of each replicate from its Newick strings with primconstree().
+
+Replicates are drawn as in resample.py, the counts of clades of both are
+checked to be the same.
+"""
+
+import logging
+import random
+import time
+from collections import Counter
+
+import ete3
+
+from primconstree import primconstree
+from primconstree.newick import get_taxa
+from primconstree.resample import consensus_clades, draw_replicates, resample_consensus
+from primconstree.utils import get_taxa_ids
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+NB_TREES = 500  # number of input trees
+NB_TAXA = 50  # number of taxa of each tree
+NB_SWAPS = 5  # number of leaf swaps turning the base tree into each input tree
+REPLICATES = 100
+METHODS = ["jackknife", "bootstrap"]
+JOBS = [1, 2, 4]
+CRITS = ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"]
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def make_trees(k: int, n: int) -> list[str]:
+    """k random trees on n taxa sharing most of their clades, obtained by
+    swapping leaves of a random base tree
+    """
+    base = ete3.Tree()
+    base.populate(n, names_library=[f"T{i}" for i in range(n)], random_branches=True)
+    leaves = base.get_leaves()
+    names = [leaf.name for leaf in leaves]
+
+    trees = []
+    for _ in range(k):
+        swapped = names.copy()
+        for _ in range(NB_SWAPS):
+            i, j = random.sample(range(n), 2)
+            swapped[i], swapped[j] = swapped[j], swapped[i]
+        for leaf, name in zip(leaves, swapped):
+            leaf.name = name
+        trees.append(base.write(dist_formatter="%0.4f"))
+    return trees
+
+
+def naive_counts(trees: list[str], taxa: list[str], method: str) -> Counter:
+    """Counts of clades computing each replicate from its Newick strings"""
+    taxa_ids = get_taxa_ids(taxa)
+    counts: Counter = Counter()
+    fraction = 0.5 if method == "jackknife" else 1.0
+    for indices in draw_replicates(len(trees), REPLICATES, method, fraction, SEED):
+        consensus = primconstree(
+            [trees[i] for i in indices], CRITS, seed=SEED, engine="csr"
+        )
+        counts.update(clade_id for _, clade_id in consensus_clades(consensus, taxa_ids))
+    return counts
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    trees = make_trees(NB_TREES, NB_TAXA)
+    taxa = get_taxa(trees[0])
+    logging.info("%i trees on %i taxa, %i replicates", NB_TREES, NB_TAXA, REPLICATES)
+
+    for method in METHODS:
+        start = time.perf_counter()
+        reference = naive_counts(trees, taxa, method)
+        duration = time.perf_counter() - start
+        logging.info(
+            "%-10s naive       %8.2f s %8.1f ms/replicate",
+            method,
+            duration,
+            1000 * duration / REPLICATES,
+        )
+
+        for jobs in JOBS:
+            start = time.perf_counter()
+            _, counts, _ = resample_consensus(
+                trees, taxa, CRITS, REPLICATES, method, seed=SEED, jobs=jobs
+            )
+            duration = time.perf_counter() - start
+            logging.info(
+                "%-10s %i jobs      %8.2f s %8.1f ms/replicate %s",
+                method,
+                jobs,
+                duration,
+                1000 * duration / REPLICATES,
+                "same" if counts == reference else "DIFFERENT",
+            )
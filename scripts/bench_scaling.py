@@ -0,0 +1,119 @@
+"""Benchmark primconstree up to thousands of taxa, comparing the encoding of
+trees with bitmask clade ids against fingerprint clade ids (see
+utils.get_leaf_ids()), and timing the whole consensus with the default ids.
+Clade ids are checked for collisions with newick.check_clade_ids().
+"""
+
+import logging
+import random
+import time
+import timeit
+
+import ete3
+
+from primconstree.newick import check_clade_ids, get_taxa, parse_newick
+from primconstree.primconstree import build_supergraph, graph_to_consensus
+from primconstree.utils import get_taxa_ids
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+N = [100, 500, 1000, 2000, 5000, 10000]  # values for number of taxa
+NB_TREES = 20  # number of input trees per number of taxa
+NB_SWAPS = 10  # number of leaf swaps turning the base tree into each input tree
+SHAPES = ["random", "ladder"]  # shapes of the base tree, see make_trees()
+CRITS = ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"]
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def make_trees(n: int, shape: str) -> list[str]:
+    """Random trees on n taxa sharing most of their clades, obtained by
+    swapping leaves of a base tree, either a random tree ("random") or a
+    caterpillar ("ladder"), the worst case for bitmask ids
+    """
+    taxa = [f"T{i}" for i in range(n)]
+    base = ete3.Tree()
+    base.populate(n, names_library=taxa, random_branches=True)
+    leaves = base.get_leaves()
+
+    trees = []
+    for _ in range(NB_TREES):
+        names = [leaf.name for leaf in leaves]
+        for _ in range(NB_SWAPS):
+            i, j = random.sample(range(n), 2)
+            names[i], names[j] = names[j], names[i]
+        if shape == "ladder":
+            trees.append(
+                "(" + ",(".join(names[:-1]) + "," + names[-1] + ")" * (n - 1) + ";"
+            )
+        else:
+            for leaf, name in zip(leaves, names):
+                leaf.name = name
+            trees.append(base.write(dist_formatter="%r"))
+    return trees
+
+
+def ingest_time(newicks: list[str], taxa_ids: dict[str, int]) -> float:
+    """Best time in seconds to encode all trees and intern their clade ids,
+    as done when building the supergraph
+    """
+
+    def ingest() -> None:
+        index: dict[int, int] = {}
+        for nwk in newicks:
+            for nid, _, _, _ in parse_newick(nwk, taxa_ids):
+                index.setdefault(nid, len(index))
+
+    return min(timeit.repeat(ingest, number=1, repeat=3))
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    logging.info(
+        "%6s %6s %8s %16s %16s %10s %10s",
+        "shape",
+        "n",
+        "clades",
+        "ns/node",
+        "bitmask ns/node",
+        "build s",
+        "mst s",
+    )
+    for shape in SHAPES:
+        for n in N:
+            newicks = make_trees(n, shape)
+            taxa = get_taxa(newicks[0])
+            taxa_ids = get_taxa_ids(taxa)
+            nb_nodes = sum(len(parse_newick(nwk, taxa_ids)) for nwk in newicks)
+
+            clades = check_clade_ids(newicks, taxa)
+            fingerprint = ingest_time(newicks, taxa_ids)
+            bitmask = ingest_time(newicks, get_taxa_ids(taxa, bitmask=True))
+
+            start = time.perf_counter()
+            graph = build_supergraph(newicks, taxa, "csr")
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            graph_to_consensus(graph, taxa, CRITS)
+            mst_time = time.perf_counter() - start
+
+            logging.info(
+                "%6s %6i %8i %16.1f %16.1f %10.3f %10.3f",
+                shape,
+                n,
+                clades,
+                fingerprint * 1e9 / nb_nodes,
+                bitmask * 1e9 / nb_nodes,
+                build_time,
+                mst_time,
+            )
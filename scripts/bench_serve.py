@@ -0,0 +1,169 @@
+"""Benchmark the consensus service (python -m primconstree serve) against one
+python -m primconstree -f invocation per set of trees.
+
+Requests are sent by a growing number of concurrent clients, each reusing its
+connection. Rejected requests (503, when more requests are in flight than
+the service accepts) are counted and sent again after a random delay doubling
+from RETRY_DELAY up to the Retry-After of the service (exponential backoff), the
+latency of a request runs from its first attempt. The consensus of each request is
+checked to be the one of the command line.
+"""
+
+import glob
+import http.client
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+INPUTS = "datasets/simulated/Trex_trees*.txt"  # sets of trees sent in turn
+NB_CALLS = 20  # number of command line invocations timed
+NB_REQUESTS = 400  # number of requests sent for each number of clients
+CLIENTS = [1, 4, 16, 64]  # numbers of concurrent clients
+JOBS = os.cpu_count() or 1  # number of workers of the service
+QUEUE = None  # see --queue, None for the default
+RETRY_DELAY = 0.01  # in seconds, first delay before sending a rejected request again
+PORT = 18765
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def post(connection: http.client.HTTPConnection, body: dict) -> tuple[int, dict, float]:
+    """Send a request to /consensus
+
+    Return:
+        tuple: the status, the decoded response and its Retry-After in seconds
+    """
+    connection.request(
+        "POST", "/consensus", json.dumps(body), {"Content-Type": "application/json"}
+    )
+    response = connection.getresponse()
+    retry_after = float(response.getheader("Retry-After", 0))
+    return response.status, json.loads(response.read()), retry_after
+
+
+def get_metrics() -> dict:
+    connection = http.client.HTTPConnection("127.0.0.1", PORT)
+    connection.request("GET", "/metrics")
+    return json.loads(connection.getresponse().read())
+
+
+def run_clients(
+    sets: list[str], references: list[str], nb_clients: int
+) -> tuple[float, list[float], int, int]:
+    """Send NB_REQUESTS requests from nb_clients concurrent clients
+
+    Return:
+        tuple: the duration in seconds, the latency of each request, the
+            number of rejected attempts and of wrong consensus
+    """
+    local = threading.local()
+    latencies, rejected, wrong = [], [0], [0]
+    lock = threading.Lock()
+
+    def send(i: int) -> None:
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection("127.0.0.1", PORT)
+        start = time.perf_counter()
+        body = {"trees": sets[i % len(sets)]}
+        status, response, retry_after = post(local.connection, body)
+        delay = RETRY_DELAY
+        while status == 503:
+            with lock:
+                rejected[0] += 1
+            time.sleep(random.uniform(0, delay))
+            delay = min(2 * delay, retry_after)
+            status, response, retry_after = post(local.connection, body)
+        latency = time.perf_counter() - start
+        with lock:
+            latencies.append(latency)
+            if response.get("consensus") != references[i % len(sets)]:
+                wrong[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(nb_clients) as executor:
+        list(executor.map(send, range(NB_REQUESTS)))
+    return time.perf_counter() - start, latencies, rejected[0], wrong[0]
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, -(-p * len(values) // 100) - 1)] if values else 0.0
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    input_files = sorted(glob.glob(INPUTS))
+    sets = []
+    for input_file in input_files:
+        with open(input_file, "r") as file:
+            sets.append(file.read())
+
+    start = time.perf_counter()
+    references = {}
+    for i in range(NB_CALLS):
+        input_file = input_files[i % len(input_files)]
+        references[input_file] = subprocess.run(
+            [sys.executable, "-m", "primconstree", "-f", input_file],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    duration = time.perf_counter() - start
+    logging.info(
+        "command line: %.1f sets/s, %.1f ms per set",
+        NB_CALLS / duration,
+        1000 * duration / NB_CALLS,
+    )
+    references = [references[f] for f in input_files]
+
+    command = [sys.executable, "-m", "primconstree", "serve", "-p", str(PORT)]
+    command += ["-j", str(JOBS)] + ([] if QUEUE is None else ["--queue", str(QUEUE)])
+    start = time.perf_counter()
+    service = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    logging.info(service.stderr.readline().strip())
+    logging.info("service start-up: %.2f s", time.perf_counter() - start)
+
+    try:
+        logging.info(
+            "%8s %10s %10s %10s %10s %10s %6s",
+            "clients",
+            "sets/s",
+            "p50 (ms)",
+            "p90 (ms)",
+            "p99 (ms)",
+            "rejected",
+            "wrong",
+        )
+        for nb_clients in CLIENTS:
+            duration, latencies, rejected, wrong = run_clients(
+                sets, references, nb_clients
+            )
+            logging.info(
+                "%8i %10.1f %10.1f %10.1f %10.1f %10i %6i",
+                nb_clients,
+                NB_REQUESTS / duration,
+                1000 * percentile(latencies, 50),
+                1000 * percentile(latencies, 90),
+                1000 * percentile(latencies, 99),
+                rejected,
+                wrong,
+            )
+        logging.info("service metrics: %s", json.dumps(get_metrics()))
+    finally:
+        service.terminate()
+        service.wait()
@@ -0,0 +1,90 @@
+"""Benchmark the start-up of the command line: the wall time of
+`python -m primconstree --help` and of a small consensus, with the heaviest
+imports of each (python -X importtime), and check that the heavy dependencies
+are only imported by the code paths that use them.
+"""
+
+import logging
+import subprocess
+import sys
+import time
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+INPUT = "datasets/kmedoids/cluster1.txt"  # the small set of trees
+REPEAT = 5  # number of runs of each command, the best time is reported
+NB_IMPORTS = 5  # number of heaviest imports reported for each command
+TARGETS = {"help": 0.2, "consensus": 0.5}  # expected wall time in seconds
+# modules that must not be imported by each command
+NOT_IMPORTED = {
+    "help": ["ete3", "networkx", "matplotlib"],
+    "consensus": ["networkx", "matplotlib"],
+}
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+COMMANDS = {
+    "help": ["--help"],
+    "consensus": ["-f", INPUT, "-e", "csr"],
+}
+
+
+def wall_time(args: list[str]) -> float:
+    """Best wall time in seconds of the command line with the arguments"""
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "primconstree", *args],
+            capture_output=True,
+            check=True,
+        )
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def import_times(args: list[str]) -> dict[str, int]:
+    """Cumulative import time in microseconds of each top-level module
+    imported by the command line with the arguments
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "primconstree", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    failed = False
+    for name, args in COMMANDS.items():
+        duration = wall_time(args)
+        imports = import_times(args)
+        logging.info("%-10s %8.3f s (target %.3f s)", name, duration, TARGETS[name])
+        for module, us in sorted(imports.items(), key=lambda i: -i[1])[:NB_IMPORTS]:
+            logging.info("%-10s %8.3f s   import %s", "", us / 1e6, module)
+
+        if duration > TARGETS[name]:
+            logging.warning("%s is slower than its target", name)
+            failed = True
+        for module in NOT_IMPORTED[name]:
+            if module in imports:
+                logging.error("%s imports %s", name, module)
+                failed = True
+
+    sys.exit(1 if failed else 0)
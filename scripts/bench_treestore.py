@@ -0,0 +1,128 @@
+"""Benchmark the store of encoded trees (primconstree/treestore.py) against
+parsing the Newick file on every run.
+
+For each input file are timed: parsing and encoding its Newick strings, opening
+its store cold (hashing, parsing and writing the store) and warm (hashing and
+memory mapping it) then reading the records of every tree, reading single trees
+at random, building the csr supergraph, and getting ete3 trees for the distance
+code from the file or from the store. Records and ete3 trees read from the store
+are checked to be the ones parsed from the file.
+"""
+
+import glob
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import ete3
+
+from primconstree.newick import get_taxa, parse_newick
+from primconstree.supergraph import SuperGraph
+from primconstree.treestore import open_store
+from primconstree.utils import get_taxa_ids, read_newicks, read_trees
+
+###########################
+### BEGIN OF PARAMETERS ###
+###########################
+
+SEED = 0
+INPUTS = "datasets/simulated/Trex_trees*.txt"  # files of real inputs
+N = [50, 500]  # number of taxa of the synthetic inputs
+NB_TREES = 2000  # number of trees of the synthetic inputs
+NB_RANDOM = 1000  # number of trees read at random from each store
+
+#########################
+### END OF PARAMETERS ###
+#########################
+
+
+def timed(f) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = f()
+    return time.perf_counter() - start, result
+
+
+def bench(name: str, input_file: str, cache_dir: str) -> None:
+    """Log the timings of a file, in ms, with an empty store directory"""
+    newicks = read_newicks(input_file)
+    taxa_ids = get_taxa_ids(get_taxa(newicks[0]))
+
+    parse, records = timed(
+        lambda: [parse_newick(nwk, taxa_ids) for nwk in read_newicks(input_file)]
+    )
+    cold, _ = timed(lambda: open_store(input_file, cache_dir))
+    warm, store = timed(lambda: open_store(input_file, cache_dir))
+    read, stored = timed(lambda: list(store))
+    if stored != records:
+        raise Exception(f"Records of the store of {input_file} differ")
+
+    indices = [random.randrange(len(store)) for _ in range(NB_RANDOM)]
+    random_access, _ = timed(lambda: [store[i] for i in indices])
+
+    build_text, _ = timed(lambda: SuperGraph.from_trees(newicks, store.taxa))
+    build_store, _ = timed(lambda: SuperGraph.from_trees(store, store.taxa))
+
+    ete3_text, trees = timed(lambda: read_trees(input_file))
+    ete3_store, stored_trees = timed(store.trees)
+    if [t.write() for t in trees] != [t.write() for t in stored_trees]:
+        raise Exception(f"ete3 trees of the store of {input_file} differ")
+
+    logging.info(
+        "%-28s %6i %8.1f %8.1f %8.1f %8.1f %8.2f %8.1f %8.1f %8.1f %8.1f",
+        name,
+        len(store),
+        1000 * parse,
+        1000 * cold,
+        1000 * warm,
+        1000 * read,
+        1e6 * random_access / NB_RANDOM,
+        1000 * build_text,
+        1000 * build_store,
+        1000 * ete3_text,
+        1000 * ete3_store,
+    )
+
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+if __name__ == "__main__":
+    random.seed(SEED)
+    cache_dir = tempfile.mkdtemp()
+    try:
+        logging.info(
+            "%-28s %6s %8s %8s %8s %8s %8s %8s %8s %8s %8s",
+            "input (times in ms)",
+            "trees",
+            "parse",
+            "cold",
+            "warm",
+            "records",
+            "1 (us)",
+            "sg text",
+            "sg store",
+            "ete3 txt",
+            "ete3 st",
+        )
+        for input_file in sorted(glob.glob(INPUTS)):
+            bench(os.path.basename(input_file), input_file, cache_dir)
+
+        for n in N:
+            tree = ete3.Tree()
+            tree.populate(n, random_branches=True)
+            leaves = tree.get_leaves()
+            names = [leaf.name for leaf in leaves]
+            input_file = os.path.join(cache_dir, f"synthetic_n{n}.txt")
+            with open(input_file, "w") as file:
+                for _ in range(NB_TREES):
+                    random.shuffle(names)
+                    for leaf, name in zip(leaves, names):
+                        leaf.name = name
+                    file.write(tree.write() + "\n")
+            bench(f"synthetic n={n}", input_file, cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
@@ -1,15 +1,25 @@
 """Run several instance of primconstree and extended majority rule
 on different datasets, compute metrics, and save results in a file.
+
+Each (combination of parameters, algorithm) cell of the grid is evaluated on a
+pool of JOBS processes, and appended as soon as it is done to a JSON lines
+checkpoint file. Running the script again skips the cells already in the
+checkpoint, so an interrupted evaluation resumes where it stopped. Once every
+cell is done, the results are saved in the same order as a serial run.
 """
 
 import json
 import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from itertools import product
 
 import ete3
 
+from primconstree.treestore import open_store
 from utils.consensus import consensus
-from utils.distances import distance
+from utils.distances import TreeClades, distance
+from utils.kcdist import KCVectors
 from utils.misc import create_unique_file, get_alg_id
 from utils.trees import read_trees
 
@@ -33,11 +43,22 @@ NB_BATCH = 5  # number of batch per combination of parameters
 
 BENCHMARK = 0  # number of iteration on benchmark execution time (0 for no benchmark)
 
+# directory of the encoded input trees (see primconstree/treestore.py), each file
+# is parsed once across runs, None to parse the Newick files every time
+TREE_CACHE = "outputs/eval/trees"
+
 ###############
 ### OUTPUTS ###
 ###############
 
 RESULTS_FILE = "outputs/eval/NEW_ALL.json"  # file to output the results
+# file of the cells already evaluated, one JSON object on each line, read to skip
+# them when the script is run again (delete it to start over)
+CHECKPOINT_FILE = "outputs/eval/NEW_ALL.checkpoint.jsonl"
+
+# number of processes evaluating cells, with BENCHMARK > 0 durations are measured
+# while other cells run, use 1 for comparable durations
+JOBS = os.cpu_count() or 1
 
 # algorithms to perform (maj, pct, old_pct, freq)
 ALGS = [
@@ -79,6 +100,7 @@ def eval_consensus(
     input_trees: list[ete3.Tree],
     benchmark: int,
     coal: float,
+    tree_cache: str | None = None,
 ) -> dict:
     """Compute consensus trees and metrics for several sets of input trees
 
@@ -89,48 +111,151 @@ def eval_consensus(
         input_trees (list): list of input trees as ete3 objects
         benchmark (int): number of iterations for benchmark (0 for no benchmark)
         coal (float): the coalescence rate to get average branch length
+        tree_cache (str | None): directory of the encoded input trees, see consensus()
 
     Returns:
         dict: input and consensus as newick strings, metrics
     """
     logging.info("Processing algorithm %s", get_alg_id(alg))
 
-    cons, tm = consensus(input_file, alg[0], coal, **alg[1])
+    cons, tm = consensus(input_file, alg[0], coal, tree_cache, **alg[1])
     if benchmark > 0 and tm is not None:
         duration = tm.timeit(benchmark)
     else:
         duration = 0
 
+    # encoded once for the rf, bsd, tdist and qdist of every tree, and for kc
+    # with any lambda
+    clades = TreeClades(input_trees)
+    kc = KCVectors(input_trees) if any(m[0] == "kcdist" for m in dists) else None
     results: dict = {
-        get_alg_id(m): distance(input_trees, cons, m[0], **m[1]) for m in dists
+        get_alg_id(m): distance(input_trees, cons, m[0], clades, kc, **m[1])
+        for m in dists
     }
     results.update({"cons": cons.write(), "duration": duration})
 
     return results
 
 
+def read_inputs(file_txt: str) -> list[ete3.Tree]:
+    """Read the input trees of a combination, from their store if any"""
+    if TREE_CACHE is not None:
+        # built from the encoded trees, without parsing the file again
+        return open_store(file_txt, TREE_CACHE).trees()
+    return read_trees(file_txt)
+
+
+def eval_cell(file_txt: str, file_nex: str, alg: tuple[str, dict], coal: float) -> dict:
+    """Evaluate an algorithm on the inputs of a combination, in a worker
+
+    Args:
+        file_txt (str): the input trees, one newick string on each line
+        file_nex (str): the same trees, as the nexus file of FACT algorithms
+        alg (tuple[str, dict]): the name of the consensus algorithm and additional parameters
+        coal (float): the coalescence rate to get average branch length
+
+    Returns:
+        dict: see eval_consensus()
+    """
+    input_file = file_nex if alg[0] in ["fdct", "maj_plus"] else file_txt
+    return eval_consensus(
+        alg, DISTS, input_file, read_inputs(file_txt), BENCHMARK, coal, TREE_CACHE
+    )
+
+
+def read_checkpoint(checkpoint_file: str) -> dict[tuple[str, str], dict]:
+    """Read the cells already evaluated, by input file and algorithm id.
+    Cells missing a metric of DISTS or evaluated with another BENCHMARK are
+    evaluated again, as well as a last line cut by an interruption, which is
+    ended so that the next cells are appended on their own lines.
+    """
+    metrics = [get_alg_id(m) for m in DISTS]
+    done = {}
+    if not os.path.exists(checkpoint_file):
+        return done
+    line = ""
+    with open(checkpoint_file, "r") as file:
+        for line in file:
+            try:
+                cell = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if cell["benchmark"] == BENCHMARK and all(
+                m in cell["results"] for m in metrics
+            ):
+                done[(cell["file"], cell["alg"])] = cell["results"]
+    if line and not line.endswith("\n"):
+        with open(checkpoint_file, "a") as file:
+            file.write("\n")
+    return done
+
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
 if __name__ == "__main__":
-    # Execute evaluation on each parameters combinations
+    grid = [
+        (k, n, c, b, f"{INPUT}/{TXT_DIR}/k{k}_n{n}_c{c}_b{b}.txt")
+        for k, n, c, b in product(K, N, C, range(NB_BATCH))
+    ]
+    cells = [(file_txt, get_alg_id(a)) for *_, file_txt in grid for a in ALGS]
+
+    checkpoint_dir = os.path.dirname(CHECKPOINT_FILE)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    done = read_checkpoint(CHECKPOINT_FILE)
+    nb_done = sum(cell in done for cell in cells)
+    logging.info(
+        "%i cells, %i already evaluated in %s, with %i benchmark iterations",
+        len(cells),
+        nb_done,
+        CHECKPOINT_FILE,
+        BENCHMARK,
+    )
+
+    # Evaluate the remaining cells, each appended to the checkpoint when done
+    failed = 0
+    with ProcessPoolExecutor(max_workers=JOBS) as executor, open(
+        CHECKPOINT_FILE, "a"
+    ) as checkpoint:
+        futures = {}
+        for k, n, c, b, file_txt in grid:
+            file_nex = f"{INPUT}/{NEX_DIR}/k{k}_n{n}_c{c}_b{b}.nexus"
+            for a in ALGS:
+                if (file_txt, get_alg_id(a)) not in done:
+                    future = executor.submit(eval_cell, file_txt, file_nex, a, c)
+                    futures[future] = (file_txt, get_alg_id(a))
+
+        for future in as_completed(futures):
+            file_txt, alg_id = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                failed += 1
+                logging.error("Cell %s %s failed: %r", file_txt, alg_id, e)
+                continue
+            line = {
+                "file": file_txt,
+                "alg": alg_id,
+                "benchmark": BENCHMARK,
+                "results": results,
+            }
+            checkpoint.write(json.dumps(line) + "\n")
+            checkpoint.flush()
+            done[(file_txt, alg_id)] = results
+            nb_done += 1
+            logging.info(
+                "Evaluated %s %s (%i/%i cells)", file_txt, alg_id, nb_done, len(cells)
+            )
+
+    if failed:
+        logging.error("%i cells failed, run the script again to retry them", failed)
+        raise SystemExit(1)
+
+    # Gather the cells of each combination, in the order of a serial run
     combinations = []
-    for k, n, c, b in product(K, N, C, range(NB_BATCH)):
-        logging.info(
-            "Processing combination k=%i n=%i c=%i b=%i batches, with %i benchmark iterations",
-            k,
-            n,
-            c,
-            b,
-            BENCHMARK,
-        )
-
-        file_txt = f"{INPUT}/{TXT_DIR}/k{k}_n{n}_c{c}_b{b}.txt"
-        file_nex = f"{INPUT}/{NEX_DIR}/k{k}_n{n}_c{c}_b{b}.nexus"
-        input_trees = read_trees(file_txt)
-
-        # Save parameters
+    for k, n, c, b, file_txt in grid:
         comb = {
             "file": file_txt,
             "k": k,
@@ -138,16 +263,10 @@ if __name__ == "__main__":
             "c": c,
             "batch": b,
             "benchmark": BENCHMARK,
-            "inputs": [t.write() for t in input_trees],
+            "inputs": [t.write() for t in read_inputs(file_txt)],
         }
-
-        # Evaluate consensus trees
         for a in ALGS:
-            input_file = file_nex if a[0] in ["fdct", "maj_plus"] else file_txt
-            comb[get_alg_id(a)] = eval_consensus(
-                a, DISTS, input_file, input_trees, BENCHMARK, c
-            )
-
+            comb[get_alg_id(a)] = done[(file_txt, get_alg_id(a))]
         combinations.append(comb)
 
     result_file = create_unique_file(RESULTS_FILE)
@@ -6,6 +6,9 @@ from Bio import Phylo
 from Bio.Phylo.Consensus import majority_consensus
 
 from primconstree import primconstree
+from primconstree.cache import cached_consensus, open_cache
+from primconstree.treestore import open_store
+from primconstree.utils import read_newicks
 
 from .trees import map_from_fact, phylo_to_ete3, read_trees, set_cst_length
 
@@ -13,6 +16,10 @@ from .trees import map_from_fact, phylo_to_ete3, read_trees, set_cst_length
 PATH_TO_FACT1 = "scripts/tools/fact"  # FACT compiled binary
 PATH_TO_FACT2 = "scripts/tools/fact2"  # FACT2 compiled binary
 
+# result cache of pct (see primconstree/cache.py), to skip sets of trees already
+# computed with the same parameters, None to always compute
+PCT_CACHE = None
+
 
 def fdct(input_file, cst):
     cmd = [PATH_TO_FACT2, "freq", input_file]
@@ -28,21 +35,20 @@ def maj_plus(input_file, cst):
     return set_cst_length(cons, cst)
 
 
-def pct(input_trees, **args):
-    if args.get("old_prim") == True:
-        args.pop("old_prim", None)
-        return primconstree(input_trees, ["min_avg_len", "max_edge_freq"], **args)
+def pct_crits(args):
+    if args.pop("old_prim", None) == True:
+        return ["min_avg_len", "max_edge_freq"]
     else:
-        args.pop("old_prim", None)
-        return primconstree(
-            input_trees,
-            ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"],
-            **args,
-        )
+        return ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"]
+
+
+def pct(input_trees, **args):
+    crits = pct_crits(args)
+    return primconstree(input_trees, crits, **args)
 
 
 def consensus(
-    filename: str, alg: str, coal: float, **args
+    filename: str, alg: str, coal: float, tree_cache: str | None = None, **args
 ) -> tuple[ete3.Tree, timeit.Timer]:
     """Compute the consensus tree from a list of input trees using the specified algorithm
 
@@ -50,13 +56,27 @@ def consensus(
         filename (str): appropriate input file for the consensus method
         alg (str): algorithm to use (pct, old_pct, maj)
         coal (float): coalescence rate, used to attache average edge length
+        tree_cache (str | None): for pct, directory of the encoded input trees
+            (see primconstree/treestore.py), None to parse the input file
         args: additional parameters relevant to the algorithm
 
     Returns:
         tuple: consensus, timit timer for benchmark
     """
+    if alg == "pct" and PCT_CACHE is not None:
+        # no timer, the duration of a cached consensus is not measured
+        crits = pct_crits(args)
+        newick = cached_consensus(
+            read_newicks(filename), crits, open_cache(PCT_CACHE), **args
+        )
+        return ete3.Tree(newick), None
+
     if alg == "pct":
-        input_trees = read_trees(filename)
+        if tree_cache is not None:
+            # already encoded, the timer does not measure their encoding
+            input_trees = open_store(filename, tree_cache)
+        else:
+            input_trees = read_trees(filename)
         cons = pct(input_trees, **args)
         tm = timeit.Timer(lambda: pct(input_trees, **args))
         return cons, tm
@@ -1,86 +1,495 @@
 """Implementation of metrics to compare trees"""
 
 import math
-import subprocess
-from io import StringIO
-from itertools import combinations
+from itertools import chain, combinations
 from math import sqrt
 
 import ete3
-from Bio.Phylo._io import read
+import numpy as np
+
+from primconstree.treestore import TreeStore
+from primconstree.utils import (
+    MAX_BITMASK_TAXA,
+    Record,
+    get_taxa_ids,
+    tree_to_records,
+)
+
+from .kcdist import KCVectors
+
+# number of intersections of clades of the input trees with the ones of a
+# consensus computed at once by tq_distances()
+CHUNK_SIZE = 1 << 20
+
+
+class TreeClades:
+    """The clades of a set of trees as arrays, encoded once to compare the
+    trees with a consensus in a single vectorised pass (see rf_distances()
+    and bsd_distances()), the consensus being encoded once too
+
+    Clades are exact bitmasks over the sorted leaf names of the trees, as
+    uint64 up to 64 taxa and as python integers above (see clade_to_id()).
+
+    Attributes:
+        taxa: the sorted leaf names of all the trees
+        tree: the index of the tree of each node, nodes being in preorder
+        masks: the clade of each node
+        dists: the length of the branch above each node
+        is_root: whether each node is the root of its tree
+        leaves: the clade of the root of each tree, its leaves
+    """
+
+    def __init__(
+        self, trees: list[ete3.Tree] | TreeStore, taxa: list[str] | None = None
+    ) -> None:
+        """
+        Args:
+            trees: the trees, as ete3 objects or a TreeStore, whose
+                records are then used as they are up to 64 taxa
+            taxa: the ordered taxa to encode the trees on (e.g. the taxa of
+                other trees), by default the sorted leaf names of the trees
+        """
+        if (
+            isinstance(trees, TreeStore)
+            and taxa is None
+            and len(trees.taxa) <= MAX_BITMASK_TAXA
+        ):
+            self.taxa = trees.taxa
+            records = list(trees)
+        else:
+            if isinstance(trees, TreeStore):
+                trees = trees.trees()
+            names = set().union(*(t.get_leaf_names() for t in trees))
+            if taxa is not None and not names <= set(taxa):
+                missing = sorted(names - set(taxa))
+                raise Exception(f"Leaves {missing} are not in the input trees")
+            self.taxa = sorted(names) if taxa is None else taxa
+            taxa_ids = get_taxa_ids(self.taxa, bitmask=True)
+            records = [tree_to_records(t, taxa_ids) for t in trees]
+        self.taxa_ids = get_taxa_ids(self.taxa, bitmask=True)
+        self.dtype = np.uint64 if len(self.taxa) <= MAX_BITMASK_TAXA else object
+
+        self.tree = np.repeat(np.arange(len(records)), [len(r) for r in records])
+        self.masks = np.array(
+            [nid for r in records for nid, _, _, _ in r], dtype=self.dtype
+        )
+        self.dists = np.array([d for r in records for _, _, d, _ in r], dtype=float)
+        self.is_root = np.array([p == -1 for r in records for _, p, _, _ in r])
+        self.leaves = self.masks[self.is_root]
+        start = np.cumsum([0] + [len(r) for r in records[:-1]])
+        self.parents = np.array(
+            [
+                p + s if p != -1 else -1
+                for r, s in zip(records, start)
+                for p in _parents(r)
+            ],
+            dtype=np.int64,
+        )
+
+    def __len__(self) -> int:
+        return len(self.leaves)
+
+    def encode(self, tree: ete3.Tree) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Encode another tree (e.g. a consensus) on the taxa of the trees
+
+        Return:
+            tuple: the clade, the branch length and whether it is the root,
+                of each node in preorder
+        """
+        missing = set(tree.get_leaf_names()) - set(self.taxa_ids)
+        if missing:
+            raise Exception(f"Leaves {sorted(missing)} are not in the input trees")
+        records = tree_to_records(tree, self.taxa_ids)
+        return (
+            np.array([nid for nid, _, _, _ in records], dtype=self.dtype),
+            np.array([d for _, _, d, _ in records], dtype=float),
+            np.array([p == -1 for _, p, _, _ in records]),
+        )
+
+
+def _parents(records: list[Record]) -> list[int]:
+    """The index of the parent of each node of a tree, -1 for the root.
+    Nodes with a single child share the id of their child, so the parent of
+    a node is the last node seen in preorder with its parent id, before the
+    node itself
+    """
+    index: dict[int, int] = {}
+    parents = []
+    for i, (nid, pid, _, _) in enumerate(records):
+        parents.append(index[pid] if pid != -1 else -1)
+        index[nid] = i
+    return parents
+
+
+def _codes(*arrays: np.ndarray) -> tuple[list[np.ndarray], np.ndarray]:
+    """Dense codes of the values of several arrays, equal values sharing the
+    same code, so that clades of any number of taxa are then handled as int64
+
+    Return:
+        tuple: the codes of each array, and the value of each code
+    """
+    values, inverse = np.unique(np.concatenate(arrays), return_inverse=True)
+    return np.split(inverse, np.cumsum([len(a) for a in arrays])[:-1]), values
+
 
-from .kcdist import KC_dist
+def _popcount(masks: np.ndarray) -> np.ndarray:
+    """The number of leaves of each clade"""
+    if masks.dtype == object:
+        return np.array([int(m).bit_count() for m in masks], dtype=np.int64)
+    return np.bitwise_count(masks).astype(np.int64)
 
 
-def average_rf(input_trees: list[ete3.Tree], consensus: ete3.Tree) -> float:
+def _last_of_each(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The distinct keys, sorted, with the index of the last occurrence of each"""
+    unique, first = np.unique(keys[::-1], return_index=True)
+    return unique, len(keys) - 1 - first
+
+
+def rf_distances(clades: TreeClades, consensus: ete3.Tree) -> np.ndarray:
+    """Compute the normalized unrooted Robinson and Foulds distance between
+    each tree and the consensus, as ete3 robinson_foulds(unrooted_trees=True):
+    bipartitions of every node (trivial ones included) restricted to the
+    leaves the trees share, divided by the number of bipartitions of both
+    trees with at least 2 leaves on each side
+
+    Args:
+        clades (TreeClades): the encoded input trees
+        consensus (ete3.Tree): the consensus computed with any algorithm
+
+    Return:
+        np.ndarray: the normalized rf distance of each tree
+    """
+    cons_masks, _, _ = clades.encode(consensus)
+    common = clades.leaves & cons_masks[0]
+    k = len(clades)
+    rf = np.zeros(k)
+    max_rf = np.zeros(k)
+
+    # trees usually all have the leaves of the consensus, whose bipartitions
+    # are then restricted once
+    for shared_leaves in np.unique(common):
+        selected = common == shared_leaves
+        rows = selected[clades.tree]
+        tree = clades.tree[rows]
+
+        # a bipartition is identified by its side with the smallest bitmask
+        masks = clades.masks[rows] & shared_leaves
+        sides = np.minimum(masks, masks ^ shared_leaves)
+        cons_sides = cons_masks & shared_leaves
+        cons_sides = np.minimum(cons_sides, cons_sides ^ shared_leaves)
+        (codes, cons_codes), values = _codes(sides, cons_sides)
+        n = len(values)
+
+        sizes = _popcount(values)
+        non_trivial = (sizes > 1) & (int(shared_leaves).bit_count() - sizes > 1)
+        in_consensus = np.zeros(n, dtype=bool)
+        cons_codes = np.unique(cons_codes)
+        in_consensus[cons_codes] = True
+
+        # distinct bipartitions of each tree
+        pairs = np.unique(tree * n + codes)
+        tree, codes = pairs // n, pairs % n
+        nb = np.bincount(tree, minlength=k)
+        shared = np.bincount(tree, weights=in_consensus[codes], minlength=k)
+        nb_non_trivial = np.bincount(tree, weights=non_trivial[codes], minlength=k)
+
+        rf[selected] = (nb + len(cons_codes) - 2 * shared)[selected]
+        max_rf[selected] = (nb_non_trivial + non_trivial[cons_codes].sum())[selected]
+
+    if np.any(max_rf == 0):
+        raise ZeroDivisionError("No bipartition with 2 leaves on each side")
+    return rf / max_rf
+
+
+def average_rf(
+    input_trees: list[ete3.Tree] | TreeClades, consensus: ete3.Tree
+) -> float:
     """Compute the average normalized Robinson and Foulds distance between the input trees and the consensus
 
     Args:
-        input_trees (list[ete3.Tree]): the list of input trees
+        input_trees (list[ete3.Tree] | TreeClades): the list of input trees, or the encoded input trees
         consensus (ete3.Tree): the consensus computed with any algorithm
 
     Return:
         float: the average normalized rf distance
     """
-    rf_sum = 0
-    for tree in input_trees:
-        rf, max_rf = tree.robinson_foulds(consensus, unrooted_trees=True)[:2]
-        rf_sum += rf / max_rf
-    return rf_sum / len(input_trees)
+    if not isinstance(input_trees, TreeClades):
+        input_trees = TreeClades(input_trees)
+    return float(np.mean(rf_distances(input_trees, consensus)))
 
 
 def average_kc(
-    input_trees: list[ete3.Tree], consensus: ete3.Tree, lamb: float
+    input_trees: list[ete3.Tree] | KCVectors, consensus: ete3.Tree, lamb: float
 ) -> float:
-    dist = 0
-    cons = consensus.write()
-    for t in input_trees:
-        dist += KC_dist(cons, t.write(), lamb)
-    return dist / len(input_trees)
+    """Compute the average Kendall-Colijn distance between the input trees and the consensus
+
+    Args:
+        input_trees (list[ete3.Tree] | KCVectors): the list of input trees, or their vectors
+        consensus (ete3.Tree): the consensus computed with any algorithm
+        lamb (float): the weight of branch lengths, between 0 and 1
+
+    Return:
+        float: the average kc distance
+    """
+    if not isinstance(input_trees, KCVectors):
+        input_trees = KCVectors(input_trees)
+    return float(np.mean(input_trees.distances(consensus, [lamb])[0]))
+
 
+def _incidence(clades: TreeClades, rows: slice) -> np.ndarray:
+    """The leaves of the clades of some nodes, as a 0/1 matrix with a row per
+    node and a column per taxon, in float64 to count intersections of clades
+    with matrix products
+    """
+    masks = clades.masks[rows]
+    n = len(clades.taxa)
+    if masks.dtype == object:
+        bits = [[(int(m) >> i) & 1 for i in range(n)] for m in masks]
+        return np.array(bits, dtype=float).reshape(len(masks), n)
+    return ((masks[:, None] >> np.arange(n, dtype=np.uint64)) & np.uint64(1)).astype(
+        float
+    )
+
+
+def _pairs(x: np.ndarray) -> np.ndarray:
+    """The number of pairs of each number of elements"""
+    return x * (x - 1) / 2
+
+
+def _chunks(clades: TreeClades, size: int) -> list[slice]:
+    """Consecutive nodes of whole trees, about size nodes per chunk, to bound
+    the memory of the matrices of intersections with the consensus
+    """
+    offsets = np.searchsorted(clades.tree, np.arange(len(clades) + 1))
+    chunks = []
+    start = 0
+    while start < len(clades):
+        end = max(
+            start + 1, np.searchsorted(offsets, offsets[start] + size, "right") - 1
+        )
+        chunks.append(slice(offsets[start], offsets[end]))
+        start = end
+    return chunks
+
+
+def _side_children(parents: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The sides of the edges of trees and the sides they are made of
+
+    The edge above node x has two sides: the leaves below x (side x) and the
+    other leaves (side N + x, N being the number of nodes). Side x is made of
+    the sides of the children of x, side N + x of the sides of the siblings
+    of x and of side N + parent(x) if the parent is not a root.
+
+    Return:
+        tuple: the side and the side it is made of, of each pair
+    """
+    N = len(parents)
+    child = np.flatnonzero(parents != -1)
+    parent = parents[child]
+
+    # every ordered pair of children of the same node
+    order = np.argsort(parent, kind="stable")
+    child, parent = child[order], parent[order]
+    _, start, count = np.unique(parent, return_index=True, return_counts=True)
+    counts = np.repeat(count, count)
+    left = np.repeat(child, counts)
+    position = np.arange(len(left)) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = child[np.repeat(np.repeat(start, count), counts) + position]
+    siblings = left != right
+
+    upper = child[parents[parent] != -1]
+    return (
+        np.concatenate([parent, N + left[siblings], N + upper]),
+        np.concatenate([child, right[siblings], N + parents[upper]]),
+    )
 
-def average_tqd(input_trees: list[ete3.Tree], consensus: ete3.Tree, exec: str) -> float:
+
+def _minus_parts(values: np.ndarray, parents: np.ndarray) -> np.ndarray:
+    """For each side, its value (rows of values) minus the sum of the values
+    of the sides it is made of, see _side_children()
+    """
+    side, part = _side_children(parents)
+    order = np.argsort(side, kind="stable")
+    side, part = side[order], part[order]
+    result = values.copy()
+    unique, start = np.unique(side, return_index=True)
+    if len(unique):
+        result[unique] -= np.add.reduceat(values[part], start, axis=0)
+    return result
+
+
+def _minus_parts_matrix(parents: np.ndarray) -> np.ndarray:
+    """The matrix of _minus_parts(), values minus parts being the product of
+    the matrix with values, for the sides of a small tree (e.g. a consensus)
+    """
+    side, part = _side_children(parents)
+    matrix = np.eye(2 * len(parents))
+    np.subtract.at(matrix, (side, part), 1)
+    return matrix
+
+
+def _unresolved(clades: TreeClades, rows: slice, sets: np.ndarray) -> np.ndarray:
+    """Whether triplets (rooted) or quartets (unrooted) of taxa, given by the
+    rows of sets, are unresolved in the tree of some nodes, from the depths of
+    the lowest common ancestors of pairs of leaves
+    """
+    inner = _incidence(clades, rows)[clades.parents[rows] != -1]
+    common = inner.T @ inner  # number of edges above both leaves
+    if len(sets) == 3:
+        a, b, c = sets
+        return (common[a, b] == common[a, c]) & (common[a, c] == common[b, c])
+    # four point condition on path lengths
+    depth = np.diag(common)
+    path = depth[:, None] + depth[None, :] - 2 * common
+    a, b, c, d = sets
+    ab_cd = path[a, b] + path[c, d]
+    ac_bd = path[a, c] + path[b, d]
+    return (ab_cd == ac_bd) & (ac_bd == path[a, d] + path[b, c])
+
+
+def _resolved(
+    sizes: np.ndarray, parents: np.ndarray, tree: np.ndarray, k: int, n: int, size: int
+) -> np.ndarray:
+    """The number of resolved triplets (size 3) or quartets (size 4) of each tree"""
+    inner = parents != -1
+    if size == 3:
+        # ab|c for a and b below a node and c below its parent only
+        counts = _pairs(sizes) * (sizes[np.maximum(parents, 0)] - sizes)
+        return np.bincount(tree[inner], counts[inner], minlength=k)
+    # ab|cd for a and b in distinct parts of a side and c, d outside of it,
+    # counted on both sides of the quartet
+    side_sizes = np.concatenate([sizes, n - sizes])
+    split = _minus_parts(_pairs(side_sizes), parents) * _pairs(n - side_sizes)
+    return np.bincount(np.concatenate([tree, tree]), split, minlength=k) / 2
+
+
+def tq_distances(clades: TreeClades, consensus: ete3.Tree, size: int) -> np.ndarray:
+    """Compute the triplet (size 3) or the quartet (size 4) distance between
+    each tree and the consensus, as tqDist triplet_dist and quartet_dist do:
+    the number of triplets (rooted) or quartets (unrooted) of taxa whose
+    topology differs, an unresolved topology being distinct from resolved ones
+
+    Topologies are counted from the sizes of the intersections of the clades
+    of each tree with the ones of the consensus, in O(n^2) for n taxa. The
+    triplets or quartets unresolved in both trees are enumerated for the
+    trees which have some when the consensus has some too.
+
+    Args:
+        clades (TreeClades): the encoded input trees
+        consensus (ete3.Tree): the consensus computed with any algorithm
+        size (int): 3 for triplets, 4 for quartets
+
+    Return:
+        np.ndarray: the distance of each tree
+    """
+    n = len(clades.taxa)
+    cons = TreeClades([consensus], clades.taxa)
+    root = (1 << n) - 1
+    if np.any(clades.leaves != root) or cons.leaves[0] != root:
+        raise Exception("The input trees and the consensus have different leaves")
+
+    k = len(clades)
+    total = math.comb(n, size)
+    if total == 0:
+        return np.zeros(k, dtype=np.int64)
+    cons_incidence = _incidence(cons, slice(None))
+    cons_sizes = cons_incidence.sum(1)
+    cons_parents = cons.parents
+    cons_minus_parts = _minus_parts_matrix(cons_parents).T
+    sizes = _popcount(clades.masks).astype(float)
+    same = np.zeros(k)
+    for rows in _chunks(clades, CHUNK_SIZE // len(cons.masks)):
+        common = _incidence(clades, rows) @ cons_incidence.T
+        tree = clades.tree[rows]
+        parents = clades.parents[rows] - rows.start
+        parents[clades.parents[rows] == -1] = -1
+
+        if size == 3:
+            # ab|c in both trees: a and b below x and y, c below their
+            # parents v and w but neither below x nor y
+            x = np.flatnonzero(parents != -1)
+            y = np.flatnonzero(cons_parents != -1)
+            v, w = parents[x], cons_parents[y]
+            outside = (
+                common[np.ix_(v, w)]
+                - common[np.ix_(x, w)]
+                - common[np.ix_(v, y)]
+                + common[np.ix_(x, y)]
+            )
+            shared = (_pairs(common[np.ix_(x, y)]) * outside).sum(1)
+            same += np.bincount(tree[x], shared, minlength=k)
+        else:
+            # ab|cd in both trees: a and b in distinct parts of a side of
+            # each tree, c and d outside of both
+            rows_sizes = sizes[rows][:, None]
+            sides = np.block(
+                [
+                    [common, rows_sizes - common],
+                    [cons_sizes - common, n - rows_sizes - cons_sizes + common],
+                ]
+            )
+            side_sizes = np.concatenate([sizes[rows], n - sizes[rows]])[:, None]
+            cons_side_sizes = np.concatenate([cons_sizes, n - cons_sizes])
+            pairs = _pairs(sides) @ cons_minus_parts
+            outside = _pairs(n - side_sizes - cons_side_sizes + sides)
+            # the pairs of the parts of each side, subtracted from the side
+            side, part = _side_children(parents)
+            shared = np.einsum("ij,ij->i", pairs, outside)
+            shared -= np.bincount(
+                side,
+                np.einsum("ij,ij->i", pairs[part], outside[side]),
+                minlength=len(shared),
+            )
+            same += np.bincount(np.concatenate([tree, tree]), shared, minlength=k) / 2
+
+    # unresolved in both trees
+    resolved = _resolved(sizes, clades.parents, clades.tree, k, n, size)
+    cons_resolved = _resolved(cons_sizes, cons_parents, cons.tree, 1, n, size)[0]
+    if cons_resolved < total:
+        sets = (
+            np.fromiter(
+                chain.from_iterable(combinations(range(n), size)),
+                np.int64,
+                total * size,
+            )
+            .reshape(total, size)
+            .T
+        )
+        sets = sets[:, _unresolved(cons, slice(None), sets)]
+        offsets = np.searchsorted(clades.tree, np.arange(k + 1))
+        for t in np.flatnonzero(resolved < total):
+            rows = slice(offsets[t], offsets[t + 1])
+            same[t] += np.sum(_unresolved(clades, rows, sets))
+    return np.rint(total - same).astype(np.int64)
+
+
+def average_tqd(
+    input_trees: list[ete3.Tree] | TreeClades, consensus: ete3.Tree, exec: str
+) -> float:
     """Compute the average triplet/quartet distance between the input trees and the consensus
 
     Args:
-        input_trees (list[ete3.Tree]): the list of input trees
+        input_trees (list[ete3.Tree] | TreeClades): the list of input trees, or the encoded input trees
         consensus (ete3.Tree): the consensus computed with any algorithm
         exec (str): quartet_dist | triplet_dist
 
     Return:
         float: the average triplet distance
     """
-    dist = 0
-    minus = 0
-    max_dist = 2 * math.comb(
-        len(consensus.get_leaves()), 3 if exec == "triplet_dist" else 4
-    )
-    for tree in input_trees:
-        cmd = [
-            "./scripts/tools/tqdist.sh",
-            exec,
-            tree.write(format=9),
-            consensus.write(format=9),
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        try:
-            dist += float(result.stdout) / max_dist
-        except Exception:
-            print(
-                f"WARNING error computing the {exec} distance metric !!!!\n executable stdrr: '{result.stderr}'"
-            )
-            print(consensus.write())
-            print(tree.write())
-            print()
-            minus += 1
-    return dist / (len(input_trees) - minus)
+    if not isinstance(input_trees, TreeClades):
+        input_trees = TreeClades(input_trees)
+    size = 3 if exec == "triplet_dist" else 4
+    max_dist = 2 * math.comb(len(input_trees.taxa), size)
+    return float(np.mean(tq_distances(input_trees, consensus, size))) / max_dist
 
 
-def average_td(input_trees: list[ete3.Tree], consensus: ete3.Tree) -> float:
+def average_td(
+    input_trees: list[ete3.Tree] | TreeClades, consensus: ete3.Tree
+) -> float:
     """Compute the average triplet distance between the input trees and the consensus
 
     Args:
-        input_trees (list[ete3.Tree]): the list of input trees
+        input_trees (list[ete3.Tree] | TreeClades): the list of input trees, or the encoded input trees
         consensus (ete3.Tree): the consensus computed with any algorithm
 
     Return:
@@ -89,11 +498,13 @@ def average_td(input_trees: list[ete3.Tree], consensus: ete3.Tree) -> float:
     return average_tqd(input_trees, consensus, "triplet_dist")
 
 
-def average_qd(input_trees: list[ete3.Tree], consensus: ete3.Tree) -> float:
+def average_qd(
+    input_trees: list[ete3.Tree] | TreeClades, consensus: ete3.Tree
+) -> float:
     """Compute the average quartet distance between the input trees and the consensus
 
     Args:
-        input_trees (list[ete3.Tree]): the list of input trees
+        input_trees (list[ete3.Tree] | TreeClades): the list of input trees, or the encoded input trees
         consensus (ete3.Tree): the consensus computed with any algorithm
 
     Return:
@@ -141,27 +552,78 @@ def bsd(t1: ete3.Tree, t2: ete3.Tree, normalize: bool = True) -> float:
     return sqrt(sum(diffs))
 
 
+def bsd_distances(
+    clades: TreeClades, consensus: ete3.Tree, normalize: bool = True
+) -> np.ndarray:
+    """Compute the Branch Score Distance between each tree and the consensus,
+    as bsd() does for each of them
+
+    Args:
+        clades (TreeClades): the encoded input trees
+        consensus (ete3.Tree): the consensus computed with any algorithm
+        normalize (bool): if True, the distance between each bipartition is normalized with respect to the lenght of its tree
+
+    Return:
+        np.ndarray: the bsd of each tree
+    """
+    cons_masks, cons_dists, cons_root = clades.encode(consensus)
+    k = len(clades)
+    rows = ~clades.is_root
+    (codes, cons_codes), values = _codes(clades.masks[rows], cons_masks[~cons_root])
+    n = len(values)
+
+    # as the dictionaries of bsd(), the length of a clade is the one of its
+    # last node (the lowest of a chain of nodes with a single child)
+    pairs, last = _last_of_each(clades.tree[rows] * n + codes)
+    tree, codes, dists = pairs // n, pairs % n, clades.dists[rows][last]
+    cons_codes, last = _last_of_each(cons_codes)
+    cons_dists = cons_dists[~cons_root][last]
+
+    size = np.bincount(tree, weights=dists, minlength=k) if normalize else np.ones(k)
+    cons_size = cons_dists.sum() if normalize else 1
+    cons_lengths = np.zeros(n)
+    cons_lengths[cons_codes] = cons_dists / cons_size
+
+    # the clades of each tree, then the clades of the consensus each misses
+    terms = (dists / size[tree] - cons_lengths[codes]) ** 2
+    total = np.bincount(tree, weights=terms, minlength=k)
+    cons_pairs = (np.arange(k)[:, None] * n + cons_codes).ravel()
+    missing = ~np.isin(cons_pairs, pairs)
+    total += np.bincount(
+        cons_pairs[missing] // n,
+        weights=cons_lengths[cons_pairs[missing] % n] ** 2,
+        minlength=k,
+    )
+    return np.sqrt(total)
+
+
 def average_bsd(
-    input_trees: list[ete3.Tree], consensus: ete3.Tree, normalize: bool = True
+    input_trees: list[ete3.Tree] | TreeClades,
+    consensus: ete3.Tree,
+    normalize: bool = True,
 ) -> float:
     """Compute the average Branch Score Distance between the input trees and the consensus
 
     Args:
-        input_trees (list[ete3.Tree]): the list of input trees
+        input_trees (list[ete3.Tree] | TreeClades): the list of input trees, or the encoded input trees
         consensus (ete3.Tree): the consensus computed with any algorithm
         normalize (bool): if True, distance between 2 trees is normalized with respect to the total length of each tree
 
     Return:
         float: the average normalized bsd distance
     """
-    total = 0
-    for tree in input_trees:
-        total += bsd(tree, consensus, normalize)
-    return total / len(input_trees)
+    if not isinstance(input_trees, TreeClades):
+        input_trees = TreeClades(input_trees)
+    return float(np.mean(bsd_distances(input_trees, consensus, normalize)))
 
 
 def distance(
-    input_trees: list[ete3.Tree], consensus: ete3.Tree, metric: str, **args
+    input_trees: list[ete3.Tree],
+    consensus: ete3.Tree,
+    metric: str,
+    clades: TreeClades | None = None,
+    kc: KCVectors | None = None,
+    **args,
 ) -> float:
     """Compute the average for a given metric
 
@@ -169,25 +631,29 @@ def distance(
         input_trees (list[ete3.Tree]): the list of input trees
         consensus (ete3.Tree): the consensus computed with any algorithm
         metric (str): the desired distance measure
+        clades (TreeClades | None): the input trees already encoded, for rf, bsd, tdist and qdist
+        kc (KCVectors | None): the vectors of the input trees, for kcdist
 
     Return:
         float: the value for the metric
     """
     if metric == "rf":
-        return average_rf(input_trees, consensus)
+        return average_rf(input_trees if clades is None else clades, consensus)
 
     if metric == "bsd":
-        return average_bsd(input_trees, consensus)
+        return average_bsd(input_trees if clades is None else clades, consensus)
 
     if metric == "tdist":
-        return average_td(input_trees, consensus)
+        return average_td(input_trees if clades is None else clades, consensus)
 
     if metric == "qdist":
-        return average_qd(input_trees, consensus)
+        return average_qd(input_trees if clades is None else clades, consensus)
 
     if metric == "kcdist":
         if "lamb" in args:
-            return average_kc(input_trees, consensus, args["lamb"])
+            return average_kc(
+                input_trees if kc is None else kc, consensus, args["lamb"]
+            )
         else:
             raise Exception("Missing lambda parameter <lamb> for kc distance")
 
@@ -1,3 +1,7 @@
+import ete3
+import numpy as np
+
+
 class _KC_node:
     name: str
     depth_unweighted: int
@@ -107,4 +111,125 @@ def KC_dist(tree1: str, tree2: str, lam: float = 0) -> float:
     rtn = 0
     for item in vec1:
         rtn += (vec1[item] - vec2[item]) ** 2
-    return rtn ** 0.5
\ No newline at end of file
+    return rtn ** 0.5
+
+def kc_vectors(
+    tree: ete3.Tree, taxa_index: dict[str, int]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Compute the unweighted and weighted Kendall-Colijn vectors of a tree,
+    without recursion: the depth of the lowest common ancestor of each pair
+    of leaves (in number of edges, and in length from the root), ordered as
+    np.triu_indices(), then the length of the branch above each leaf (1, and
+    its length). The vector for a lambda is (1 - lambda) * unweighted +
+    lambda * weighted, as _get_vector() does
+
+    Args:
+        tree (ete3.Tree): the tree, its leaves being the keys of taxa_index
+        taxa_index (dict[str, int]): the index of each leaf name in the vectors
+
+    Return:
+        tuple[np.ndarray, np.ndarray]: the unweighted and the weighted vectors
+    """
+    nodes = list(tree.traverse("preorder"))
+    n = len(taxa_index)
+    names = [node.name for node in nodes if node.is_leaf()]
+    if len(names) != n or set(names) != set(taxa_index):
+        raise ValueError("Invalid tree nodes! Tips of two trees should be the same.")
+
+    # depths from the root, whose branch is ignored as by ete3 write()
+    unweighted = {tree: 0}
+    weighted = {tree: 0.0}
+    for node in nodes[1:]:
+        unweighted[node] = unweighted[node.up] + 1
+        weighted[node] = weighted[node.up] + node.dist
+
+    # leaves of a subtree are contiguous in preorder, from start to end
+    size = {}
+    for node in reversed(nodes):
+        size[node] = 1 if node.is_leaf() else sum(size[c] for c in node.children)
+    start = {tree: 0}
+    for node in nodes:
+        position = start[node]
+        for child in node.children:
+            start[child] = position
+            position += size[child]
+
+    # the leaves of each child share their lowest common ancestor with the
+    # leaves of the next children, filling the upper triangle
+    lca_unweighted = np.zeros((n, n))
+    lca_weighted = np.zeros((n, n))
+    for node in nodes:
+        end = start[node] + size[node]
+        for child in node.children[:-1]:
+            rows = slice(start[child], start[child] + size[child])
+            cols = slice(start[child] + size[child], end)
+            lca_unweighted[rows, cols] = unweighted[node]
+            lca_weighted[rows, cols] = weighted[node]
+
+    # from preorder to the order of taxa_index
+    leaves = [node for node in nodes if node.is_leaf()]
+    order = np.empty(n, dtype=np.int64)
+    order[[taxa_index[leaf.name] for leaf in leaves]] = np.arange(n)
+    rows, cols = np.triu_indices(n, 1)
+    i, j = order[rows], order[cols]
+    first, second = np.minimum(i, j), np.maximum(i, j)
+    pendant = np.array([leaf.dist for leaf in leaves])[order]
+    return (
+        np.concatenate([lca_unweighted[first, second], np.ones(n)]),
+        np.concatenate([lca_weighted[first, second], pendant]),
+    )
+
+
+class KCVectors:
+    """The Kendall-Colijn vectors of a set of trees, computed once to compare
+    the trees with a consensus for any lambda (see distances())
+
+    Attributes:
+        taxa (list[str]): the sorted leaf names, shared by every tree
+        unweighted (np.ndarray): the unweighted vector of each tree, one per row
+        weighted (np.ndarray): the weighted vector of each tree, one per row
+    """
+
+    def __init__(self, trees: list[ete3.Tree]) -> None:
+        self.taxa = sorted(trees[0].get_leaf_names())
+        self.taxa_index = {t: i for i, t in enumerate(self.taxa)}
+        vectors = [kc_vectors(t, self.taxa_index) for t in trees]
+        self.unweighted = np.stack([u for u, _ in vectors])
+        self.weighted = np.stack([w for _, w in vectors])
+        # the last consensus and the differences with its vectors
+        self._consensus: tuple = (None, None, None)
+
+    def __len__(self) -> int:
+        return len(self.unweighted)
+
+    def distances(self, consensus: ete3.Tree, lambdas: list[float]) -> np.ndarray:
+        """Compute the Kendall-Colijn distance between each tree and the
+        consensus, as KC_dist() does, for several lambdas at once. The
+        vectors of the consensus are kept for the next calls with the same
+        consensus object
+
+        Args:
+            consensus (ete3.Tree): the consensus computed with any algorithm
+            lambdas (list[float]): the lambdas, between 0 and 1
+
+        Return:
+            np.ndarray: the distance of each tree (columns) for each lambda (rows)
+        """
+        if any(lam > 1 or lam < 0 for lam in lambdas):
+            raise ValueError("Invalid lambda! Lambda value should be between 0 and 1.")
+        if self._consensus[0] is not consensus:
+            unweighted, weighted = kc_vectors(consensus, self.taxa_index)
+            self._consensus = (
+                consensus,
+                self.unweighted - unweighted,
+                self.weighted - weighted,
+            )
+        _, diff_unweighted, diff_weighted = self._consensus
+        return np.array(
+            [
+                np.sqrt(
+                    np.sum(((1 - lam) * diff_unweighted + lam * diff_weighted) ** 2, 1)
+                )
+                for lam in lambdas
+            ]
+        ).reshape(len(lambdas), len(self))
@@ -1,3 +1,5 @@
+from .batch import batch_consensus
 from .primconstree import primconstree
+from .stats import Stats
 
-__all__ = ["primconstree"]
+__all__ = ["primconstree", "batch_consensus", "Stats"]
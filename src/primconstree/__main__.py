@@ -1,10 +1,95 @@
 import argparse
+import json
+import os
+import sys
+import time
 
-from .primconstree import primconstree
-from .utils import read_trees
+from .batch import TREE_EXTENSIONS, batch_consensus, collect_inputs
+from .cache import MAX_SIZE, ResultCache, cached_consensus, open_cache
+from .criteria import VERSIONS
+from .diskgraph import build_disk_graph
+from .primconstree import (
+    build_supergraph,
+    check_ids,
+    graph_to_consensus,
+    input_taxa,
+    primconstree,
+    write_consensus,
+)
+from .resample import METHODS, resample_consensus
+from .stats import Stats, phase
+from .storage import load_supergraph, save_supergraph
+from .stream import stream_consensus, window_consensus
+from .sweep import parse_seeds, sweep_seeds
+from .treestore import TreeStore, open_store
+from .utils import read_newicks
+
+
+def run_batch(args: argparse.Namespace, crits: list[str], avg_on_merge: bool) -> None:
+    """Run the --batch mode, and report the throughput on stderr"""
+    input_files = collect_inputs(args.batch or [], args.manifest)
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    nb_failed = 0
+    for input_file, consensus, error in batch_consensus(
+        input_files,
+        crits,
+        args.jobs,
+        avg_on_merge=avg_on_merge,
+        seed=args.seed,
+        engine=args.engine,
+        cache=args.cache,
+        cache_size=args.cache_size << 20,
+        annotate=args.annotate,
+    ):
+        if error is not None:
+            nb_failed += 1
+            print(f"PCT: {input_file}: {error}", file=sys.stderr)
+        elif args.output is not None:
+            output_file = os.path.join(args.output, os.path.basename(input_file))
+            with open(output_file, "w") as file:
+                file.write(consensus + "\n")
+        else:
+            print(f"{input_file}\t{consensus}", flush=True)
+    duration = time.perf_counter() - start
+
+    print(
+        f"PCT: {len(input_files)} sets ({nb_failed} failed) in {duration:.2f} s, "
+        f"{len(input_files) / duration if duration else 0:.1f} sets/s",
+        file=sys.stderr,
+    )
+
+
+def print_stats(stats: Stats | None, cache: ResultCache | None = None) -> None:
+    """Print the statistics of --stats as JSON on stderr,
+    with the counters of the cache if any
+    """
+    if stats is not None:
+        output = stats.to_dict()
+        if cache is not None:
+            output["cache"] = cache.counters()
+        print(json.dumps(output, indent=2), file=sys.stderr)
+
+
+def read_input(filename: str, tree_cache: str | None) -> list[str] | TreeStore:
+    """The input trees as Newick strings, or as encoded trees
+    from the store of --tree-cache if given
+    """
+    if tree_cache is not None:
+        return open_store(filename, tree_cache)
+    return read_newicks(filename)
 
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        # imported here as the other modes do not need the HTTP server
+        from .serve import main as serve
+
+        serve(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser()
     parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument(
@@ -43,6 +128,174 @@ def main():
         nargs=1,
         default="sum",
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        help=(
+            "Choose the supergraph representation:\n"
+            "- 'networkx' : a networkx graph with attributes on nodes and edges\n"
+            "- 'csr' (default) : dense typed arrays with CSR adjacency and MST keys compiled once, faster and lighter\n"
+            "- 'disk' : csr built in an SQLite database and memory mapped, for supergraphs larger than memory\n"
+            "  (files go to TMPDIR, or to --save-graph)\n"
+        ),
+        default="csr",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes used to parse the input trees and build the supergraph, and to share seeds (--seeds) or sets of trees (--batch) (default 1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help=(
+            "Keep reading trees appended to the input file (e.g. by a running MCMC chain) and print an updated consensus\n"
+            "every --every trees or --interval seconds, until interrupted"
+        ),
+    )
+    parser.add_argument(
+        "--every",
+        type=int,
+        help="With --follow, print an updated consensus every EVERY new trees (default 100, 0 to disable)",
+        default=100,
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="With --follow, print an updated consensus every INTERVAL seconds if new trees were read",
+        default=None,
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        help="Print the consensus of every window of WINDOW consecutive trees, sliding by --stride trees",
+        default=None,
+    )
+    parser.add_argument(
+        "--stride",
+        type=int,
+        help="With --window, number of trees the window slides by (default 1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--save-graph",
+        type=str,
+        help="Also save the supergraph built from --file to this path, to be reused with --graph",
+        default=None,
+    )
+    parser.add_argument(
+        "-g",
+        "--graph",
+        type=str,
+        help="Compute the consensus from a supergraph saved with --save-graph instead of an input file",
+        default=None,
+    )
+    parser.add_argument(
+        "--seeds",
+        type=str,
+        help=(
+            "Compute the consensus for every seed from A to B included, given as A:B, building the supergraph once,\n"
+            "and print each distinct consensus preceded by the number of seeds giving it, most frequent first"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--resample",
+        type=str,
+        choices=METHODS,
+        help=(
+            "Compute the consensus of --replicates random subsets of the input trees, drawn without replacement (jackknife)\n"
+            "or with replacement (bootstrap), encoding the trees once, on --jobs processes. Print the consensus of all trees\n"
+            "with the percentage of replicates having each clade as support values, then the number of replicates having\n"
+            "each clade, most frequent first"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--replicates",
+        type=int,
+        help="With --resample, number of replicates (default 100)",
+        default=100,
+    )
+    parser.add_argument(
+        "--fraction",
+        type=float,
+        help="With --resample, number of trees of each replicate as a fraction of the input trees (default 0.5 for jackknife, 1 for bootstrap)",
+        default=None,
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        nargs="+",
+        help=(
+            "Compute the consensus of each of several sets of trees, given as input files or directories\n"
+            f"(whose files ending with {', '.join(TREE_EXTENSIONS)} are taken), on --jobs processes.\n"
+            "Each consensus is printed as soon as it is computed, after its input file and a tab"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="With --batch, or alone, a text file listing an input file on each line (relative to the manifest directory)",
+        default=None,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="With --batch, write each consensus to a file of this directory named after its input file instead of printing it",
+        default=None,
+    )
+    parser.add_argument(
+        "--annotate",
+        type=str,
+        choices=["support", "nhx"],
+        help=(
+            "Annotate each clade of the consensus with statistics of the supergraph, with --file, --graph or --batch:\n"
+            "- 'support' : the percentage of input trees having the clade, as Newick support values\n"
+            "- 'nhx' : NHX tags freq (number of input trees having the clade), support, and edge_freq and avglen\n"
+            "  (frequency and average length of the edge to the clade from its parent in the MST)\n"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help=(
+            "Look up the consensus in this result cache file, and store it there if missing, with --file or --batch.\n"
+            "Results are keyed by the input trees, the version of the algorithm, --seed and --len_on_merge"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help=f"Maximal size in MiB of the results of --cache, least recently used results are evicted beyond (default {MAX_SIZE >> 20})",
+        default=MAX_SIZE >> 20,
+    )
+    parser.add_argument(
+        "--tree-cache",
+        type=str,
+        help=(
+            "Read the trees of --file from their encoded copy kept in this directory under the hash of the file,\n"
+            "written on the first use, instead of parsing the Newick strings (not with --cache, which hashes them)"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help=(
+            "Print runtime statistics of the consensus as JSON on stderr: time of each phase, supergraph size,\n"
+            "heap usage of the MST, nodes removed from the MST and peak memory.\n"
+            "Above 64 taxa, the clade ids of the input trees are also checked for collisions"
+        ),
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -53,12 +306,9 @@ def main():
     args = parser.parse_args()
     filename = args.file
 
-    if args.version == 0:
-        crits = ["min_avg_len", "max_edge_freq"]
-    elif args.version == 1:
-        crits = ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"]
-    else:
+    if args.version not in VERSIONS:
         raise Exception(f"PCT version {args.version} invalid")
+    crits = VERSIONS[args.version]
 
     if args.len_on_merge == "sum":
         avg_on_merge = False
@@ -69,11 +319,155 @@ def main():
 
     debug = bool(args.debug)
 
-    input_trees = read_trees(filename)
+    if args.batch is not None or args.manifest is not None:
+        run_batch(args, crits, avg_on_merge)
+        return
+
+    if args.window is not None:
+        for consensus in window_consensus(
+            filename,
+            crits,
+            args.window,
+            args.stride,
+            avg_on_merge=avg_on_merge,
+            seed=args.seed,
+            engine=args.engine,
+        ):
+            print(consensus.write(), flush=True)
+        return
+
+    if args.follow:
+        try:
+            for consensus in stream_consensus(
+                filename,
+                crits,
+                every=args.every,
+                interval=args.interval,
+                avg_on_merge=avg_on_merge,
+                seed=args.seed,
+                engine=args.engine,
+            ):
+                print(consensus.write(), flush=True)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.seeds is not None:
+        if args.graph is not None:
+            graph, taxa = load_supergraph(args.graph)
+        else:
+            input_trees = read_input(filename, args.tree_cache)
+            taxa = input_taxa(input_trees)
+            graph = build_supergraph(input_trees, taxa, args.engine, args.jobs)
+        counts = sweep_seeds(
+            graph, taxa, crits, parse_seeds(args.seeds), avg_on_merge, args.jobs
+        )
+        for newick, count in counts.most_common():
+            print(f"{count:7d} {newick}")
+        return
+
+    if args.resample is not None:
+        input_trees = read_input(filename, args.tree_cache)
+        taxa = input_taxa(input_trees)
+        consensus, counts, clades = resample_consensus(
+            input_trees,
+            taxa,
+            crits,
+            args.replicates,
+            args.resample,
+            args.fraction,
+            avg_on_merge,
+            args.seed,
+            args.jobs,
+        )
+        print(consensus.write())
+        for clade_id, count in counts.most_common():
+            print(f"{count:7d} {','.join(clades[clade_id])}")
+        return
+
+    stats = Stats() if args.stats else None
+
+    if args.graph is not None:
+        with phase(stats, "load_graph"):
+            graph, taxa = load_supergraph(args.graph)
+        consensus = graph_to_consensus(
+            graph,
+            taxa,
+            crits,
+            avg_on_merge,
+            debug,
+            seed=args.seed,
+            stats=stats,
+            annotate=args.annotate is not None,
+        )
+        print(write_consensus(consensus, args.annotate))
+        print_stats(stats)
+        return
+
+    # trees are kept as Newick strings and encoded without ete3,
+    # by the workers if there are several jobs
+    with phase(stats, "read_trees"):
+        if args.cache is not None and not debug:
+            input_trees = read_newicks(filename)
+        else:
+            input_trees = read_input(filename, args.tree_cache)
+
+    if args.save_graph is not None:
+        taxa = input_taxa(input_trees)
+        if debug or stats is not None:
+            check_ids(input_trees, taxa, stats)
+        if args.engine == "disk":
+            with phase(stats, "build_graph"):
+                graph = build_disk_graph(input_trees, taxa, args.save_graph)
+        else:
+            with phase(stats, "build_graph"):
+                graph = build_supergraph(input_trees, taxa, "csr", args.jobs)
+            with phase(stats, "save_graph"):
+                save_supergraph(graph, taxa, args.save_graph)
+        consensus = graph_to_consensus(
+            graph,
+            taxa,
+            crits,
+            avg_on_merge,
+            debug,
+            seed=args.seed,
+            stats=stats,
+            annotate=args.annotate is not None,
+        )
+        print(write_consensus(consensus, args.annotate))
+        print_stats(stats)
+        return
+
+    if args.cache is not None and not debug:
+        cache = open_cache(args.cache, args.cache_size << 20)
+        consensus = cached_consensus(
+            input_trees,
+            crits,
+            cache,
+            avg_on_merge=avg_on_merge,
+            seed=args.seed,
+            engine=args.engine,
+            jobs=args.jobs,
+            stats=stats,
+            annotate=args.annotate,
+        )
+        print(consensus)
+        print_stats(stats, cache)
+        return
+
     consensus = primconstree(
-        input_trees, crits=crits, avg_on_merge=avg_on_merge, debug=debug, seed=args.seed
+        input_trees,
+        crits=crits,
+        avg_on_merge=avg_on_merge,
+        debug=debug,
+        seed=args.seed,
+        engine=args.engine,
+        jobs=args.jobs,
+        stats=stats,
+        annotate=args.annotate is not None,
     )
-    print(consensus.write())
+    print(write_consensus(consensus, args.annotate))
+    print_stats(stats)
 
 
 if __name__ == "__main__":
@@ -1,63 +1,127 @@
 """Function for each step of the PCT algorithm"""
 
+from __future__ import annotations
+
 import heapq
 import random
 from statistics import fmean
-from typing import Generator, cast
+from typing import TYPE_CHECKING, Generator, Iterable, Sequence, cast
+
+from . import supergraph
+from .criteria import Criterion, get_criteria
+from .newick import encode_tree
+from .parallel import build_graph_parallel
+from .supergraph import SuperGraph
+from .utils import Record, get_leaf_ids, get_root_id, get_taxa_ids, get_tie_ids
 
-import ete3
-import networkx as nx
+if TYPE_CHECKING:
+    import ete3
+    import networkx as nx
+else:
+    from .lazy import ete3, nx
 
-from .utils import clade_to_id, get_root_id
+# features set on each node of the consensus by annotate_consensus()
+ANNOTATIONS = ("freq", "support", "edge_freq", "avglen")
 
 
-def add_tree_to_graph(t: ete3.Tree, taxa: list[str], graph: nx.Graph) -> None:
+def add_tree_to_graph(t: ete3.Tree | str, taxa: list[str], graph: nx.Graph) -> None:
     """Incorporate a new tree into a graph by idendifying nodes
     with clade_to_id(), incorporating new node and edges, and
     updating their frequency
     Also for edges that already exists, lenghts is summed
+    The tree is given as ete3.Tree or as Newick string (see newick.py)
     """
-    for node in cast(Generator[ete3.Tree, None, None], t.traverse(strategy="preorder")):
-        # get mapped identifier based on clade content
-        nid = clade_to_id(node.get_leaf_names(), taxa)
+    add_records_to_graph(encode_tree(t, get_taxa_ids(taxa)), graph)
+
+
+def add_records_to_graph(records: list[Record], graph: nx.Graph) -> None:
+    """Incorporate a tree encoded as records (see newick.py) into a graph"""
+    # records are in preorder so the node order of the graph,
+    # which the tie breaking of build_mst() relies on, is kept
+    for nid, pid, dist, is_leaf in records:
         # add node to the graph
         if nid not in graph.nodes:
-            graph.add_node(nid, node_freq=0, is_leaf=node.is_leaf())
+            graph.add_node(nid, node_freq=0, is_leaf=is_leaf)
 
         # if the node is not the root
-        if node.up:
+        if pid != -1:
             # count the node frequency
             graph.nodes[nid]["node_freq"] += 1
-            pid = clade_to_id(node.up.get_leaf_names(), taxa)
 
             # add incident edge to the graph
             if nid not in graph[pid]:
                 graph.add_edge(pid, nid, avglen=0, edge_freq=0)
 
             # count edge length and edge frequency
-            graph[pid][nid]["avglen"] += node.dist
+            graph[pid][nid]["avglen"] += dist
             graph[pid][nid]["edge_freq"] += 1
 
 
-def build_graph(trees: list[ete3.Tree], taxa: list[str]) -> nx.Graph:
+def remove_tree_from_graph(
+    t: ete3.Tree | str, taxa: list[str], graph: nx.Graph
+) -> None:
+    """Counterpart of add_tree_to_graph(), remove a tree previously
+    incorporated into the graph by decreasing node and edge frequencies
+    and edge lenghts sum.
+    Edges whose frequency reach 0 are removed, as well as the nodes
+    left without any incident edge.
+    """
+    remove_records_from_graph(encode_tree(t, get_taxa_ids(taxa)), graph)
+
+
+def remove_records_from_graph(records: list[Record], graph: nx.Graph) -> None:
+    """Remove a tree encoded as records (see newick.py) from a graph"""
+    for nid, pid, dist, _ in records:
+        if pid != -1:
+            graph.nodes[nid]["node_freq"] -= 1
+
+            edge = graph[pid][nid]
+            edge["avglen"] -= dist
+            edge["edge_freq"] -= 1
+            if edge["edge_freq"] == 0:
+                graph.remove_edge(pid, nid)
+
+    for nid, _, _, _ in records:
+        if nid in graph and graph.degree(nid) == 0:
+            graph.remove_node(nid)
+
+
+def build_graph(
+    trees: Iterable[ete3.Tree | str], taxa: list[str], jobs: int = 1
+) -> nx.Graph:
     """Build the supergraph by incorporating every trees
     Then compute average edge length
+    Trees are ete3.Tree or Newick strings, which are encoded without ete3
+    and can be streamed, e.g. with newick.iter_newicks(), or trees already
+    encoded, e.g. a TreeStore (see treestore.py)
+    If jobs > 1, trees are incorporated by shards on <jobs> processes,
+    see build_graph_parallel(), the resulting graph is the same.
     Return the graph.
     """
+    if jobs > 1:
+        return build_graph_parallel(list(trees), taxa, jobs)
+
     graph = nx.Graph()
+    taxa_ids = get_taxa_ids(taxa)
 
     # incorporate trees incrementally
     for t in trees:
-        add_tree_to_graph(t, taxa, graph)
+        add_records_to_graph(encode_tree(t, taxa_ids), graph)
 
-    # compute average edge length
-    for u, v in graph.edges():
-        graph[u][v]["avglen"] /= graph[u][v]["edge_freq"]
+    average_lengths(graph)
 
     return graph
 
 
-def get_weights(graph: nx.Graph, u: int, v: int, crits: list[str]) -> tuple:
+def average_lengths(graph: nx.Graph) -> None:
+    """Turn the summed edge lengths of a graph built with
+    add_tree_to_graph() into average edge lengths, in place
+    """
+    for u, v in graph.edges():
+        graph[u][v]["avglen"] /= graph[u][v]["edge_freq"]
+
+
+def get_weights(graph: nx.Graph, u: int, v: int, functions: list[Criterion]) -> tuple:
     """Assign a weight to an edge of the graph,
     This weights are used to evaluate which edge take next in the MST,
     the less the better.
@@ -68,55 +132,63 @@ def get_weights(graph: nx.Graph, u: int, v: int, crits: list[str]) -> tuple:
         graph: the graph where the edge is
         u: the vertex of the edge which is already in the MST
         v: the fringe vertex (which is not already in the MST)
-        crits: the criterions to use, in order of priority, valid ones are
+        functions: the criterions to use, in order of priority, as given by
+            criteria.get_criteria() once per MST, valid ones are
             "max_nfreq_out", "max_nfreq_in", "max_edge_freq", "min_avg_len"
+            and those added with criteria.register_criterion()
 
     Return:
-        A tuple, the same size of <crits> with the value of each criterion
+        A tuple, the same size of <functions> with the value of each criterion
     """
-    criterion = {}
-    criterion["max_nfreq_out"] = (
-        1 / graph.nodes[v]["node_freq"]
-        if graph.nodes[v]["node_freq"] != 0
-        else float("inf")
+    u_freq = graph.nodes[u]["node_freq"]
+    v_freq = graph.nodes[v]["node_freq"]
+    edge = graph[u][v]
+
+    edge_freq = edge["edge_freq"]
+    avglen = edge["avglen"]
+    weights = tuple(
+        criterion(u_freq, v_freq, edge_freq, avglen) for criterion in functions
     )
-    criterion["max_nfreq_in"] = (
-        1 / graph.nodes[u]["node_freq"]
-        if graph.nodes[u]["node_freq"] != 0
-        else float("inf")
-    )
-    criterion["max_edge_freq"] = 1 / graph[u][v]["edge_freq"]
-    criterion["min_avg_len"] = graph[u][v]["avglen"]
-
-    weights = tuple(criterion[c] for c in crits)
 
     return weights
 
 
 def attach_leaves(
-    graph: nx.Graph, taxa: list[str], crits: list[str], rnd_id: dict[int, int]
+    graph: nx.Graph | SuperGraph,
+    taxa: list[str],
+    crits: list[str],
+    rnd_id: dict[int, int] | Sequence[int],
 ) -> None:
     """Attach the node corresponding to leaves to the mst,
     Use the criterion <crits> do decide which parent is the better
+    For a SuperGraph, rnd_id is the tie breaking rank of each node index
+    instead (see supergraph.build_mst())
     """
+    if isinstance(graph, SuperGraph):
+        return supergraph.attach_leaves(graph, taxa, crits, rnd_id)
+
+    functions = get_criteria(crits)
     # Attach the leaf nodes by choosing the most profitable edge
     # For each leaf u we look at its parents
     # Assuming the graph is undirected, the set of parents is given by graph[u]
     # This is to be modified if the graph is directed
-    for u in [1 << i for i in range(len(taxa))]:
+    for u in get_leaf_ids(taxa):
         for v in graph[u]:
-            weights = (*get_weights(graph, v, u, crits), rnd_id[v])
+            weights = (*get_weights(graph, v, u, functions), rnd_id[v])
             if graph.nodes[u]["key"] > weights:
                 graph.nodes[u]["key"] = weights
                 graph.nodes[u]["parent"] = v
 
 
-def mst_to_tree(graph: nx.Graph) -> ete3.Tree:
+def mst_to_tree(graph: nx.Graph | SuperGraph) -> ete3.Tree:
     """Given the graph with the MST mapped onto it (by assiging
     a "parent" variable to each node), build the tree.
     The tree is returned as a ete3.Tree instance, with internal nodes
     and average edge lengths
     """
+    if isinstance(graph, SuperGraph):
+        return supergraph.mst_to_tree(graph)
+
     # create all nodes
     tree_nodes = {
         node_id: ete3.TreeNode(name=node_id) for node_id in graph.nodes.keys()
@@ -140,7 +212,11 @@ def mst_to_tree(graph: nx.Graph) -> ete3.Tree:
 
 
 def build_mst(
-    graph: nx.Graph, src: int, taxa: list[str], crits: list[str], seed: int
+    graph: nx.Graph | SuperGraph,
+    src: int,
+    taxa: list[str],
+    crits: list[str],
+    seed: int,
 ) -> ete3.Tree:
     """Build the MST of the graph, starting at the source node src
     (where src is the node identifier based on clade_to_id()).
@@ -150,15 +226,37 @@ def build_mst(
     and average edge lengths.
     The seed control how identical element are sorted, this ensure that element
     are not sorted by id because it would be a bias
+    If graph is a SuperGraph, the array implementation is used instead.
     """
+    run_mst(graph, src, taxa, crits, seed)
+    # Build the tree from the attached parent values
+    mst = mst_to_tree(graph)
+
+    return mst
+
+
+def run_mst(
+    graph: nx.Graph | SuperGraph,
+    src: int,
+    taxa: list[str],
+    crits: list[str],
+    seed: int,
+) -> int:
+    """Map the MST onto the graph, by assigning a parent to each node,
+    see build_mst() for the arguments
+
+    Return:
+        int: the number of entries pushed on the heap (see stats.Stats)
+    """
+    if isinstance(graph, SuperGraph):
+        return supergraph.run_mst(graph, src, taxa, crits, seed)
+
     nodes = graph.nodes(data=True)
+    functions = get_criteria(crits)
 
     random.seed(seed)
     rnd_id = {
-        n: rnd
-        for n, rnd in zip(
-            graph.nodes, random.sample(range(0, get_root_id(taxa)), len(graph.nodes))
-        )
+        n: rnd for n, rnd in zip(graph.nodes, get_tie_ids(len(graph.nodes), taxa))
     }
 
     for _, node in nodes:
@@ -175,6 +273,7 @@ def build_mst(
     # Append the source node to the queue to start fron it
     graph.nodes[src]["key"] = (0,) * len(crits)
     heapq.heappush(queue, (*graph.nodes[src]["key"], rnd_id[src], src))
+    pushes = 1
 
     # Loop until the priority queue becomes empty
     while queue:
@@ -196,18 +295,17 @@ def build_mst(
 
             # Check if this new edge leading to v is better than the one we found so far
             # If so, update the key of v and push the edge on the heap
-            weights = get_weights(graph, u, v, crits)
+            weights = get_weights(graph, u, v, functions)
             if next_node["key"] > weights:
                 heapq.heappush(queue, (*weights, rnd_id[v], v))
+                pushes += 1
                 next_node["key"] = weights
                 next_node["parent"] = u
 
     # Attach the leaf nodes
     attach_leaves(graph, taxa, crits, rnd_id)
-    # Build the tree from the attached parent values
-    mst = mst_to_tree(graph)
 
-    return mst
+    return pushes
 
 
 def remove_unecessary_nodes(
@@ -223,7 +321,7 @@ def remove_unecessary_nodes(
             removing redundant node, else sum. Defaults to False.
     """
     accumulated_lengths = dict()
-    taxa_ids = [1 << i for i in range(len(taxa))]
+    taxa_ids = set(get_leaf_ids(taxa))
 
     # postorder traversal to check children before parent
     for node in cast(Generator[ete3.Tree, None, None], tree.traverse("postorder")):
@@ -258,3 +356,173 @@ def remove_unecessary_nodes(
     if average_on_merge:
         for node, lengths in accumulated_lengths.items():
             node.dist = fmean(lengths)
+
+
+def mst_to_consensus(
+    graph: nx.Graph | SuperGraph, taxa: list[str], average_on_merge: bool = False
+) -> ete3.Tree:
+    """Build the consensus tree from the MST mapped onto the graph (see
+    run_mst()) in one linear pass over the parent of each node.
+    This fuses mst_to_tree(), remove_unecessary_nodes() and the naming of
+    leaves after their taxa, and gives exactly the same tree (order of
+    children and edge lengths included) without building a ete3.Tree for
+    each node of the graph nor going through a Newick string.
+
+    Args:
+        graph: the graph with the MST mapped onto it
+        taxa: the list of taxa the node id were mapped against
+        average_on_merge: see remove_unecessary_nodes()
+
+    Return:
+        ete3.Tree: the consensus tree
+    """
+    if isinstance(graph, SuperGraph):
+        ids = graph.ids
+        up = list(graph.parent)
+        dists = [graph.avglen[e] if e != -1 else 0.0 for e in graph.parent_edge]
+    else:
+        ids = list(graph.nodes)
+        index = {nid: i for i, nid in enumerate(ids)}
+        up, dists = [], []
+        for nid, node in graph.nodes(data=True):
+            pid = node["parent"]
+            up.append(index[pid] if pid != -1 else -1)
+            dists.append(graph[pid][nid]["avglen"] if pid != -1 else 0.0)
+
+    # mst_to_tree() writes lengths to Newick, keeping 6 significant digits
+    dist = [float(f"{d:0.6g}") for d in dists]
+    children: list[list[int]] = [[] for _ in ids]
+    root = -1
+    for i, p in enumerate(up):
+        if p == -1:
+            root = i
+        else:
+            children[p].append(i)
+
+    if root == -1:
+        raise Exception("No root found")
+
+    # postorder, children in order
+    order, stack = [], [root]
+    while stack:
+        u = stack.pop()
+        order.append(u)
+        stack.extend(children[u])
+    order.reverse()
+
+    deleted = bytearray(len(ids))
+
+    def current_children(u: int) -> list[int]:
+        children[u] = [c for c in children[u] if not deleted[c]]
+        return children[u]
+
+    def delete(u: int) -> None:
+        """Same as ete3 delete(prevent_nondicotomic=False, preserve_branch_length=True),
+        which moves the children of u at the end of the children of its parent
+        """
+        p = up[u]
+        if p == -1:
+            return
+        if len(children[u]) == 1:
+            dist[children[u][0]] += dist[u]
+        elif len(children[u]) > 1:
+            dist[p] += dist[u]
+        for c in children[u]:
+            children[p].append(c)
+            up[c] = p
+        deleted[u] = 1
+
+    # same steps as remove_unecessary_nodes()
+    accumulated_lengths: dict[int, list[float]] = {}
+    taxa_names = {leaf_id: t for t, leaf_id in get_taxa_ids(taxa).items()}
+    root_id = get_root_id(taxa)
+
+    for u in order:
+        nid = ids[u] if up[u] != -1 else root_id
+        if nid in taxa_names:
+            continue
+
+        current = current_children(u)
+        if len(current) == 0:
+            delete(u)
+
+        elif len(current) == 1 and up[u] != -1:
+            c = current[0]
+            accumulated_lengths.setdefault(c, [dist[c]]).append(dist[u])
+            delete(u)
+
+        elif len(current) == 1:
+            c = current[0]
+            for c2 in current_children(c):
+                accumulated_lengths.setdefault(c2, [dist[c2]]).append(dist[c])
+            delete(c)
+
+    if average_on_merge:
+        for u, lengths in accumulated_lengths.items():
+            dist[u] = fmean(lengths)
+
+    # build the remaining nodes, in preorder
+    tree = ete3.Tree(dist=dist[root])
+    stack = [(root, tree)]
+    while stack:
+        u, tree_node = stack.pop()
+        for c in current_children(u):
+            name = taxa_names.get(ids[c], str(ids[c]))
+            stack.append((c, tree_node.add_child(name=name, dist=dist[c])))
+
+    return tree
+
+
+def annotate_consensus(
+    consensus: ete3.Tree, graph: nx.Graph | SuperGraph, taxa: list[str]
+) -> None:
+    """Annotate each clade of the consensus with the statistics of its node in
+    the supergraph with the MST mapped onto it, in time linear in the size of
+    the consensus. The following features are set on each node (ANNOTATIONS):
+    - freq: the number of input trees having the clade
+    - support: freq as a percentage of the number of input trees, which is
+      also the support value written in Newick
+    - edge_freq, avglen: the frequency and average length of the edge of the
+      supergraph from the parent of the node in the MST (0 for the root), the
+      branch of the consensus is longer where unecessary nodes were removed
+
+    Args:
+        consensus: the consensus tree built from the graph, with leaves named
+            after their taxa and other nodes after their id (see clade_to_id())
+        graph: the graph with the MST mapped onto it (see run_mst())
+        taxa: the list of taxa the node id were mapped against
+    """
+    taxa_ids = get_taxa_ids(taxa)
+    if isinstance(graph, SuperGraph):
+
+        def statistics(nid: int) -> tuple[int, int, float]:
+            i = graph.index[nid]
+            e = graph.parent_edge[i]
+            if e == -1:
+                return graph.node_freq[i], 0, 0.0
+            return graph.node_freq[i], graph.edge_freq[e], graph.avglen[e]
+
+    else:
+
+        def statistics(nid: int) -> tuple[int, int, float]:
+            node = graph.nodes[nid]
+            if node["parent"] == -1:
+                return node["node_freq"], 0, 0.0
+            edge = graph[node["parent"]][nid]
+            return node["node_freq"], edge["edge_freq"], edge["avglen"]
+
+    # every input tree has every leaf
+    nb_trees = max(statistics(leaf_id)[0] for leaf_id in taxa_ids.values())
+    for node in cast(Generator[ete3.Tree, None, None], consensus.traverse()):
+        if node.up is None:
+            # the root is not counted in the supergraph
+            freq, edge_freq, avglen = nb_trees, 0, 0.0
+        else:
+            nid = taxa_ids[node.name] if node.is_leaf() else int(node.name)
+            freq, edge_freq, avglen = statistics(nid)
+        node.add_features(
+            freq=freq,
+            support=100 * freq / nb_trees if nb_trees else 0.0,
+            edge_freq=edge_freq,
+            avglen=avglen,
+        )
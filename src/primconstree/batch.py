@@ -0,0 +1,138 @@
+"""Consensus of many independent sets of trees in one invocation
+
+Each input file holds a set of trees, one Newick tree per line, and gets its
+own consensus. Files are processed by a pool of worker processes which import
+primconstree once, and results are yielded as soon as they are computed.
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Generator
+
+from .cache import MAX_SIZE, cached_consensus, open_cache
+from .utils import read_newicks
+
+# files of a directory taken as inputs
+TREE_EXTENSIONS = (".txt", ".nwk", ".newick", ".tre", ".tree")
+
+# (input file, consensus as Newick string or None, error message or None)
+BatchResult = tuple[str, str | None, str | None]
+
+
+def collect_inputs(paths: list[str], manifest: str | None = None) -> list[str]:
+    """List the input files of a batch
+
+    Args:
+        paths: input files, or directories whose files with an extension
+            in TREE_EXTENSIONS are taken, in name order
+        manifest: a text file listing an input file on each line, relative
+            paths being relative to the manifest directory
+
+    Return:
+        list[str]: the input files, in order
+    """
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.endswith(TREE_EXTENSIONS)
+                and os.path.isfile(os.path.join(path, name))
+            )
+        else:
+            inputs.append(path)
+
+    if manifest is not None:
+        root = os.path.dirname(manifest)
+        with open(manifest, "r") as file:
+            inputs.extend(
+                os.path.join(root, line.strip())
+                for line in file
+                if line.strip() and not line.startswith("#")
+            )
+
+    return inputs
+
+
+def consensus_file(
+    input_file: str,
+    crits: list[str],
+    cache: str | None = None,
+    cache_size: int = MAX_SIZE,
+    **args,
+) -> BatchResult:
+    """Compute the consensus of the trees of a file, errors are
+    returned instead of raised so that one bad file does not stop a batch
+
+    Args:
+        input_file: Path to the input file, with a Newick tree on each line.
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        cache: Path to a result cache (see cache.py) to look up and fill, if any.
+        cache_size: The maximal size of the results of the cache in bytes.
+        args: additional parameters of primconstree()
+    """
+    try:
+        consensus = cached_consensus(
+            read_newicks(input_file),
+            crits,
+            None if cache is None else open_cache(cache, cache_size),
+            **args,
+        )
+    except Exception as e:
+        return input_file, None, f"{type(e).__name__}: {e}"
+    return input_file, consensus, None
+
+
+def _consensus_files(
+    input_files: list[str], crits: list[str], args: dict
+) -> list[BatchResult]:
+    """Worker task, consensus of a chunk of files"""
+    return [consensus_file(f, crits, **args) for f in input_files]
+
+
+def batch_consensus(
+    input_files: list[str],
+    crits: list[str],
+    jobs: int = 1,
+    chunksize: int = 8,
+    **args,
+) -> Generator[BatchResult, None, None]:
+    """Compute the consensus of each input file, on a pool of <jobs> processes
+
+    Args:
+        input_files: the input files, with a Newick tree on each line (see collect_inputs())
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        jobs: The number of worker processes. Defaults to 1 (no pool).
+        chunksize: The number of files sent at once to a worker, larger chunks
+            lower the communication cost of small sets. Defaults to 8.
+        args: additional parameters of consensus_file() (cache, cache_size) and of
+            primconstree() (avg_on_merge, seed, engine)
+
+    Yields:
+        BatchResult: the input file, its consensus as a Newick string and an
+            error message if it failed, in order of completion
+    """
+    if jobs <= 1:
+        for input_file in input_files:
+            yield consensus_file(input_file, crits, **args)
+        return
+
+    chunks = [
+        input_files[i : i + chunksize] for i in range(0, len(input_files), chunksize)
+    ]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # keep a few chunks per worker in flight, so that results are yielded
+        # while the remaining files are still to be submitted
+        pending = set()
+        for chunk in chunks:
+            if len(pending) >= 2 * jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            pending.add(executor.submit(_consensus_files, chunk, crits, args))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
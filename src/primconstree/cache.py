@@ -0,0 +1,257 @@
+"""On-disk cache of consensus trees, for sets of trees submitted again
+
+Results are stored in an SQLite database under a key hashing the input trees
+and the parameters changing the consensus (see cache_key()). Trees are hashed
+as Newick strings, so a hit costs reading the input file and hashing it,
+without parsing or building anything.
+
+The cache is bounded in size: once the stored results exceed the maximal size,
+the least recently used are evicted. It can be shared by several processes
+(--jobs, --batch, the service and concurrent invocations): the database is in
+WAL mode and every access is a short write transaction, waiting for the others.
+Counters of hits, misses and evictions are kept in the database, across
+processes and invocations. SQLite locks are not reliable on network file
+systems, the cache should be on a local disk.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Generator
+
+from .primconstree import primconstree, write_consensus
+
+# to change whenever the consensus of some input changes, so that results of
+# a previous version are not returned
+ALGORITHM_VERSION = 1
+# maximal size of the stored results, in bytes
+MAX_SIZE = 256 << 20
+# time waiting for other processes using the cache, in seconds
+TIMEOUT = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    consensus TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_lru ON results (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES
+    ('hits', 0), ('misses', 0), ('evictions', 0), ('size', 0);
+"""
+
+
+def cache_key(
+    trees: list[str],
+    crits: list[str],
+    seed: int = 0,
+    avg_on_merge: bool = False,
+    annotate: str | None = None,
+) -> str:
+    """Hash of a consensus computation, as a hexadecimal string
+
+    Trees are taken in order, as ties are broken by the order of the nodes,
+    and stripped of surrounding spaces. The engine and the number of jobs are
+    not part of the key as they do not change the consensus, neither are the
+    functions of criteria registered under a name (see register_criterion()).
+
+    Args:
+        trees: the input trees, as Newick strings
+        crits: list of criterion to use for the MST in priority order
+        seed: The seed used to break ties in the mst
+        avg_on_merge: see primconstree()
+        annotate: see write_consensus()
+    """
+    params = {
+        "version": ALGORITHM_VERSION,
+        "crits": crits,
+        "seed": seed,
+        "avg_on_merge": avg_on_merge,
+        "annotate": annotate,
+    }
+    h = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    for tree in trees:
+        h.update(b"\n")
+        h.update(tree.strip().encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Consensus trees stored by key (see cache_key()) in an SQLite database,
+    with least recently used eviction. An instance can be used by several
+    threads, processes must open their own.
+
+    Attributes:
+        hits, misses: counters of the lookups of this instance, the ones of
+            every process using the cache are given by counters()
+    """
+
+    def __init__(self, path: str, max_size: int = MAX_SIZE) -> None:
+        """
+        Args:
+            path: the database file, created if needed
+            max_size: the maximal size of the stored results in bytes, beyond
+                which least recently used results are evicted. Defaults to MAX_SIZE.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # transactions are started explicitly, see _transaction()
+        self.db = sqlite3.connect(
+            path, timeout=TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        # executescript() commits any transaction, the script has its own
+        self.db.executescript(f"BEGIN IMMEDIATE; {_SCHEMA} COMMIT;")
+
+    @contextmanager
+    def _transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        """A write transaction, locking the database from its start: a read
+        transaction could not be upgraded once another process has written
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def _count(self, db: sqlite3.Connection, name: str, value: int) -> None:
+        db.execute(
+            "UPDATE counters SET value = value + ? WHERE name = ?", (value, name)
+        )
+
+    def get(self, key: str) -> str | None:
+        """The consensus stored under key, marked as recently used,
+        or None if there is none
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                "UPDATE results SET last_used = ? WHERE key = ? RETURNING consensus",
+                (time.time_ns(), key),
+            ).fetchone()
+            self._count(db, "hits" if row else "misses", 1)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, consensus: str) -> None:
+        """Store a consensus under key, evicting least recently used
+        results beyond the maximal size
+        """
+        size = len(key) + len(consensus.encode())
+        with self._transaction() as db:
+            old = db.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, consensus, size, time.time_ns()),
+            )
+            self._count(db, "size", size - (old[0] if old else 0))
+
+            ((total,),) = db.execute("SELECT value FROM counters WHERE name = 'size'")
+            if total <= self.max_size:
+                return
+            evicted = []
+            for k, s in db.execute("SELECT key, size FROM results ORDER BY last_used"):
+                if total <= self.max_size:
+                    break
+                evicted.append((k,))
+                total -= s
+            db.executemany("DELETE FROM results WHERE key = ?", evicted)
+            db.execute("UPDATE counters SET value = ? WHERE name = 'size'", (total,))
+            self._count(db, "evictions", len(evicted))
+
+    def counters(self) -> dict:
+        """Counters of every process using the cache, with its number of
+        results and their size in bytes
+        """
+        with self._transaction() as db:
+            counters = dict(db.execute("SELECT name, value FROM counters"))
+            ((entries,),) = db.execute("SELECT count(*) FROM results")
+        return {
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "evictions": counters["evictions"],
+            "entries": entries,
+            "size": counters["size"],
+            "max_size": self.max_size,
+        }
+
+    def close(self) -> None:
+        self.db.close()
+
+
+# caches opened by open_cache(), by process as connections can not be shared
+_caches: dict[tuple[str, int, int], ResultCache] = {}
+
+
+def open_cache(path: str, max_size: int = MAX_SIZE) -> ResultCache:
+    """The ResultCache of a file, opened once by process"""
+    key = (path, max_size, os.getpid())
+    if key not in _caches:
+        _caches[key] = ResultCache(path, max_size)
+    return _caches[key]
+
+
+def cached_consensus(
+    trees: list[str],
+    crits: list[str],
+    cache: ResultCache | None,
+    avg_on_merge: bool = False,
+    seed: int = 0,
+    annotate: str | None = None,
+    **args,
+) -> str:
+    """Compute the consensus of Newick trees with primconstree(),
+    unless it is stored in the cache
+
+    Args:
+        trees: the input trees, as Newick strings
+        crits: list of criterion to use for the MST in priority order
+        cache: the cache to look up and fill, if None the consensus is computed
+        avg_on_merge, seed: see primconstree()
+        annotate: the annotations written, see write_consensus()
+        args: additional parameters of primconstree() (engine, jobs, stats)
+
+    Return:
+        str: the consensus as a Newick string
+    """
+    if cache is None:
+        consensus = primconstree(
+            trees,
+            crits,
+            avg_on_merge=avg_on_merge,
+            seed=seed,
+            annotate=annotate is not None,
+            **args,
+        )
+        return write_consensus(consensus, annotate)
+
+    key = cache_key(trees, crits, seed, avg_on_merge, annotate)
+    newick = cache.get(key)
+    if newick is None:
+        newick = cached_consensus(
+            trees, crits, None, avg_on_merge, seed, annotate, **args
+        )
+        cache.put(key, newick)
+    return newick
@@ -0,0 +1,69 @@
+"""Criteria used to choose the edges of the MST
+
+A criterion gives a value to the direction u -> v of an edge, where u is the
+vertex already in the MST and v the fringe vertex, from the frequencies of
+both vertices, the frequency of the edge and its average length. The lower
+the value the better the edge.
+
+Criteria are looked up by name in CRITERIA, new ones can be added with
+register_criterion() and are then accepted everywhere a list of criteria
+is, e.g. the <crits> argument of primconstree().
+"""
+
+from typing import Callable
+
+# (u node_freq, v node_freq, edge_freq, avglen) -> value, the less the better
+Criterion = Callable[[int, int, int, float], float]
+
+
+def max_nfreq_out(u_freq: int, v_freq: int, edge_freq: int, avglen: float) -> float:
+    """Prefer frequent fringe vertices"""
+    return 1 / v_freq if v_freq != 0 else float("inf")
+
+
+def max_nfreq_in(u_freq: int, v_freq: int, edge_freq: int, avglen: float) -> float:
+    """Prefer frequent MST vertices"""
+    return 1 / u_freq if u_freq != 0 else float("inf")
+
+
+def max_edge_freq(u_freq: int, v_freq: int, edge_freq: int, avglen: float) -> float:
+    """Prefer frequent edges"""
+    return 1 / edge_freq
+
+
+def min_avg_len(u_freq: int, v_freq: int, edge_freq: int, avglen: float) -> float:
+    """Prefer short edges"""
+    return avglen
+
+
+CRITERIA: dict[str, Criterion] = {
+    "max_nfreq_out": max_nfreq_out,
+    "max_nfreq_in": max_nfreq_in,
+    "max_edge_freq": max_edge_freq,
+    "min_avg_len": min_avg_len,
+}
+
+# criteria of each version of the algorithm (see --version)
+VERSIONS: dict[int, list[str]] = {
+    0: ["min_avg_len", "max_edge_freq"],
+    1: ["max_edge_freq", "max_nfreq_out", "max_nfreq_in"],
+}
+
+
+def register_criterion(name: str, criterion: Criterion) -> None:
+    """Make a new criterion available under <name>
+
+    Args:
+        name: the name used in lists of criteria
+        criterion: function of (u node_freq, v node_freq, edge_freq, avglen)
+            returning the value of the edge direction u -> v, the less the better
+    """
+    CRITERIA[name] = criterion
+
+
+def get_criteria(crits: list[str]) -> list[Criterion]:
+    """Get the functions of a list of criteria names, in the same order"""
+    for c in crits:
+        if c not in CRITERIA:
+            raise Exception(f"PCT criterion {c} invalid")
+    return [CRITERIA[c] for c in crits]
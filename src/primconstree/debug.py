@@ -4,7 +4,7 @@ import ete3
 import matplotlib.pyplot as plt
 import networkx as nx
 
-from .utils import get_root_id, id_to_clade
+from .utils import get_leaf_ids, get_root_id, id_to_clade
 
 
 def draw_graph(
@@ -23,7 +23,7 @@ def draw_graph(
     pos = nx.spring_layout(graph)
 
     # Draw nodes and edges
-    leaf_nodes = [1 << i for i in range(len(taxa))]
+    leaf_nodes = get_leaf_ids(taxa)
     node_colors = [
         "red" if node in leaf_nodes else "lightblue" for node in graph.nodes()
     ]
@@ -95,7 +95,7 @@ def draw_mst(
     pos = nx.spring_layout(graph)
 
     # Draw nodes and edges
-    leaf_nodes = [1 << i for i in range(len(taxa))]
+    leaf_nodes = get_leaf_ids(taxa)
     node_colors = [
         (
             "green"
@@ -0,0 +1,288 @@
+"""Supergraph built on disk, for inputs whose supergraph does not fit in memory
+
+Node and edge counters are upserted by batches of trees into an SQLite
+database, so that only the counters of the current batch and the SQLite page
+cache are held in memory. The supergraph is then written in the binary format
+of storage.py by streaming queries sorted by SQLite, and loaded with memory
+mapping: Prim's algorithm reads the graph arrays and the clade ids (looked up
+by binary search, see storage.MappedIds) through the page cache, which the OS
+bounds and evicts under memory pressure. Memory is not bounded past the
+construction though: the per node state of the MST, the compiled keys (see
+SuperGraph.compile_keys()) and the lists of mst_to_consensus() hold an entry
+per node or per edge.
+
+Nodes and edges are numbered in order of first appearance and edge lengths are
+summed in input order as in SuperGraph.from_trees(), so the consensus is the
+same as with the in-memory engines.
+
+Files are created in the system temporary directory unless a directory is
+given, set TMPDIR to a directory on disk where /tmp is held in memory (tmpfs).
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import tempfile
+from array import array
+from typing import TYPE_CHECKING, Generator, Iterable
+
+from .newick import encode_tree
+from .storage import load_supergraph, write_supergraph
+from .supergraph import SuperGraph
+from .utils import get_taxa_ids
+
+if TYPE_CHECKING:
+    import ete3
+
+# number of node records held in memory before they are upserted
+BATCH_SIZE = 50_000
+# size of the SQLite page cache, in bytes
+CACHE_SIZE = 16 << 20
+# number of rows fetched at once when writing the supergraph file
+FETCH_SIZE = 65_536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    idx INTEGER PRIMARY KEY,
+    clade BLOB NOT NULL UNIQUE,
+    freq INTEGER NOT NULL,
+    is_leaf INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    eid INTEGER PRIMARY KEY,
+    parent BLOB NOT NULL,
+    child BLOB NOT NULL,
+    freq INTEGER NOT NULL,
+    lensum REAL NOT NULL,
+    UNIQUE (parent, child)
+);
+CREATE TEMP TABLE batch (parent BLOB NOT NULL, child BLOB NOT NULL);
+"""
+
+
+def _blob(nid: int) -> bytes:
+    """Canonical encoding of a clade id, as big endian bytes"""
+    return nid.to_bytes(-(-nid.bit_length() // 8), "big")
+
+
+class DiskGraphBuilder:
+    """Supergraph counters stored in an SQLite database, filled by batches
+    of trees. The parent of an edge is always the larger clade, so edges are
+    keyed on (parent, child) as SuperGraph.from_trees() keys them on ordered
+    node indices.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        taxa: list[str],
+        batch_size: int = BATCH_SIZE,
+        cache_size: int = CACHE_SIZE,
+    ) -> None:
+        """
+        Args:
+            db_path: the SQLite database file, counters are added to the ones
+                it already holds
+            taxa: the ordered list of taxa
+            batch_size: the number of node records held in memory before they
+                are upserted. Defaults to BATCH_SIZE.
+            cache_size: the size of the SQLite page cache in bytes. Defaults to CACHE_SIZE.
+        """
+        self.taxa = taxa
+        self.taxa_ids = get_taxa_ids(taxa)
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(db_path)
+        self.db.execute(f"PRAGMA cache_size = -{max(1, cache_size >> 10)}")
+        self.db.execute("PRAGMA temp_store = FILE")
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.executescript(_SCHEMA)
+
+        # counters of the current batch, in order of first appearance:
+        # clade -> [frequency, is leaf] and (parent, child) -> lengths
+        self.nodes: dict[int, list] = {}
+        self.edges: dict[tuple[int, int], list[float]] = {}
+        self.nb_records = 0
+
+    def add_tree(self, tree: ete3.Tree | str) -> None:
+        """Add the nodes and edges of a tree (ete3.Tree or Newick string)"""
+        nodes, edges = self.nodes, self.edges
+        records = encode_tree(tree, self.taxa_ids)
+        for nid, pid, dist, leaf in records:
+            node = nodes.get(nid)
+            if node is None:
+                node = nodes[nid] = [0, leaf]
+            if pid != -1:
+                node[0] += 1
+                edges.setdefault((pid, nid), []).append(dist)
+
+        self.nb_records += len(records)
+        if self.nb_records >= self.batch_size:
+            self.flush()
+
+    def add_trees(self, trees: Iterable[ete3.Tree | str]) -> None:
+        """Add the nodes and edges of every tree"""
+        for tree in trees:
+            self.add_tree(tree)
+        self.flush()
+
+    def flush(self) -> None:
+        """Upsert the counters of the current batch"""
+        if not self.nodes:
+            return
+
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO nodes (clade, freq, is_leaf) VALUES (?, ?, ?) "
+                "ON CONFLICT (clade) DO UPDATE SET freq = freq + excluded.freq",
+                ((_blob(nid), f, leaf) for nid, (f, leaf) in self.nodes.items()),
+            )
+
+            # lengths are summed in input order from the stored sums,
+            # as floating point sums depend on the order
+            keys = [(_blob(p), _blob(c)) for p, c in self.edges]
+            self.db.executemany("INSERT INTO batch VALUES (?, ?)", keys)
+            stored = {
+                (p, c): lensum
+                for p, c, lensum in self.db.execute(
+                    "SELECT e.parent, e.child, e.lensum FROM batch AS b "
+                    "JOIN edges AS e ON e.parent = b.parent AND e.child = b.child"
+                )
+            }
+            self.db.execute("DELETE FROM batch")
+
+            def rows() -> Generator[tuple, None, None]:
+                for key, dists in zip(keys, self.edges.values()):
+                    lensum = stored.get(key, 0.0)
+                    for d in dists:
+                        lensum += d
+                    yield (*key, len(dists), lensum)
+
+            self.db.executemany(
+                "INSERT INTO edges (parent, child, freq, lensum) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (parent, child) DO UPDATE "
+                "SET freq = freq + excluded.freq, lensum = excluded.lensum",
+                rows(),
+            )
+
+        self.nodes, self.edges = {}, {}
+        self.nb_records = 0
+
+    def _column(self, query: str, typecode: str) -> Generator[bytes, None, None]:
+        """The first column of a query, as chunks of a typed array"""
+        cursor = self.db.execute(query)
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            yield array(typecode, (row[0] for row in rows)).tobytes()
+
+    def save(self, path: str) -> None:
+        """Write the supergraph file (see storage.py), sorting and
+        streaming the tables with SQLite
+        """
+        self.flush()
+        db = self.db
+        ((n,),) = db.execute("SELECT count(*) FROM nodes")
+        ((m,),) = db.execute("SELECT count(*) FROM edges")
+        ((mask_bytes,),) = db.execute("SELECT max(length(clade)) FROM nodes")
+        mask_bytes = mask_bytes or 1
+
+        # the adjacency of each node, slots are in edge order in each row as
+        # in SuperGraph.from_edges(), indices are 0 based
+        db.executescript("""
+            DROP TABLE IF EXISTS temp.slots;
+            CREATE TEMP TABLE slots AS
+                SELECT p.idx - 1 AS u, c.idx - 1 AS v, e.eid - 1 AS e
+                FROM edges AS e
+                JOIN nodes AS p ON p.clade = e.parent
+                JOIN nodes AS c ON c.clade = e.child;
+            INSERT INTO slots SELECT v, u, e FROM slots;
+            CREATE INDEX temp.slots_order ON slots (u, e);
+            """)
+
+        def masks() -> Generator[bytes, None, None]:
+            cursor = db.execute("SELECT clade FROM nodes ORDER BY idx")
+            while rows := cursor.fetchmany(FETCH_SIZE):
+                yield b"".join(
+                    int.from_bytes(clade, "big").to_bytes(mask_bytes, "little")
+                    for (clade,) in rows
+                )
+
+        def indptr() -> Generator[bytes, None, None]:
+            degrees = db.execute("SELECT u, count(*) FROM slots GROUP BY u ORDER BY u")
+            total, chunk, u = 0, array("q", [0]), 0
+            for v, degree in degrees:
+                # nodes without edges only appear with a single tree of one leaf
+                chunk.extend([total] * (v - u))
+                u = v + 1
+                total += degree
+                chunk.append(total)
+                if len(chunk) >= FETCH_SIZE:
+                    yield chunk.tobytes()
+                    chunk = array("q")
+            chunk.extend([total] * (n - u))
+            yield chunk.tobytes()
+
+        write_supergraph(
+            path,
+            self.taxa,
+            n,
+            m,
+            mask_bytes,
+            [
+                masks(),
+                # clade blobs are big endian without leading zeros, so
+                # sorting on length first sorts them as integers
+                self._column(
+                    "SELECT idx - 1 FROM nodes ORDER BY length(clade), clade", "q"
+                ),
+                self._column("SELECT freq FROM nodes ORDER BY idx", "q"),
+                self._column("SELECT is_leaf FROM nodes ORDER BY idx", "B"),
+                indptr(),
+                self._column("SELECT v FROM slots ORDER BY u, e", "q"),
+                self._column("SELECT e FROM slots ORDER BY u, e", "q"),
+                self._column("SELECT freq FROM edges ORDER BY eid", "q"),
+                self._column("SELECT lensum FROM edges ORDER BY eid", "d"),
+            ],
+        )
+        db.execute("DROP TABLE temp.slots")
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def build_disk_graph(
+    trees: Iterable[ete3.Tree | str],
+    taxa: list[str],
+    path: str | None = None,
+    directory: str | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> SuperGraph:
+    """Build the supergraph of the trees on disk and load it with memory mapping
+
+    Args:
+        trees: the input trees, as ete3.Tree or Newick strings, read once
+        taxa: the ordered list of taxa
+        path: the supergraph file to write, that can be loaded again with
+            storage.load_supergraph(). If None, a temporary file is used.
+        directory: the directory of the temporary files, the system
+            temporary directory if None.
+        batch_size: see DiskGraphBuilder
+
+    Return:
+        SuperGraph: the supergraph, whose arrays are memory mapped
+    """
+    with tempfile.TemporaryDirectory(
+        dir=directory, prefix="pct-", ignore_cleanup_errors=True
+    ) as tmp:
+        builder = DiskGraphBuilder(os.path.join(tmp, "supergraph.db"), taxa, batch_size)
+        try:
+            builder.add_trees(trees)
+            if path is None:
+                path = os.path.join(tmp, "supergraph.pct")
+            builder.save(path)
+        finally:
+            builder.close()
+
+        # the mapping stays valid once the temporary file is removed
+        sg, _ = load_supergraph(path)
+    return sg
@@ -0,0 +1,39 @@
+"""Heavy dependencies imported on first use
+
+Importing ete3 or networkx takes longer than a small consensus, so the
+modules of primconstree refer to them through these proxies: importing the
+package, starting the CLI or a worker process does not pay for them, and
+only the code paths that use them do. Modules postpone the evaluation of
+annotations and import the real modules for type checking only:
+
+    from __future__ import annotations
+
+    from typing import TYPE_CHECKING
+
+    if TYPE_CHECKING:
+        import ete3
+    else:
+        from .lazy import ete3
+
+matplotlib is only used by debug.py, which is itself imported on demand.
+"""
+
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """Proxy of a module, imported on first attribute access"""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+ete3 = LazyModule("ete3")
+nx = LazyModule("networkx")
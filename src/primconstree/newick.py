@@ -0,0 +1,271 @@
+"""Lightweight Newick reader that goes straight from text to the clade edges
+used by the supergraph, without building ete3 trees
+
+A tree is encoded as a list of records (node id, parent id, length, is leaf),
+one per node in preorder, where ids are clade ids as given by clade_to_id()
+and the parent id of the root is -1. Lengths follow ete3 conventions: a
+missing length is 1.0 (0.0 for the root, whose length is unused anyway).
+Comments in brackets, e.g. NHX annotations "[&&NHX:S=human]", are skipped.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Generator, Iterable
+
+from .utils import Record, get_leaf_id, get_taxa_ids, tree_to_records
+
+if TYPE_CHECKING:
+    import ete3
+
+
+# a comment, a delimiter or the text between them
+_TOKEN = re.compile(r"\[[^\]]*\]|[(),:;]|[^(),:;\[]+")
+
+
+def _tokens(newick: str) -> list[str]:
+    """Split a Newick string into tokens, without its comments"""
+    return [tok for tok in _TOKEN.findall(newick) if tok[0] != "["]
+
+
+def parse_newick(newick: str, taxa_ids: dict[str, int]) -> list[Record]:
+    """Encode a Newick string (ete3 format 0, one tree) into records,
+    in a single pass over its tokens.
+
+    Args:
+        newick: the tree in Newick format
+        taxa_ids: the leaf ids, as given by get_taxa_ids()
+
+    Return:
+        list[Record]: a record for each node of the tree, in preorder
+    """
+    ids, parents, dists, leaves = parse_newick_nodes(newick, taxa_ids)
+    return [
+        (ids[i], ids[p] if p != -1 else -1, dists[i], leaves[i])
+        for i, p in enumerate(parents)
+    ]
+
+
+def parse_newick_nodes(
+    newick: str, taxa_ids: dict[str, int], supports: dict[int, float] | None = None
+) -> tuple[list[int], list[int], list[float], list[bool]]:
+    """Parse a Newick string like parse_newick(), into the attributes of
+    its nodes in preorder, parents given by position (see treestore.py)
+
+    Args:
+        newick: the tree in Newick format
+        taxa_ids: the leaf ids, as given by get_taxa_ids()
+        supports: if given, filled with the support of the internal nodes
+            having one, by position
+
+    Return:
+        tuple: the clade id, the position of the parent (-1 for the root),
+            the length and whether it is a leaf, of each node
+
+    An exception is raised if the string is not a single tree ending with ';'
+    or if a leaf is not one of the taxa.
+    """
+    # node attributes, indexed by preorder position
+    ids: list[int] = []
+    parents: list[int] = []
+    dists: list[float] = []
+    leaves: list[bool] = []
+
+    stack: list[int] = []  # open internal nodes
+    last = -1  # last completed node, the one a ':' length applies to
+    expect_node = True  # whether the next label starts a new node
+
+    def new_node(nid: int, is_leaf: bool) -> int:
+        i = len(ids)
+        ids.append(nid)
+        parents.append(stack[-1] if stack else -1)
+        dists.append(1.0 if stack else 0.0)
+        leaves.append(is_leaf)
+        return i
+
+    def invalid(reason: str) -> Exception:
+        return Exception(f"PCT invalid newick, {reason}: '{newick.strip()}'")
+
+    tokens = _tokens(newick)
+    if next((tok for tok in tokens if tok.strip()), None) != "(":
+        raise invalid("a tree must start with '('")
+    k = 0
+    while k < len(tokens):
+        tok = tokens[k]
+        k += 1
+        if tok in "(," and not stack and ids:
+            raise invalid("text after the root")
+        if tok == "(":
+            if not expect_node:
+                raise invalid("missing ','")
+            stack.append(new_node(0, False))
+            expect_node = True
+        elif tok in ",);" and expect_node:
+            # empty leaf, e.g. "(A,)"
+            last = new_node(0, True)
+            expect_node = False
+            k -= 1
+        elif tok == ",":
+            expect_node = True
+        elif tok == ")":
+            if not stack:
+                raise invalid("unmatched ')'")
+            last = stack.pop()
+            if stack:
+                ids[stack[-1]] += ids[last]
+        elif tok == ":":
+            # the length may be missing, e.g. "A:,B"
+            if k < len(tokens) and tokens[k] not in "(),:;":
+                length = tokens[k].strip()
+                k += 1
+                if length:
+                    try:
+                        dists[last] = float(length)
+                    except ValueError:
+                        raise invalid(f"length '{length}' is not a number")
+        elif tok == ";":
+            if stack:
+                raise invalid("unmatched '('")
+            if any(tok.strip() for tok in tokens[k:]):
+                raise invalid("text after ';'")
+            break
+        else:
+            name = tok.strip()
+            if not name:
+                continue
+            if expect_node:
+                nid = get_leaf_id(name, taxa_ids)
+                last = new_node(nid, True)
+                if stack:
+                    ids[stack[-1]] += nid
+                expect_node = False
+            elif supports is not None:
+                # the support of an internal node, ignored if not a number
+                try:
+                    supports[last] = float(name)
+                except ValueError:
+                    pass
+
+    else:
+        raise invalid("missing ';'")
+
+    return ids, parents, dists, leaves
+
+
+def newick_taxa(newick: str) -> list[str]:
+    """Get the leaf names of a Newick string without parsing the tree"""
+    names = []
+    expect_node = True
+    for tok in _tokens(newick):
+        if tok == ";":
+            break
+        if tok in "(,":
+            expect_node = True
+        elif tok in "):":
+            expect_node = False
+        elif expect_node and tok.strip():
+            names.append(tok.strip())
+            expect_node = False
+    return names
+
+
+def iter_newicks(input_file: str) -> Generator[str, None, None]:
+    """Lazily yield the Newick strings of a file with a tree on each line,
+    only one line is held in memory at a time
+    """
+    with open(input_file, "r") as file:
+        for line in file:
+            if line.strip():
+                yield line.strip()
+
+
+def iter_records(
+    input_file: str, taxa: list[str] | None = None
+) -> Generator[list[Record], None, None]:
+    """Lazily yield the encoded trees of a file with a tree on each line
+
+    Args:
+        input_file: Path to the input file.
+        taxa: the ordered list of taxa to map against, by default the
+            sorted leaf names of the first tree
+    """
+    taxa_ids = None
+    for newick in iter_newicks(input_file):
+        if taxa_ids is None:
+            taxa_ids = get_taxa_ids(taxa or sorted(newick_taxa(newick)))
+        yield parse_newick(newick, taxa_ids)
+
+
+def encode_tree(
+    tree: ete3.Tree | str | list[Record], taxa_ids: dict[str, int]
+) -> list[Record]:
+    """Encode a tree given either as ete3.Tree or as Newick string into records,
+    a tree already encoded (e.g. read from a TreeStore, see treestore.py) is
+    returned as is
+    """
+    if isinstance(tree, list):
+        return tree
+    if isinstance(tree, str):
+        return parse_newick(tree, taxa_ids)
+    return tree_to_records(tree, taxa_ids)
+
+
+def get_taxa(tree: ete3.Tree | str) -> list[str]:
+    """Get the sorted taxa of a tree given either as ete3.Tree or as Newick string"""
+    if isinstance(tree, str):
+        return sorted(newick_taxa(tree))
+    return sorted(tree.get_leaf_names())
+
+
+def exact_clade_ids(records: list[Record], leaf_bits: dict[int, int]) -> list[int]:
+    """Get the bitmask of the clade of each node of an encoded tree,
+    whatever its ids, from the bit of each leaf id
+
+    Args:
+        records: the tree, as given by encode_tree()
+        leaf_bits: the bitmask of each leaf id, the single bit of its taxon
+
+    Return:
+        list[int]: the bitmask of each node, in the order of the records
+    """
+    masks = [leaf_bits.get(nid, 0) if is_leaf else 0 for nid, _, _, is_leaf in records]
+    parents = []
+    stack: list[int] = []  # ancestors of the current node, by position
+    for i, (nid, pid, _, _) in enumerate(records):
+        while stack and records[stack[-1]][0] != pid:
+            stack.pop()
+        if pid != -1 and not stack:
+            raise Exception(f"Clade id {pid} collision")
+        parents.append(stack[-1] if stack else -1)
+        stack.append(i)
+    for i in range(len(records) - 1, 0, -1):
+        masks[parents[i]] |= masks[i]
+    return masks
+
+
+def check_clade_ids(
+    trees: Iterable[ete3.Tree | str | list[Record]], taxa: list[str]
+) -> int:
+    """Check that the clade ids of the trees identify clades exactly, which
+    matters for fingerprint ids (see utils.get_leaf_ids()), by keeping the
+    bitmask of the clade of each id and comparing it with the bitmask of
+    every other clade getting the same id.
+
+    Args:
+        trees: the trees, as ete3.Tree, Newick strings or encoded trees
+            (e.g. a TreeStore)
+        taxa: the ordered list of taxa
+
+    Return:
+        int: the number of distinct clades, an exception is raised if two
+            different clades share an id
+    """
+    taxa_ids = get_taxa_ids(taxa)
+    leaf_bits = {leaf_id: 1 << i for i, leaf_id in enumerate(taxa_ids.values())}
+    clades: dict[int, int] = {}
+    for t in trees:
+        records = encode_tree(t, taxa_ids)
+        for (nid, _, _, _), exact in zip(records, exact_clade_ids(records, leaf_bits)):
+            if clades.setdefault(nid, exact) != exact:
+                raise Exception(f"Clade id {nid} collision")
+    return len(clades)
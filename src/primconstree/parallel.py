@@ -0,0 +1,120 @@
+"""Build the supergraph on several processes
+
+The input trees are split in contiguous shards, each shard is turned into a
+partial supergraph by a worker process and the partial supergraphs are merged
+in shard order. Nodes and edges are inserted in order of first appearance and
+edge lengths are summed in tree order, so the merged graph is identical (node
+order, adjacency order and float values) to the one of build_graph().
+
+Only the encoding of the trees and the counting of a shard run in parallel,
+the merge runs in the parent afterwards and bounds the speed-up. Keeping float
+sums identical to the serial ones, whatever the number of jobs, requires the
+lengths of each edge in tree order, so shards send back every length rather
+than their sums. On the 5000 random trees of 50 taxa of scripts/bench_jobs.py
+the shards take 2.5 s to build on a single core, their merge 1.2 to 1.4 s from
+2 to 16 shards, where the merge cost is that of the 150k nodes and 300k edges
+of the shards, the folding of the lengths is under 0.1 s of it. The pickled
+shards take 19 to 21 MB, of which 3.9 MB of lengths.
+"""
+
+from __future__ import annotations
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import TYPE_CHECKING
+
+from .newick import encode_tree
+from .utils import get_taxa_ids
+
+if TYPE_CHECKING:
+    import ete3
+    import networkx as nx
+else:
+    from .lazy import nx
+
+
+# A partial supergraph:
+# - nodes: node id -> [node_freq, is_leaf]
+# - edges: (parent id, node id) -> lengths of the edge, in tree order
+Shard = tuple[dict[int, list], dict[tuple[int, int], array]]
+
+
+def build_shard(trees: list[ete3.Tree] | list[str], taxa: list[str]) -> Shard:
+    """Build the partial supergraph of a shard of trees,
+    trees given as Newick strings are encoded here, in the worker.
+    """
+    nodes: dict[int, list] = {}
+    edges: dict[tuple[int, int], array] = {}
+    taxa_ids = get_taxa_ids(taxa)
+
+    for t in trees:
+        for nid, pid, dist, is_leaf in encode_tree(t, taxa_ids):
+            if nid not in nodes:
+                nodes[nid] = [0, is_leaf]
+
+            if pid != -1:
+                nodes[nid][0] += 1
+                # the parent clade contains the child clade,
+                # so (parent, node) identifies the undirected edge
+                key = (pid, nid)
+                if key not in edges:
+                    edges[key] = array("d")
+                edges[key].append(dist)
+
+    return nodes, edges
+
+
+def merge_shards(shards: list[Shard]) -> nx.Graph:
+    """Merge partial supergraphs, in the order of their trees,
+    into the supergraph, and compute average edge length
+    """
+    nodes: dict[int, list] = {}
+    edges: dict[tuple[int, int], list] = {}
+
+    for shard_nodes, shard_edges in shards:
+        for nid, (freq, is_leaf) in shard_nodes.items():
+            if nid in nodes:
+                nodes[nid][0] += freq
+            else:
+                nodes[nid] = [freq, is_leaf]
+
+        for key, lengths in shard_edges.items():
+            if key not in edges:
+                edges[key] = [0, 0]
+            acc = edges[key]
+            # fold lengths one by one so the float sum is the serial one
+            for length in lengths:
+                acc[0] += length
+            acc[1] += len(lengths)
+
+    graph = nx.Graph()
+    for nid, (freq, is_leaf) in nodes.items():
+        graph.add_node(nid, node_freq=freq, is_leaf=is_leaf)
+    for (pid, nid), (total, freq) in edges.items():
+        graph.add_edge(pid, nid, avglen=total / freq, edge_freq=freq)
+
+    return graph
+
+
+def build_graph_parallel(
+    trees: list[ete3.Tree] | list[str], taxa: list[str], jobs: int
+) -> nx.Graph:
+    """Build the supergraph like build_graph(), with <jobs> worker processes
+
+    Args:
+        trees: the input trees, as ete3.Tree or Newick strings (faster,
+            since encoding is then done by the workers from the text)
+        taxa: the ordered list of taxa
+        jobs: the number of worker processes
+
+    Return:
+        nx.Graph: the supergraph
+    """
+    size = max(1, -(-len(trees) // jobs))
+    chunks = [trees[i : i + size] for i in range(0, len(trees), size)]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        shards = list(executor.map(build_shard, chunks, repeat(taxa)))
+
+    return merge_shards(shards)
@@ -1,28 +1,56 @@
 """Module in charge of generating the consensus tree using the PrimConsTree algorithm"""
 
-import ete3
+from __future__ import annotations
 
-from .algorithm import build_graph, build_mst, remove_unecessary_nodes
-from .debug import draw_graph, draw_tree
-from .utils import get_root_id, id_to_clade
+from typing import TYPE_CHECKING
+
+from .algorithm import (
+    ANNOTATIONS,
+    annotate_consensus,
+    build_graph,
+    mst_to_consensus,
+    mst_to_tree,
+    remove_unecessary_nodes,
+    run_mst,
+)
+from .diskgraph import build_disk_graph
+from .newick import check_clade_ids, get_taxa
+from .stats import Stats, phase
+from .supergraph import SuperGraph
+from .treestore import TreeStore
+from .utils import MAX_BITMASK_TAXA, get_root_id, id_to_clade
+
+if TYPE_CHECKING:
+    import ete3
+    import networkx as nx
+else:
+    from .lazy import ete3
 
 
 def primconstree(
-    trees: list[ete3.Tree],
+    trees: list[ete3.Tree] | list[str] | TreeStore,
     crits: list[str],
     avg_on_merge: bool = False,
     debug: bool = False,
     seed: int = 0,
+    engine: str = "csr",
+    jobs: int = 1,
+    stats: Stats | None = None,
+    annotate: bool = False,
 ) -> ete3.Tree:
     """Generate the consensus tree from a set of phylogenetic trees
        using the PrimConsTree algorithm
 
     Args:
-        inputs: list of input trees
+        inputs: list of input trees, as ete3.Tree or Newick strings (faster, see newick.py), or a TreeStore of already encoded trees (see treestore.py)
         crits: list of criterion to use for the MST in priority order. Valid crit are "max_edge_freq", "max_nfreq_out" (fringe vertex), "max_nfreq_in" (mst vertex), "min_avg_len".
         avg_on_merge: By default, branch length are summed in remove_unecessary_nodes, if True average is computed instead (see --help for more info). Defaults to False.
-        debug: If True, display informations at different steps, including graph, mst and tree plots.
+        debug: If True, display informations at different steps, including graph, mst and tree plots. The clade ids are checked for collisions (see check_ids()), as with stats.
         seed: The seed used to break ties in the mst
+        engine: The supergraph representation, "csr" (default) for the array-backed SuperGraph, whose MST compares keys compiled once (see SuperGraph.compile_keys()), "networkx" for a networkx graph or "disk" for a SuperGraph built on disk and memory mapped (see diskgraph.py). All give the same consensus.
+        jobs: The number of processes used to build the supergraph. Defaults to 1.
+        stats: If given, filled with the runtime statistics of each phase (see stats.Stats).
+        annotate: If True, each clade is annotated with its frequency, support and edge statistics taken from the supergraph (see annotate_consensus() and write_consensus()).
 
     Returns:
         ete3.Tree: the consensus tree
@@ -30,30 +58,143 @@ def primconstree(
     if not trees:
         return ete3.Tree()
 
-    taxa = sorted(trees[0].get_leaf_names())
+    taxa = input_taxa(trees)
     if debug:
         print("PCT: " + "Generating PrimConsTree")
         print("PCT: " + f"Building consensus on taxa: {str(taxa)}")
+    if debug or stats is not None:
+        check_ids(trees, taxa, stats)
 
-    graph = build_graph(trees, taxa)
+    with phase(stats, "build_graph"):
+        graph = build_supergraph(trees, taxa, engine, jobs)
     if debug:
+        from .debug import draw_graph  # imports matplotlib
+
         print("PCT: " + f"SuperGraph generated")
-        draw_graph(graph, taxa)
+        draw_graph(graph.to_graph() if isinstance(graph, SuperGraph) else graph, taxa)
+
+    return graph_to_consensus(
+        graph, taxa, crits, avg_on_merge, debug, seed, stats, annotate
+    )
+
+
+def input_taxa(trees: list[ete3.Tree] | list[str] | TreeStore) -> list[str]:
+    """The ordered taxa of the input trees: the sorted leaf names of the
+    first tree, or the taxa a TreeStore was encoded with
+    """
+    if isinstance(trees, TreeStore):
+        return trees.taxa
+    return get_taxa(trees[0])
+
+
+def check_ids(
+    trees: list[ete3.Tree] | list[str] | TreeStore,
+    taxa: list[str],
+    stats: Stats | None = None,
+) -> None:
+    """Check that the clade ids of the input trees identify clades exactly
+    (see newick.check_clade_ids()), which may only fail for fingerprint ids,
+    above MAX_BITMASK_TAXA taxa. This costs another pass over the trees,
+    done with stats or debug only.
+    """
+    if len(taxa) > MAX_BITMASK_TAXA:
+        with phase(stats, "check_clade_ids"):
+            check_clade_ids(trees, taxa)
+
+
+def build_supergraph(
+    trees: list[ete3.Tree] | list[str] | TreeStore,
+    taxa: list[str],
+    engine: str = "csr",
+    jobs: int = 1,
+) -> nx.Graph | SuperGraph:
+    """Build the supergraph of the input trees with the given engine,
+    see primconstree() for the arguments
 
+    Returns:
+        nx.Graph | SuperGraph: the supergraph, with average edge lengths
+    """
+    if engine == "networkx":
+        return build_graph(trees, taxa, jobs)
+    elif engine == "csr" and jobs > 1:
+        return SuperGraph.from_graph(build_graph(trees, taxa, jobs))
+    elif engine == "csr":
+        return SuperGraph.from_trees(trees, taxa)
+    elif engine == "disk":
+        return build_disk_graph(trees, taxa)
+    else:
+        raise Exception(f"PCT engine {engine} invalid")
+
+
+def graph_to_consensus(
+    graph: nx.Graph | SuperGraph,
+    taxa: list[str],
+    crits: list[str],
+    avg_on_merge: bool = False,
+    debug: bool = False,
+    seed: int = 0,
+    stats: Stats | None = None,
+    annotate: bool = False,
+) -> ete3.Tree:
+    """Generate the consensus tree from an already built supergraph
+       (with average edge lengths), see primconstree() for the arguments
+
+    Returns:
+        ete3.Tree: the consensus tree
+    """
     root = get_root_id(taxa)
-    if debug:
-        print("PCT: " + f"Searching MST from root f{root}")
-    mst = build_mst(graph, root, taxa, crits, seed)
-    if debug:
-        print("PCT: " + f"MST found")
-        draw_tree(mst, taxa)
+    if not debug:
+        with phase(stats, "mst"):
+            pushes = run_mst(graph, root, taxa, crits, seed)
+        with phase(stats, "consensus"):
+            consensus = mst_to_consensus(graph, taxa, avg_on_merge)
+        if annotate:
+            with phase(stats, "annotate"):
+                annotate_consensus(consensus, graph, taxa)
+        if stats is not None:
+            stats.record(graph, taxa, pushes, consensus)
+        return consensus
 
-    remove_unecessary_nodes(mst, taxa, avg_on_merge)
-    if debug:
-        print("PCT: " + "Unecessary internal nodes removed")
-        draw_tree(mst, taxa)
+    # step by step, to draw the intermediate trees
+    from .debug import draw_tree  # imports matplotlib
+
+    print("PCT: " + f"Searching MST from root f{root}")
+    with phase(stats, "mst"):
+        pushes = run_mst(graph, root, taxa, crits, seed)
+    with phase(stats, "mst_to_tree"):
+        mst = mst_to_tree(graph)
+    print("PCT: " + f"MST found")
+    draw_tree(mst, taxa)
+
+    with phase(stats, "remove_unecessary_nodes"):
+        remove_unecessary_nodes(mst, taxa, avg_on_merge)
+    print("PCT: " + "Unecessary internal nodes removed")
+    draw_tree(mst, taxa)
 
     for l in mst.get_leaves():
         l.name = id_to_clade(int(l.name), taxa)[0]
+    if annotate:
+        with phase(stats, "annotate"):
+            annotate_consensus(mst, graph, taxa)
 
+    if stats is not None:
+        stats.record(graph, taxa, pushes, mst)
     return mst
+
+
+def write_consensus(consensus: ete3.Tree, annotate: str | None = None) -> str:
+    """Write a consensus as a Newick string, with the annotations of
+    annotate_consensus() if any
+
+    Args:
+        consensus: the consensus tree
+        annotate: None for the tree only, "support" for the support of each
+            clade as Newick support values, "nhx" for all annotations as NHX
+            tags (see ANNOTATIONS)
+    """
+    if annotate is None or annotate == "support":
+        return consensus.write()
+    elif annotate == "nhx":
+        return consensus.write(features=list(ANNOTATIONS))
+    else:
+        raise Exception(f"PCT annotate {annotate} invalid")
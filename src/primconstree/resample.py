@@ -0,0 +1,184 @@
+"""Jackknife and bootstrap consensus, to measure how stable the consensus is
+
+Replicates are random subsets of the input trees: a fraction of the trees
+drawn without replacement (jackknife) or with replacement (bootstrap). Each
+input tree is encoded once, the supergraph of each replicate is aggregated from
+the encoded trees (see SuperGraph.from_records()) and its consensus computed,
+possibly on several processes, each receiving the encoded trees once. The
+clades of the consensus trees of the replicates are counted, and the support of
+each clade of the consensus of all trees is the percentage of replicates whose
+consensus has it.
+
+The subsets of every replicate are drawn from the seed before the replicates
+are computed, so results do not depend on the number of processes. Trees of a
+replicate are taken in input order, so that the tie breaking of the MST
+follows the input as with all trees.
+"""
+
+from __future__ import annotations
+
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Generator
+
+from .newick import encode_tree
+from .primconstree import graph_to_consensus
+from .supergraph import SuperGraph
+from .utils import Record, get_taxa_ids
+
+if TYPE_CHECKING:
+    import ete3
+
+METHODS = ("jackknife", "bootstrap")
+# fraction of the input trees in each replicate, by default
+DEFAULT_FRACTIONS = {"jackknife": 0.5, "bootstrap": 1.0}
+
+# encoded trees and parameters of a worker process, set by _init_worker()
+_worker: tuple = ()
+
+
+def _init_worker(
+    records: list[list[Record]],
+    taxa: list[str],
+    crits: list[str],
+    avg_on_merge: bool,
+    seed: int,
+) -> None:
+    global _worker
+    _worker = (records, taxa, crits, avg_on_merge, seed)
+
+
+def consensus_clades(
+    consensus: ete3.Tree, taxa_ids: dict[str, int]
+) -> Generator[tuple[ete3.Tree, int], None, None]:
+    """The internal nodes of a consensus, except the root, in postorder,
+    with the id of their clade (see clade_to_id())
+    """
+    ids: dict[ete3.Tree, int] = {}
+    for node in consensus.traverse("postorder"):
+        if node.is_leaf():
+            ids[node] = taxa_ids[node.name]
+            continue
+        # the id of a clade is the sum of the ids of its leaves
+        ids[node] = sum(ids[c] for c in node.children)
+        if node.up is not None:
+            yield node, ids[node]
+
+
+def _replicate_chunk(
+    replicates: list[list[int]],
+) -> tuple[Counter[int], dict[int, list[str]]]:
+    """Count the clades of the consensus of each replicate, given as the
+    indices of its trees, in the worker
+
+    Return:
+        tuple: the number of consensus having each clade, by clade id,
+            and the taxa of each clade
+    """
+    records, taxa, crits, avg_on_merge, seed = _worker
+    taxa_ids = get_taxa_ids(taxa)
+    counts: Counter[int] = Counter()
+    clades: dict[int, list[str]] = {}
+    for indices in replicates:
+        graph = SuperGraph.from_records(records[i] for i in indices)
+        consensus = graph_to_consensus(graph, taxa, crits, avg_on_merge, seed=seed)
+        for node, clade_id in consensus_clades(consensus, taxa_ids):
+            counts[clade_id] += 1
+            if clade_id not in clades:
+                clades[clade_id] = sorted(node.get_leaf_names())
+    return counts, clades
+
+
+def draw_replicates(
+    nb_trees: int, replicates: int, method: str, fraction: float, seed: int
+) -> list[list[int]]:
+    """Draw the indices of the trees of each replicate, in input order
+
+    Args:
+        nb_trees: the number of input trees
+        replicates: the number of replicates
+        method: "jackknife" (without replacement) or "bootstrap" (with replacement)
+        fraction: the number of trees of each replicate, as a fraction of nb_trees
+        seed: the seed of the draws
+    """
+    if method not in METHODS:
+        raise Exception(f"PCT resampling method {method} invalid")
+    if replicates < 1:
+        raise Exception(f"PCT number of replicates {replicates} invalid")
+    size = round(fraction * nb_trees)
+    if size < 1 or (method == "jackknife" and size > nb_trees):
+        raise Exception(f"PCT fraction {fraction} invalid for {nb_trees} trees")
+
+    rnd = random.Random(seed)
+    if method == "jackknife":
+        return [sorted(rnd.sample(range(nb_trees), size)) for _ in range(replicates)]
+    return [sorted(rnd.choices(range(nb_trees), k=size)) for _ in range(replicates)]
+
+
+def resample_consensus(
+    trees: list[ete3.Tree] | list[str],
+    taxa: list[str],
+    crits: list[str],
+    replicates: int = 100,
+    method: str = "jackknife",
+    fraction: float | None = None,
+    avg_on_merge: bool = False,
+    seed: int = 0,
+    jobs: int = 1,
+) -> tuple[ete3.Tree, Counter[int], dict[int, list[str]]]:
+    """Compute the consensus of all trees with the support of its clades
+    over the consensus of replicates of subsets of the trees
+
+    Args:
+        trees: the input trees, as ete3.Tree or Newick strings
+        taxa: the ordered list of taxa
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        replicates: the number of replicates. Defaults to 100.
+        method: "jackknife" or "bootstrap". Defaults to "jackknife".
+        fraction: the number of trees of each replicate, as a fraction of the
+            number of trees. Defaults to DEFAULT_FRACTIONS of the method.
+        avg_on_merge: see primconstree(). Defaults to False.
+        seed: The seed used to draw the replicates and to break ties in the MST
+        jobs: The number of processes the replicates are split on. Defaults to 1.
+
+    Return:
+        tuple: the consensus of all trees, whose support values are the
+            percentage of replicates having each clade, the number of
+            replicates having each clade, by clade id, and the taxa of each
+            of these clades
+    """
+    if fraction is None:
+        fraction = DEFAULT_FRACTIONS.get(method, 1.0)
+    draws = draw_replicates(len(trees), replicates, method, fraction, seed)
+
+    taxa_ids = get_taxa_ids(taxa)
+    records = [encode_tree(t, taxa_ids) for t in trees]
+    consensus = graph_to_consensus(
+        SuperGraph.from_records(records), taxa, crits, avg_on_merge, seed=seed
+    )
+
+    counts: Counter[int] = Counter()
+    clades: dict[int, list[str]] = {}
+    initargs = (records, taxa, crits, avg_on_merge, seed)
+    if jobs <= 1:
+        _init_worker(*initargs)
+        counts, clades = _replicate_chunk(draws)
+    else:
+        size = max(1, -(-len(draws) // jobs))
+        chunks = [draws[i : i + size] for i in range(0, len(draws), size)]
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=initargs
+        ) as executor:
+            # chunks are merged in order, so clades are in order of first appearance
+            for chunk_counts, chunk_clades in executor.map(_replicate_chunk, chunks):
+                counts.update(chunk_counts)
+                for clade_id, clade in chunk_clades.items():
+                    clades.setdefault(clade_id, clade)
+
+    # leaves and the root are in the consensus of every replicate
+    for node in consensus.traverse():
+        node.support = 100.0
+    for node, clade_id in consensus_clades(consensus, taxa_ids):
+        node.support = 100 * counts[clade_id] / replicates
+    return consensus, counts, clades
@@ -0,0 +1,491 @@
+"""Long-running consensus service, answering JSON requests over HTTP
+
+Starting python and importing ete3 and networkx costs more than the consensus
+of most sets of trees. The service keeps a pool of worker processes that pay
+it once, on start-up, and computes the consensus of each request on the pool.
+It listens on a TCP port or on a Unix socket:
+
+    python -m primconstree serve --port 8765 -j 4
+    python -m primconstree serve --socket /tmp/pct.sock
+
+POST /consensus takes a JSON object with the input trees, either "trees", a
+list of Newick strings (or a text with a tree on each line), or "file", an
+input file on the host of the service, and optionally "crits" (or "version",
+see --version), "seed", "avg_on_merge", "engine", "annotate" and "stats" as in
+the command line. It answers with the consensus and the time spent in total, computing it
+in a worker and waiting for a worker:
+
+    {"consensus": "...;", "time": {"total": 0.012, "compute": 0.010, "queue": 0.002}}
+
+GET /metrics gives the counters of the service (and of its result cache, see
+--cache and cache.py), its queue depth and the percentiles of the latency of
+the last LATENCY_WINDOW requests, GET /health answers as soon as the service
+is up.
+
+Requests are handled concurrently, at most --jobs of them are computed at once
+and --queue more wait for a worker. Requests beyond are rejected at once with
+503 and a Retry-After header, so that a saturated service keeps a bounded
+latency and clients back off instead of piling up.
+
+Invalid requests, including malformed trees, are answered with 400 and the
+error, other failures of the computation with 500.
+"""
+
+import argparse
+import json
+import math
+import os
+import signal
+import stat
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from .cache import MAX_SIZE, cached_consensus, open_cache
+from .criteria import VERSIONS, get_criteria
+from .primconstree import primconstree
+from .stats import Stats
+from .utils import read_newicks
+
+ENGINES = ("networkx", "csr", "disk")
+# number of latencies kept for the percentiles of /metrics
+LATENCY_WINDOW = 1000
+# largest accepted request, in bytes
+MAX_REQUEST_SIZE = 256 << 20
+# trees of the first consensus of each worker, importing and warming up everything
+_WARM_UP_TREES = ["((A:1,B:1):1,(C:1,D:1):1);", "((A:1,C:1):1,(B:1,D:1):1);"]
+
+
+def _init_worker() -> None:
+    """Initialize a worker process with a first consensus on each in-memory engine"""
+    for engine in ENGINES[:2]:
+        primconstree(_WARM_UP_TREES, VERSIONS[1], engine=engine).write()
+
+
+def _consensus(
+    trees: list[str] | str,
+    crits: list[str],
+    args: dict,
+    with_stats: bool,
+    cache: tuple[str, int] | None,
+) -> tuple[str, float, dict | None]:
+    """Worker task, consensus of a request, looked up in the result cache
+    given as (path, maximal size) if any
+
+    Return:
+        tuple: the consensus as a Newick string, the time in seconds to
+            compute it and its statistics if requested
+    """
+    start = time.perf_counter()
+    if isinstance(trees, str):
+        trees = read_newicks(trees)
+    stats = Stats() if with_stats else None
+    consensus = cached_consensus(
+        trees, crits, None if cache is None else open_cache(*cache), stats=stats, **args
+    )
+    duration = time.perf_counter() - start
+    return consensus, duration, None if stats is None else stats.to_dict()
+
+
+def parse_request(request: dict) -> tuple[list[str] | str, list[str], dict, bool]:
+    """Check a request to /consensus and get its parameters
+
+    Args:
+        request: the decoded JSON request, see the module documentation
+
+    Return:
+        tuple: the trees as Newick strings or an input file, the criteria,
+            the other parameters of primconstree() and whether statistics
+            are requested
+    """
+    if not isinstance(request, dict):
+        raise Exception("PCT request must be a JSON object")
+
+    if "trees" in request:
+        trees = request["trees"]
+        if isinstance(trees, str):
+            trees = trees.splitlines()
+        if not isinstance(trees, list) or not all(isinstance(t, str) for t in trees):
+            raise Exception("PCT trees must be a list of Newick strings")
+        trees = [t.strip() for t in trees if t.strip()]
+    elif "file" in request:
+        trees = request["file"]
+        if not isinstance(trees, str) or not os.path.isfile(trees):
+            raise Exception(f"PCT file {trees} not found")
+    else:
+        raise Exception("PCT request must give trees or file")
+
+    if "crits" in request:
+        crits = request["crits"]
+        if not isinstance(crits, list) or not all(isinstance(c, str) for c in crits):
+            raise Exception("PCT crits must be a list of criteria names")
+        get_criteria(crits)
+    else:
+        version = request.get("version", 1)
+        if version not in VERSIONS:
+            raise Exception(f"PCT version {version} invalid")
+        crits = VERSIONS[version]
+
+    seed = request.get("seed", 0)
+    if not isinstance(seed, int) or isinstance(seed, bool):
+        raise Exception(f"PCT seed {seed} invalid")
+    avg_on_merge = request.get("avg_on_merge", False)
+    if not isinstance(avg_on_merge, bool):
+        raise Exception(f"PCT avg_on_merge {avg_on_merge} invalid")
+    engine = request.get("engine", "csr")
+    if engine not in ENGINES:
+        raise Exception(f"PCT engine {engine} invalid")
+    annotate = request.get("annotate")
+    if annotate not in (None, "support", "nhx"):
+        raise Exception(f"PCT annotate {annotate} invalid")
+
+    args = {
+        "avg_on_merge": avg_on_merge,
+        "seed": seed,
+        "engine": engine,
+        "annotate": annotate,
+    }
+    return trees, crits, args, bool(request.get("stats", False))
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """The p-th percentile (nearest rank) of sorted values, None if empty"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class ConsensusService:
+    """A pool of warm worker processes computing consensus trees,
+    with a bounded number of requests in flight
+    """
+
+    def __init__(
+        self,
+        jobs: int = 1,
+        queue: int | None = None,
+        cache: str | None = None,
+        cache_size: int = MAX_SIZE,
+    ) -> None:
+        """
+        Args:
+            jobs: the number of worker processes. Defaults to 1.
+            queue: the number of requests waiting for a worker beyond which
+                requests are rejected. Defaults to 2 per worker.
+            cache: the result cache file (see cache.py) used by the workers, if any.
+            cache_size: the maximal size of the results of the cache in bytes.
+        """
+        self.jobs = jobs
+        self.cache = None if cache is None else (cache, cache_size)
+        self.capacity = jobs + (2 * jobs if queue is None else queue)
+        self.executor = ProcessPoolExecutor(jobs, initializer=_init_worker)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.start_time = time.time()
+
+    def warm_up(self) -> None:
+        """Start every worker and wait until they are initialized"""
+        for future in [self.executor.submit(os.getpid) for _ in range(self.jobs)]:
+            future.result()
+
+    def reserve(self) -> bool:
+        """Take a place for a request, to give back with release() once
+        answered, False if too many requests are in flight
+        """
+        with self.lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def run(
+        self, trees: list[str] | str, crits: list[str], args: dict, with_stats: bool
+    ) -> dict:
+        """Compute the consensus of a request (see parse_request()) on the
+        pool, errors of the computation are raised
+
+        Return:
+            dict: the response, with the consensus and the timing
+        """
+        start = time.perf_counter()
+        executor = self.executor
+        try:
+            future = executor.submit(
+                _consensus, trees, crits, args, with_stats, self.cache
+            )
+            consensus, compute, stats = future.result()
+        except BaseException as e:
+            with self.lock:
+                self.failed += 1
+                # a worker died (e.g. killed when out of memory), start a new pool
+                if isinstance(e, BrokenProcessPool) and self.executor is executor:
+                    self.executor = ProcessPoolExecutor(
+                        self.jobs, initializer=_init_worker
+                    )
+                    executor.shutdown(wait=False)
+            raise
+        total = time.perf_counter() - start
+
+        with self.lock:
+            self.completed += 1
+            self.latencies.append(total)
+        response = {
+            "consensus": consensus,
+            "time": {"total": total, "compute": compute, "queue": total - compute},
+        }
+        if stats is not None:
+            response["stats"] = stats
+        return response
+
+    def metrics(self) -> dict:
+        """Counters of the service and latency of the last requests, in seconds"""
+        with self.lock:
+            in_flight = self.in_flight
+            counters = {
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+            latencies = sorted(self.latencies)
+        if self.cache is not None:
+            counters["cache"] = open_cache(*self.cache).counters()
+        return {
+            "workers": self.jobs,
+            "capacity": self.capacity,
+            "in_flight": in_flight,
+            # requests are computed in order of arrival
+            "queue_depth": max(0, in_flight - self.jobs),
+            **counters,
+            "uptime": time.time() - self.start_time,
+            "latency": {
+                "count": len(latencies),
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP handler of the requests to a ConsensusService, which is the
+    service attribute of the server
+    """
+
+    server_version = "PrimConsTree"
+    # connections are kept alive between requests of a client
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            self.reply(HTTPStatus.OK, self.server.service.metrics())
+        elif self.path == "/health":
+            self.reply(HTTPStatus.OK, {"status": "ok"})
+        else:
+            self.reply(HTTPStatus.NOT_FOUND, {"error": f"PCT path {self.path} unknown"})
+
+    def do_POST(self) -> None:
+        service = self.server.service
+        # rejected before reading and decoding the trees, which costs as much
+        # as the consensus of a small set, the body is left unread
+        if not service.reserve():
+            self.close_connection = True
+            self.reply(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "PCT service busy, retry later"},
+                {"Retry-After": "1"},
+            )
+            return
+
+        try:
+            self.answer(service)
+        finally:
+            service.release()
+
+    def answer(self, service: ConsensusService) -> None:
+        """Answer a POST request, given a place reserved in the service"""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_REQUEST_SIZE:
+                raise Exception(f"PCT request larger than {MAX_REQUEST_SIZE} bytes")
+            body = self.rfile.read(length)
+            if self.path != "/consensus":
+                self.reply(
+                    HTTPStatus.NOT_FOUND, {"error": f"PCT path {self.path} unknown"}
+                )
+                return
+            request = parse_request(json.loads(body))
+        except Exception as e:
+            # the body may be left unread
+            self.close_connection = True
+            self.reply(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+
+        try:
+            response = service.run(*request)
+        except Exception as e:
+            if str(e).startswith("PCT "):
+                # an invalid input found by the worker, e.g. a malformed tree
+                self.reply(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            else:
+                self.reply(
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    {"error": f"{type(e).__name__}: {e}"},
+                )
+            return
+        self.reply(HTTPStatus.OK, response)
+
+    def reply(self, status: int, body: dict, headers: dict | None = None) -> None:
+        """Send a JSON response"""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TCPServiceHandler(ServiceHandler):
+    # headers and body are written separately, with Nagle's algorithm the body
+    # waits for the delayed acknowledgment of the headers on kept alive connections
+    disable_nagle_algorithm = True
+
+
+class TCPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+class UnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self) -> tuple:
+        # the address of Unix clients is empty, the handler logs its first item
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(
+    service: ConsensusService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: str | None = None,
+    verbose: bool = False,
+) -> TCPServer | UnixServer:
+    """HTTP server of the service, on a Unix socket if a path is given,
+    otherwise on the TCP address host:port
+
+    Return:
+        TCPServer | UnixServer: the server, to run with serve_forever()
+    """
+    if socket_path is not None:
+        # a socket left by a previous service that did not exit cleanly
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+        server = UnixServer(socket_path, ServiceHandler)
+    else:
+        server = TCPServer((host, port), TCPServiceHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line of the service, python -m primconstree serve"""
+    parser = argparse.ArgumentParser(
+        prog="python -m primconstree serve",
+        description="Serve consensus trees over HTTP, see the documentation of primconstree/serve.py",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="Address to listen on (default 127.0.0.1)",
+        default="127.0.0.1",
+    )
+    parser.add_argument(
+        "-p", "--port", type=int, help="Port to listen on (default 8765)", default=8765
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="Listen on this Unix socket instead of a TCP port",
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of worker processes (default: number of CPUs)",
+        default=os.cpu_count() or 1,
+    )
+    parser.add_argument(
+        "--queue",
+        type=int,
+        help="Number of requests waiting for a worker beyond which requests are rejected with 503 (default 2 per worker)",
+        default=None,
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="Look up the consensus of requests in this result cache file, and store it there if missing",
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help=f"Maximal size in MiB of the results of --cache (default {MAX_SIZE >> 20})",
+        default=MAX_SIZE >> 20,
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Log every request on stderr"
+    )
+    args = parser.parse_args(argv)
+
+    service = ConsensusService(args.jobs, args.queue, args.cache, args.cache_size << 20)
+    service.warm_up()
+    server = make_server(service, args.host, args.port, args.socket, args.verbose)
+    # stop cleanly when terminated, the workers were started without this handler
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    address = args.socket or "http://{}:{}".format(*server.server_address[:2])
+    print(
+        f"PCT: serving on {address} with {args.jobs} workers",
+        file=sys.stderr,
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
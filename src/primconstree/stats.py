@@ -0,0 +1,113 @@
+"""Runtime statistics of a consensus, to see where the time goes
+
+A Stats object is filled by primconstree() and graph_to_consensus() when
+given one. Without it, phases are not timed and counters that cost more
+than a constant are not computed.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import TYPE_CHECKING, Generator
+
+from .supergraph import SuperGraph
+
+if TYPE_CHECKING:
+    import ete3
+    import networkx as nx
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class Stats:
+    """Statistics of a consensus
+
+    Attributes:
+        times: time in seconds of each phase, in order of execution
+        nb_nodes, nb_edges: size of the supergraph
+        nb_leaves, nb_internal: leaf and internal nodes of the supergraph
+        heap_pushes: number of entries pushed on the heap of the MST
+        stale_pops: number of popped entries whose node was already in the MST
+        removed_nodes: internal nodes removed from the MST to get the consensus
+        peak_memory: peak resident memory of the process in bytes, if known
+    """
+
+    def __init__(self) -> None:
+        self.times: dict[str, float] = {}
+        self.nb_nodes = 0
+        self.nb_edges = 0
+        self.nb_leaves = 0
+        self.nb_internal = 0
+        self.heap_pushes = 0
+        self.stale_pops = 0
+        self.removed_nodes = 0
+        self.peak_memory: int | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Generator[None, None, None]:
+        """Time the enclosed code as the phase <name>"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + (time.perf_counter() - start)
+
+    def record(
+        self,
+        graph: nx.Graph | SuperGraph,
+        taxa: list[str],
+        heap_pushes: int,
+        consensus: ete3.Tree,
+    ) -> None:
+        """Record the counters of a consensus computed from the supergraph,
+        given the number of heap pushes returned by run_mst()
+        """
+        if isinstance(graph, SuperGraph):
+            self.nb_nodes, self.nb_edges = len(graph), len(graph.edge_freq)
+        else:
+            self.nb_nodes = graph.number_of_nodes()
+            self.nb_edges = graph.number_of_edges()
+        self.nb_leaves = len(taxa)
+        self.nb_internal = self.nb_nodes - self.nb_leaves
+
+        # every internal node is reached and popped once while not in the
+        # MST, the other pops are stale
+        self.heap_pushes = heap_pushes
+        self.stale_pops = heap_pushes - self.nb_internal
+
+        # every node of the supergraph is in the MST
+        self.removed_nodes = self.nb_nodes - sum(1 for _ in consensus.traverse())
+        self.update_peak_memory()
+
+    def update_peak_memory(self) -> None:
+        """Record the peak resident memory of the process so far"""
+        if resource is None:
+            return
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        self.peak_memory = peak if sys.platform == "darwin" else peak * 1024
+
+    def to_dict(self) -> dict:
+        """Statistics as a JSON serializable dict"""
+        return {
+            "times": dict(self.times),
+            "total_time": sum(self.times.values()),
+            "nb_nodes": self.nb_nodes,
+            "nb_edges": self.nb_edges,
+            "nb_leaves": self.nb_leaves,
+            "nb_internal": self.nb_internal,
+            "heap_pushes": self.heap_pushes,
+            "stale_pops": self.stale_pops,
+            "removed_nodes": self.removed_nodes,
+            "peak_memory": self.peak_memory,
+        }
+
+
+def phase(stats: Stats | None, name: str) -> AbstractContextManager:
+    """Stats.phase() of stats, or a context doing nothing if stats is None"""
+    return nullcontext() if stats is None else stats.phase(name)
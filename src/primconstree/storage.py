@@ -0,0 +1,221 @@
+"""Binary file format for the supergraph, loaded with memory mapping
+
+A supergraph built once (possibly from millions of trees) can then be queried
+many times with different seeds or criteria without reading the trees again.
+The file holds, after a fixed size header, the following sections, each
+starting on a multiple of 8 bytes:
+- taxa: the ordered taxa names, utf-8 encoded and separated by new lines
+- masks: the clade id of each node (a bitmask or a fingerprint, see
+  utils.get_leaf_ids()), as little endian integers of mask_bytes bytes
+- order (int64): the node indices sorted by clade id
+- node_freq (int64), is_leaf (uint8): one value per node
+- indptr (int64, nodes + 1), indices and edges (int64, 2 * edges): CSR adjacency
+- edge_freq (int64), lensum (float64): one value per edge
+
+Numeric arrays are stored in the byte order of the machine that wrote the file
+and are used in place, only average edge lengths are computed when loading.
+Clade ids are decoded from the file when accessed and looked up by binary
+search over the order section (see MappedIds), so that loading does not build
+a list and a dict of every clade id.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator
+
+from .supergraph import SuperGraph
+
+MAGIC = b"PCTSG02\n"
+# files written before the order section
+_MAGIC_V1 = b"PCTSG01\n"
+# magic, little endian flag, number of taxa, nodes, edges, bytes per clade id, bytes of taxa
+_HEADER = struct.Struct("<8s6Q")
+
+
+def _pad(size: int) -> int:
+    """Round a section size up to a multiple of 8"""
+    return -(-size // 8) * 8
+
+
+class MappedIds:
+    """The clade ids of the nodes of a supergraph file, as a sequence decoding
+    them from the memory mapped masks section on access
+
+    Args:
+        masks: the masks section
+        mask_bytes: the number of bytes of each clade id
+        order: the order section, the node indices sorted by clade id
+    """
+
+    __slots__ = ("masks", "mask_bytes", "order")
+
+    def __init__(self, masks: memoryview, mask_bytes: int, order: memoryview) -> None:
+        self.masks = masks
+        self.mask_bytes = mask_bytes
+        self.order = order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("node index out of range")
+        start = i * self.mask_bytes
+        return int.from_bytes(self.masks[start : start + self.mask_bytes], "little")
+
+    def __iter__(self) -> Iterator[int]:
+        return map(self.__getitem__, range(len(self)))
+
+
+class MappedIndex:
+    """The node index of each clade id of MappedIds, found by binary search
+    over the order section, used as SuperGraph.index
+    """
+
+    __slots__ = ("ids",)
+
+    def __init__(self, ids: MappedIds) -> None:
+        self.ids = ids
+
+    def __getitem__(self, nid: int) -> int:
+        order = self.ids.order
+        k = bisect_left(order, nid, key=self.ids.__getitem__)
+        if k == len(order) or self.ids[order[k]] != nid:
+            raise KeyError(nid)
+        return order[k]
+
+    def __contains__(self, nid: int) -> bool:
+        try:
+            self[nid]
+        except KeyError:
+            return False
+        return True
+
+
+def save_supergraph(sg: SuperGraph, taxa: list[str], path: str) -> None:
+    """Save a supergraph and its taxa to a binary file
+
+    Args:
+        sg: the supergraph to save
+        taxa: the ordered list of taxa node ids are mapped against
+        path: the output file path
+    """
+    mask_bytes = max(1, -(-max((nid.bit_length() for nid in sg.ids), default=0) // 8))
+    write_supergraph(
+        path,
+        taxa,
+        len(sg),
+        len(sg.edge_freq),
+        mask_bytes,
+        [
+            [b"".join(nid.to_bytes(mask_bytes, "little") for nid in sg.ids)],
+            [array("q", sorted(range(len(sg)), key=sg.ids.__getitem__)).tobytes()],
+            [array("q", sg.node_freq).tobytes()],
+            [bytes(sg.is_leaf)],
+            [array("q", sg.indptr).tobytes()],
+            [array("q", sg.indices).tobytes()],
+            [array("q", sg.edges).tobytes()],
+            [array("q", sg.edge_freq).tobytes()],
+            [array("d", sg.lensum).tobytes()],
+        ],
+    )
+
+
+def write_supergraph(
+    path: str,
+    taxa: list[str],
+    nb_nodes: int,
+    nb_edges: int,
+    mask_bytes: int,
+    sections: list[Iterable[bytes]],
+) -> None:
+    """Write a supergraph file from its sections, each given as chunks of
+    bytes, so that a supergraph can be written without being held in memory
+    (see diskgraph.py)
+
+    Args:
+        path: the output file path
+        taxa: the ordered list of taxa node ids are mapped against
+        nb_nodes, nb_edges: the size of the supergraph
+        mask_bytes: the number of bytes of each clade id
+        sections: the sections following the taxa, in the order of the module doc
+    """
+    taxa_bytes = "\n".join(taxa).encode("utf-8")
+
+    with open(path, "wb") as file:
+        file.write(
+            _HEADER.pack(
+                MAGIC,
+                sys.byteorder == "little",
+                len(taxa),
+                nb_nodes,
+                nb_edges,
+                mask_bytes,
+                len(taxa_bytes),
+            )
+        )
+        for section in [[taxa_bytes], *sections]:
+            size = 0
+            for chunk in section:
+                file.write(chunk)
+                size += len(chunk)
+            file.write(bytes(_pad(size) - size))
+
+
+def load_supergraph(path: str) -> tuple[SuperGraph, list[str]]:
+    """Load a supergraph saved with save_supergraph(), numeric arrays
+    are memory mapped views on the file
+
+    Args:
+        path: the supergraph file path
+
+    Return:
+        tuple: the supergraph and its ordered list of taxa
+    """
+    with open(path, "rb") as file:
+        buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    magic, little, nb_taxa, n, m, mask_bytes, taxa_bytes = _HEADER.unpack_from(buffer)
+    if magic == _MAGIC_V1:
+        raise Exception(f"{path} was written by an older version, save it again")
+    if magic != MAGIC:
+        raise Exception(f"{path} is not a PCT supergraph file")
+    if bool(little) != (sys.byteorder == "little"):
+        raise Exception(f"{path} was written on a machine with another byte order")
+
+    offset = _HEADER.size
+
+    def section(size: int, fmt: str = "B") -> memoryview:
+        nonlocal offset
+        view = buffer[offset : offset + size]
+        offset += _pad(size)
+        return view.cast(fmt)
+
+    taxa = bytes(section(taxa_bytes)).decode("utf-8").split("\n")[:nb_taxa]
+    masks = section(n * mask_bytes)
+    ids = MappedIds(masks, mask_bytes, section(8 * n, "q"))
+    node_freq = section(8 * n, "q")
+    is_leaf = section(n)
+    indptr = section(8 * (n + 1), "q")
+    indices = section(16 * m, "q")
+    edges = section(16 * m, "q")
+    edge_freq = section(8 * m, "q")
+    lensum = section(8 * m, "d")
+
+    sg = SuperGraph(
+        ids,
+        node_freq,
+        is_leaf,
+        indptr,
+        indices,
+        edges,
+        edge_freq,
+        lensum,
+        index=MappedIndex(ids),
+    )
+    return sg, taxa
@@ -0,0 +1,257 @@
+"""Incremental consensus over a stream of trees, such as the output of a running MCMC chain
+
+The supergraph is kept with summed edge lengths and new trees are added to it as
+they arrive, so memory depends on the number of distinct clades only and earlier
+trees are never read again. Trees can also be removed from it, which gives
+consensus over a sliding window of trees. The consensus of a window is the
+one of primconstree() on the trees of the window: frequencies are kept up to
+date, but the node order (which the tie breaking of the MST relies on) and the
+length sums are rebuilt from the trees of the window.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Generator, Iterable
+
+from .algorithm import (
+    add_records_to_graph,
+    average_lengths,
+    remove_records_from_graph,
+)
+from .newick import encode_tree, get_taxa
+from .primconstree import graph_to_consensus
+from .supergraph import SuperGraph
+from .utils import Record, get_taxa_ids
+
+if TYPE_CHECKING:
+    import ete3
+    import networkx as nx
+else:
+    from .lazy import ete3, nx
+
+
+class StreamingConsensus:
+    """Persistent supergraph that trees are added to one at a time,
+    the consensus of all trees added so far can be computed at any moment
+
+    Args:
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        avg_on_merge: see primconstree(). Defaults to False.
+        seed: The seed used to break ties in the mst. Defaults to 0.
+        engine: The supergraph representation used for the MST (see primconstree()). Defaults to "csr".
+    """
+
+    def __init__(
+        self,
+        crits: list[str],
+        avg_on_merge: bool = False,
+        seed: int = 0,
+        engine: str = "csr",
+    ) -> None:
+        if engine not in ("networkx", "csr"):
+            raise Exception(f"PCT engine {engine} invalid")
+        self.crits = crits
+        self.avg_on_merge = avg_on_merge
+        self.seed = seed
+        self.engine = engine
+        # supergraph with summed edge lengths
+        self.graph = nx.Graph()
+        # taxa are set by the first tree
+        self.taxa: list[str] | None = None
+        self.taxa_ids: dict[str, int] = {}
+        # number of trees currently in the supergraph
+        self.nb_trees = 0
+        # whether a tree was removed, the node order then differs from a fresh build
+        self.removed = False
+
+    def add_tree(self, tree: ete3.Tree | str) -> list[Record]:
+        """Incorporate a new tree, given as ete3.Tree or Newick string,
+        return its encoding, which can be given back to remove_tree()
+        """
+        if self.taxa is None:
+            self.taxa = get_taxa(tree)
+            self.taxa_ids = get_taxa_ids(self.taxa)
+        records = encode_tree(tree, self.taxa_ids)
+        add_records_to_graph(records, self.graph)
+        self.nb_trees += 1
+        return records
+
+    def remove_tree(self, tree: ete3.Tree | str | list[Record]) -> None:
+        """Remove a tree previously added, given as ete3.Tree, Newick string
+        or as its encoding returned by add_tree().
+        The remaining trees must then be given to consensus().
+        """
+        if self.taxa is None:
+            raise Exception("No tree to remove")
+        if not isinstance(tree, list):
+            tree = encode_tree(tree, self.taxa_ids)
+        remove_records_from_graph(tree, self.graph)
+        self.nb_trees -= 1
+        self.removed = True
+
+    def consensus(self, trees: Iterable[list[Record]] | None = None) -> ete3.Tree:
+        """Compute the consensus of the trees added so far,
+        the persistent supergraph is left untouched
+
+        Args:
+            trees: the encodings of the trees in the supergraph, in the order
+                they were added, required once a tree was removed, to get the
+                consensus primconstree() gives on these trees (see window_graph())
+        """
+        if self.taxa is None:
+            return ete3.Tree()
+
+        if trees is not None:
+            snapshot = self.window_graph(trees)
+        elif self.removed:
+            raise Exception("PCT the remaining trees are required after remove_tree()")
+        else:
+            snapshot = self.graph.copy()
+        average_lengths(snapshot)
+        graph = SuperGraph.from_graph(snapshot) if self.engine == "csr" else snapshot
+
+        return graph_to_consensus(
+            graph, self.taxa, self.crits, self.avg_on_merge, seed=self.seed
+        )
+
+    def window_graph(self, trees: Iterable[list[Record]]) -> nx.Graph:
+        """Copy the supergraph with its nodes and edges in the order of their
+        first appearance in <trees>, as a fresh build gives them, and their
+        length sums recomputed from <trees> rather than left to the rounding
+        of the subtractions of remove_tree(), frequencies are those kept
+        """
+        graph = nx.Graph()
+        nodes = self.graph.nodes
+        for records in trees:
+            for nid, pid, dist, is_leaf in records:
+                if nid not in graph.nodes:
+                    graph.add_node(
+                        nid, node_freq=nodes[nid]["node_freq"], is_leaf=is_leaf
+                    )
+                if pid != -1:
+                    if nid not in graph[pid]:
+                        edge_freq = self.graph[pid][nid]["edge_freq"]
+                        graph.add_edge(pid, nid, avglen=0, edge_freq=edge_freq)
+                    graph[pid][nid]["avglen"] += dist
+        return graph
+
+
+def read_appended(
+    input_file: str, follow: bool = True, poll: float = 1.0
+) -> Generator[str | None, None, None]:
+    """Yield the Newick strings of a file as they are written, one per line.
+    A tree is yielded once its terminating ';' is written, so partially
+    written lines are kept until complete.
+
+    Args:
+        input_file: Path to the input file.
+        follow: If True, keep waiting for new trees at the end of the file,
+            yielding None every <poll> seconds while idle. Else stop at the end.
+        poll: Time in seconds between two reads while idle.
+    """
+    with open(input_file, "r") as file:
+        buffer = ""
+        while True:
+            line = file.readline()
+            if line:
+                buffer += line
+                if buffer.rstrip().endswith(";"):
+                    yield buffer.strip()
+                    buffer = ""
+                elif not buffer.strip():
+                    buffer = ""
+                continue
+
+            if not follow:
+                if buffer.strip():
+                    yield buffer.strip()
+                return
+
+            yield None
+            time.sleep(poll)
+
+
+def stream_consensus(
+    input_file: str,
+    crits: list[str],
+    every: int = 100,
+    interval: float | None = None,
+    follow: bool = True,
+    poll: float = 1.0,
+    **args,
+) -> Generator[ete3.Tree, None, None]:
+    """Build the consensus incrementally from the trees of a file while it is written
+
+    Args:
+        input_file: Path to the input file, with a Newick tree on each line.
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        every: Yield an updated consensus every <every> new trees (0 to disable). Defaults to 100.
+        interval: Yield an updated consensus every <interval> seconds if there are new trees. Defaults to None (disabled).
+        follow: If True, wait for trees appended to the file forever, else stop
+            at the end of the file after yielding the final consensus. Defaults to True.
+        poll: Time in seconds between two reads while waiting for new trees.
+        args: additional parameters of StreamingConsensus (avg_on_merge, seed, engine)
+
+    Yields:
+        ete3.Tree: the consensus of all trees read so far
+    """
+    stream = StreamingConsensus(crits, **args)
+    last_nb, last_time = 0, time.monotonic()
+
+    for newick in read_appended(input_file, follow, poll):
+        if newick is not None:
+            stream.add_tree(newick)
+
+        pending = stream.nb_trees - last_nb
+        if pending and (
+            (every and pending >= every)
+            or (interval is not None and time.monotonic() - last_time >= interval)
+        ):
+            yield stream.consensus()
+            last_nb, last_time = stream.nb_trees, time.monotonic()
+
+    if stream.nb_trees > last_nb:
+        yield stream.consensus()
+
+
+def window_consensus(
+    input_file: str,
+    crits: list[str],
+    window: int,
+    stride: int = 1,
+    **args,
+) -> Generator[ete3.Tree, None, None]:
+    """Compute the consensus over a window of <window> consecutive trees sliding
+    by <stride> trees over the file, the first window starting at the first tree.
+    Sliding the window adds and removes <stride> trees to the supergraph
+    instead of counting every tree of the window again, each consensus is the
+    one primconstree() gives on the trees of the window.
+
+    Args:
+        input_file: Path to the input file, with a Newick tree on each line.
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        window: number of trees in each window
+        stride: number of trees the window slides by. Defaults to 1.
+        args: additional parameters of StreamingConsensus (avg_on_merge, seed, engine)
+
+    Yields:
+        ete3.Tree: the consensus of each window, in order
+    """
+    if window < 1 or stride < 1:
+        raise Exception(f"PCT window {window} and stride {stride} must be positive")
+
+    stream = StreamingConsensus(crits, **args)
+    trees: deque[list[Record]] = deque()
+    nb_read = 0
+
+    for newick in read_appended(input_file, follow=False):
+        trees.append(stream.add_tree(newick))
+        nb_read += 1
+
+        if len(trees) > window:
+            stream.remove_tree(trees.popleft())
+
+        if nb_read >= window and (nb_read - window) % stride == 0:
+            yield stream.consensus(trees)
@@ -0,0 +1,469 @@
+"""Array-backed supergraph used as an alternative to the networkx graph
+
+Nodes are given dense indices (in order of first appearance, exactly like
+the insertion order of the networkx graph) and every attribute is stored
+in a typed array indexed by node or by edge. Adjacency is stored in CSR
+format: the neighbours of node i are indices[indptr[i]:indptr[i + 1]] and
+the matching edge indices are edges[indptr[i]:indptr[i + 1]].
+"""
+
+from __future__ import annotations
+
+import heapq
+import random
+from array import array
+from itertools import repeat
+from operator import add, mul
+from typing import TYPE_CHECKING, Iterable, Mapping, Sequence
+
+from .criteria import Criterion, get_criteria
+from .newick import encode_tree
+from .utils import Record, get_leaf_ids, get_taxa_ids, get_tie_ids
+
+if TYPE_CHECKING:
+    import ete3
+    import networkx as nx
+else:
+    from .lazy import ete3, nx
+
+
+class SuperGraph:
+    """Compact supergraph, see module doc for the layout
+
+    Attributes:
+        ids: clade identifier (see clade_to_id()) of each node, a list or
+            the ids of a memory mapped file (see storage.MappedIds)
+        index: mapping from clade identifier to node index
+        node_freq: frequency of each node
+        is_leaf: 1 if the node is a leaf, 0 otherwise
+        indptr, indices, edges: CSR adjacency
+        edge_freq: frequency of each edge
+        lensum: summed length of each edge
+        avglen: average length of each edge
+        in_mst, parent, parent_edge, key: MST state set by run_mst()
+        ranks: priority keys compiled by compile_keys(), by list of criteria
+    """
+
+    __slots__ = (
+        "ids",
+        "index",
+        "node_freq",
+        "is_leaf",
+        "indptr",
+        "indices",
+        "edges",
+        "edge_freq",
+        "lensum",
+        "avglen",
+        "in_mst",
+        "parent",
+        "parent_edge",
+        "key",
+        "ranks",
+    )
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        node_freq: array,
+        is_leaf: bytearray,
+        indptr: array,
+        indices: array,
+        edges: array,
+        edge_freq: array,
+        lensum: array,
+        avglen: array | None = None,
+        index: Mapping[int, int] | None = None,
+    ) -> None:
+        """Arrays can be any typed sequence, such as array or memoryview
+
+        Args:
+            ids: clade identifier of each node
+            node_freq: frequency of each node
+            is_leaf: leaf flag of each node
+            indptr, indices, edges: CSR adjacency
+            edge_freq: frequency of each edge
+            lensum: summed length of each edge
+            avglen: average length of each edge, computed from lensum if None
+            index: mapping from clade identifier to node index, a dict of
+                ids if None
+        """
+        n = len(ids)
+        self.ids = ids
+        if index is None:
+            index = {nid: i for i, nid in enumerate(ids)}
+        self.index = index
+        self.node_freq = node_freq
+        self.is_leaf = is_leaf
+        self.indptr = indptr
+        self.indices = indices
+        self.edges = edges
+        self.edge_freq = edge_freq
+        self.lensum = lensum
+        if avglen is None:
+            avglen = array("d", (s / f for s, f in zip(lensum, edge_freq)))
+        self.avglen = avglen
+
+        self.in_mst = bytearray(n)
+        self.parent = array("q", [-1]) * n
+        self.parent_edge = array("q", [-1]) * n
+        self.key = array("q")
+        self.ranks: dict[tuple[str, ...], tuple[array, array, int]] = {}
+
+    @classmethod
+    def from_edges(
+        cls,
+        ids: list[int],
+        node_freq: array,
+        is_leaf: bytearray,
+        edge_ends: list[tuple[int, int]],
+        edge_freq: array,
+        lensum: array,
+        avglen: array | None = None,
+    ) -> "SuperGraph":
+        """Compile the CSR adjacency from the list of edges,
+        edge_ends being the (u, v) node indices of each edge
+        """
+        n = len(ids)
+
+        # count the degree of each node, then prefix sum it
+        indptr = array("q", bytes(8 * (n + 1)))
+        for u, v in edge_ends:
+            indptr[u + 1] += 1
+            indptr[v + 1] += 1
+        for i in range(n):
+            indptr[i + 1] += indptr[i]
+
+        # fill the neighbours of each node
+        fill = array("q", indptr[:-1])
+        indices = array("q", bytes(8 * indptr[n]))
+        edges = array("q", bytes(8 * indptr[n]))
+        for e, (u, v) in enumerate(edge_ends):
+            indices[fill[u]], edges[fill[u]] = v, e
+            fill[u] += 1
+            indices[fill[v]], edges[fill[v]] = u, e
+            fill[v] += 1
+
+        return cls(
+            ids, node_freq, is_leaf, indptr, indices, edges, edge_freq, lensum, avglen
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __reduce__(self) -> tuple:
+        """Pickle the data arrays only, as arrays since memory mapped
+        views (see storage.py) can not be pickled
+        """
+        return (
+            SuperGraph,
+            (
+                list(self.ids),
+                array("q", self.node_freq),
+                bytearray(self.is_leaf),
+                array("q", self.indptr),
+                array("q", self.indices),
+                array("q", self.edges),
+                array("q", self.edge_freq),
+                array("d", self.lensum),
+                array("d", self.avglen),
+            ),
+        )
+
+    @classmethod
+    def from_graph(cls, graph: nx.Graph) -> "SuperGraph":
+        """Convert a supergraph produced by build_graph()"""
+        ids = list(graph.nodes)
+        index = {nid: i for i, nid in enumerate(ids)}
+        node_freq = array("q", (d["node_freq"] for _, d in graph.nodes(data=True)))
+        is_leaf = bytearray(d["is_leaf"] for _, d in graph.nodes(data=True))
+
+        edge_ends = []
+        edge_freq = array("q")
+        avglen = array("d")
+        for u, v, d in graph.edges(data=True):
+            edge_ends.append((index[u], index[v]))
+            edge_freq.append(d["edge_freq"])
+            avglen.append(d["avglen"])
+        # the graph only holds averages, sums are recovered up to rounding
+        lensum = array("d", (a * f for a, f in zip(avglen, edge_freq)))
+
+        return cls.from_edges(
+            ids, node_freq, is_leaf, edge_ends, edge_freq, lensum, avglen
+        )
+
+    @classmethod
+    def from_trees(
+        cls, trees: Iterable[ete3.Tree | str], taxa: list[str]
+    ) -> "SuperGraph":
+        """Build the supergraph directly from the input trees (ete3.Tree or
+        Newick strings), without going through a networkx graph.
+        Nodes, edges and frequencies are the same as build_graph()
+        """
+        taxa_ids = get_taxa_ids(taxa)
+        return cls.from_records(encode_tree(t, taxa_ids) for t in trees)
+
+    @classmethod
+    def from_records(cls, trees: Iterable[list[Record]]) -> "SuperGraph":
+        """Build the supergraph from trees already encoded into records
+        (see newick.encode_tree()), e.g. to build several supergraphs from
+        subsets of the same trees encoding them once
+        """
+        index: dict[int, int] = {}
+        ids: list[int] = []
+        node_freq = array("q")
+        is_leaf = bytearray()
+
+        edge_index: dict[tuple[int, int], int] = {}
+        edge_ends: list[tuple[int, int]] = []
+        edge_freq = array("q")
+        lensum = array("d")
+
+        for records in trees:
+            for nid, pid, dist, leaf in records:
+                if nid not in index:
+                    index[nid] = len(ids)
+                    ids.append(nid)
+                    node_freq.append(0)
+                    is_leaf.append(leaf)
+                i = index[nid]
+
+                if pid != -1:
+                    node_freq[i] += 1
+                    p = index[pid]
+
+                    # edges are undirected, key them on ordered indices
+                    ends = (p, i) if p < i else (i, p)
+                    if ends not in edge_index:
+                        edge_index[ends] = len(edge_ends)
+                        edge_ends.append((p, i))
+                        edge_freq.append(0)
+                        lensum.append(0.0)
+                    e = edge_index[ends]
+                    lensum[e] += dist
+                    edge_freq[e] += 1
+
+        # average edge lengths are computed from the sums
+        return cls.from_edges(ids, node_freq, is_leaf, edge_ends, edge_freq, lensum)
+
+    def compile_keys(self, crits: list[str]) -> tuple[array, array, int]:
+        """Compile a list of criteria into integer priority keys, once per
+        list of criteria, instead of evaluating the criteria at each edge
+        relaxation. The criteria values of every edge direction are ranked,
+        equal values getting equal ranks, so comparing ranks is the same as
+        comparing the tuples of values.
+
+        Args:
+            crits: the criteria in order of priority, see criteria.py
+
+        Return:
+            tuple: out_rank, in_rank and the number of distinct ranks, where
+                for a slot of the row of u pointing to v, out_rank[slot] is
+                the rank of the direction u -> v and in_rank[slot] the one
+                of v -> u
+        """
+        if tuple(crits) in self.ranks:
+            return self.ranks[tuple(crits)]
+
+        functions = get_criteria(crits)
+        indptr, n = self.indptr, len(self)
+
+        # arguments of the criteria for each slot, as typed arrays since
+        # there are two slots per edge (see diskgraph.py)
+        node_freq, edge_freq, avglen = self.node_freq, self.edge_freq, self.avglen
+        u_freq = array("q")
+        for u in range(n):
+            u_freq.extend([node_freq[u]] * (indptr[u + 1] - indptr[u]))
+        v_freq = array("q", map(node_freq.__getitem__, self.indices))
+        edge_freq = array("q", map(edge_freq.__getitem__, self.edges))
+        avglen = array("d", map(avglen.__getitem__, self.edges))
+        out_rank, nb_out = _rank(functions, u_freq, v_freq, edge_freq, avglen)
+
+        # opposite directions are only used to attach leaves, rank them
+        # on the slots of leaf rows only
+        leaf_slots = [
+            slot
+            for u in range(n)
+            if self.is_leaf[u]
+            for slot in range(indptr[u], indptr[u + 1])
+        ]
+        in_values, nb_in = _rank(
+            functions,
+            [v_freq[slot] for slot in leaf_slots],
+            [u_freq[slot] for slot in leaf_slots],
+            [edge_freq[slot] for slot in leaf_slots],
+            [avglen[slot] for slot in leaf_slots],
+        )
+        in_rank = array("q", bytes(8 * len(u_freq)))
+        for slot, r in zip(leaf_slots, in_values):
+            in_rank[slot] = r
+
+        self.ranks[tuple(crits)] = (out_rank, in_rank, max(nb_out, nb_in))
+        return self.ranks[tuple(crits)]
+
+    def to_graph(self) -> nx.Graph:
+        """Convert back to a networkx graph, mostly for debug drawing"""
+        graph = nx.Graph()
+        for i, nid in enumerate(self.ids):
+            graph.add_node(
+                nid, node_freq=self.node_freq[i], is_leaf=bool(self.is_leaf[i])
+            )
+        for u in range(len(self)):
+            for slot in range(self.indptr[u], self.indptr[u + 1]):
+                v, e = self.indices[slot], self.edges[slot]
+                if u < v:
+                    graph.add_edge(
+                        self.ids[u],
+                        self.ids[v],
+                        avglen=self.avglen[e],
+                        edge_freq=self.edge_freq[e],
+                    )
+        return graph
+
+
+def _rank(
+    functions: list[Criterion],
+    u_freq: Sequence[int],
+    v_freq: Sequence[int],
+    edge_freq: Sequence[int],
+    avglen: Sequence[float],
+) -> tuple[array, int]:
+    """Rank the edge directions described by the argument lists on the values
+    of the criteria <functions>, in order of priority
+
+    Return:
+        tuple: the dense rank of each direction and the number of ranks
+    """
+    # rank the values of each criterion, and combine the ranks in mixed
+    # radix, the first criterion being the most significant digit
+    combined: Sequence[int] = array("q", bytes(8 * len(u_freq)))
+    radix = 1
+    for f in functions:
+        values = array("d", map(f, u_freq, v_freq, edge_freq, avglen))
+        levels = {value: r for r, value in enumerate(sorted(set(values)))}
+        digits = map(levels.__getitem__, values)
+        if radix > 1:
+            # c * len(levels) + levels[x], with maps to stay out of the interpreter
+            digits = map(add, map(mul, combined, repeat(len(levels))), digits)
+        radix *= len(levels)
+        # fall back to a list of integers if ranks overflow 64 bits
+        combined = array("q", digits) if radix < 1 << 63 else list(digits)
+
+    # then make ranks dense so packed keys stay small
+    rank = {value: r for r, value in enumerate(sorted(set(combined)))}
+    return array("q", map(rank.__getitem__, combined)), len(rank)
+
+
+def attach_leaves(
+    sg: SuperGraph, taxa: list[str], crits: list[str], tie: Sequence[int]
+) -> None:
+    """Array counterpart of algorithm.attach_leaves(),
+    tie is the tie breaking rank of each node index, see build_mst()
+    """
+    _, in_rank, _ = sg.compile_keys(crits)
+    n, key = len(sg), sg.key
+    for u in (sg.index[leaf_id] for leaf_id in get_leaf_ids(taxa)):
+        for slot in range(sg.indptr[u], sg.indptr[u + 1]):
+            # the leaf is the fringe vertex, so use the rank of v -> u
+            v = sg.indices[slot]
+            k = in_rank[slot] * n + tie[v]
+            if key[u] > k:
+                key[u] = k
+                sg.parent[u] = v
+                sg.parent_edge[u] = sg.edges[slot]
+
+
+def mst_to_tree(sg: SuperGraph) -> ete3.Tree:
+    """Array counterpart of algorithm.mst_to_tree()"""
+    tree_nodes = [ete3.TreeNode(name=nid) for nid in sg.ids]
+    root = None
+
+    for i, tree_node in enumerate(tree_nodes):
+        p = sg.parent[i]
+        if p == -1:
+            root = tree_node
+        else:
+            tree_nodes[p].add_child(tree_node, dist=sg.avglen[sg.parent_edge[i]])
+
+    if root is None:
+        raise Exception("No root found")
+
+    return ete3.Tree(newick=root.write(format=3), format=3)
+
+
+def build_mst(
+    sg: SuperGraph, src: int, taxa: list[str], crits: list[str], seed: int
+) -> ete3.Tree:
+    """Array counterpart of algorithm.build_mst(), src is the clade
+    identifier of the source node.
+    Tie breaking ids are drawn in node order, so for a given seed the
+    result is the same as the networkx version.
+    """
+    run_mst(sg, src, taxa, crits, seed)
+    mst = mst_to_tree(sg)
+
+    return mst
+
+
+def run_mst(
+    sg: SuperGraph, src: int, taxa: list[str], crits: list[str], seed: int
+) -> int:
+    """Array counterpart of algorithm.run_mst(), set sg.parent and
+    sg.parent_edge, and return the number of heap pushes.
+    The key of a fringe vertex v packs, in a single integer, the rank of
+    the criteria values of its best edge (see SuperGraph.compile_keys())
+    and the rank of the tie breaking id of v, so the heap only holds and
+    compares integers, from which v is recovered.
+    """
+    n = len(sg)
+    out_rank, _, nb_ranks = sg.compile_keys(crits)
+
+    random.seed(seed)
+    rnd_id = get_tie_ids(n, taxa)
+
+    # only the order of tie breaking ids matters, replace them with their rank
+    order = sorted(range(n), key=rnd_id.__getitem__)
+    tie = array("q", bytes(8 * n))
+    for r, i in enumerate(order):
+        tie[i] = r
+
+    sg.in_mst = bytearray(n)
+    sg.parent = array("q", [-1]) * n
+    sg.parent_edge = array("q", [-1]) * n
+    # greater than any key
+    sg.key = array("q", [(nb_ranks + 1) * n]) * n
+
+    # bind arrays locally, they are read in the hot loop
+    in_mst, is_leaf, key = sg.in_mst, sg.is_leaf, sg.key
+    parent, parent_edge = sg.parent, sg.parent_edge
+    indptr, indices, edges = sg.indptr, sg.indices, sg.edges
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    s = sg.index[src]
+    key[s] = tie[s]
+    queue = [key[s]]
+    pushes = 1
+
+    while queue:
+        u = order[heappop(queue) % n]
+        if in_mst[u]:
+            continue
+
+        in_mst[u] = 1
+
+        for slot in range(indptr[u], indptr[u + 1]):
+            v = indices[slot]
+            if in_mst[v] or is_leaf[v]:
+                continue
+
+            k = out_rank[slot] * n + tie[v]
+            if key[v] > k:
+                heappush(queue, k)
+                pushes += 1
+                key[v] = k
+                parent[v] = u
+                parent_edge[v] = edges[slot]
+
+    attach_leaves(sg, taxa, crits, tie)
+
+    return pushes
@@ -0,0 +1,96 @@
+"""Consensus over a range of seeds, to measure how much ties in the MST
+change the result
+
+Only the tie breaking of build_mst() depends on the seed, so the supergraph
+is built once and the MST is run for every seed, possibly on several
+processes, each receiving the supergraph once.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
+
+from .primconstree import graph_to_consensus
+from .supergraph import SuperGraph
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+# supergraph and parameters of a worker process, set by _init_worker()
+_worker: tuple = ()
+
+
+def _init_worker(
+    graph: nx.Graph | SuperGraph,
+    taxa: list[str],
+    crits: list[str],
+    avg_on_merge: bool,
+) -> None:
+    global _worker
+    _worker = (graph, taxa, crits, avg_on_merge)
+
+
+def _sweep_chunk(seeds: list[int]) -> list[str]:
+    """Newick strings of the consensus of each seed, in the worker"""
+    graph, taxa, crits, avg_on_merge = _worker
+    return [
+        graph_to_consensus(graph, taxa, crits, avg_on_merge, seed=seed).write()
+        for seed in seeds
+    ]
+
+
+def sweep_seeds(
+    graph: nx.Graph | SuperGraph,
+    taxa: list[str],
+    crits: list[str],
+    seeds: range | list[int],
+    avg_on_merge: bool = False,
+    jobs: int = 1,
+) -> Counter[str]:
+    """Compute the consensus of an already built supergraph for every seed
+
+    Args:
+        graph: the supergraph, with average edge lengths (see build_supergraph())
+        taxa: the ordered list of taxa
+        crits: list of criterion to use for the MST in priority order (see primconstree())
+        seeds: the seeds used to break ties in the MST
+        avg_on_merge: see primconstree(). Defaults to False.
+        jobs: The number of processes the seeds are split on. Defaults to 1.
+
+    Return:
+        Counter: the number of seeds giving each distinct consensus, as Newick
+            strings, in order of first appearance over the seeds
+    """
+    seeds = list(seeds)
+    if jobs <= 1:
+        _init_worker(graph, taxa, crits, avg_on_merge)
+        return Counter(_sweep_chunk(seeds))
+
+    size = max(1, -(-len(seeds) // jobs))
+    chunks = [seeds[i : i + size] for i in range(0, len(seeds), size)]
+
+    counts: Counter[str] = Counter()
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(graph, taxa, crits, avg_on_merge),
+    ) as executor:
+        # chunks are contiguous and merged in order, so is the counter
+        for newicks in executor.map(_sweep_chunk, chunks):
+            counts.update(newicks)
+
+    return counts
+
+
+def parse_seeds(seeds: str) -> range:
+    """Parse a range of seeds "A:B", from A to B included"""
+    try:
+        start, stop = (int(s) for s in seeds.split(":"))
+    except ValueError:
+        raise Exception(f"PCT seeds {seeds} invalid, expected A:B")
+    if stop < start:
+        raise Exception(f"PCT seeds {seeds} invalid, B is lower than A")
+    return range(start, stop + 1)
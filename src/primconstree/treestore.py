@@ -0,0 +1,287 @@
+"""On-disk store of encoded trees, so that a file of trees is parsed once
+
+Running the consensus of the same file again (other seeds, versions of the
+algorithm, resampling, evaluation scripts) parses the same Newick text every
+time. A store holds the trees of a file encoded as in newick.py, as compact
+arrays, in a binary file named after the hash of the input file: it is written
+on the first use and memory mapped afterwards, without parsing anything.
+
+The file holds, after a fixed size header, the following sections, each
+starting on a multiple of 8 bytes:
+- taxa: the ordered taxa names, utf-8 encoded and separated by new lines
+- offsets (int64, trees + 1): the index of the first node of each tree, tree i
+  has the nodes offsets[i] to offsets[i + 1] - 1, so its bytes in each of the
+  following sections are found in O(1)
+- lines (int64, trees + 1): the byte offset of each tree in the input file, then
+  its size, to read the Newick string of a tree without reading the others
+- masks: the clade id of each node (a bitmask or a fingerprint, see
+  utils.get_leaf_ids()), as mask_words uint64 words, least significant first
+- parents (int64): the index of the parent of each node within its tree,
+  -1 for the root
+- dists (float64), supports (float64, 1.0 when missing as in ete3),
+  is_leaf (uint8): one value per node
+
+Nodes of a tree are in preorder, as records (see newick.parse_newick()).
+Numeric arrays are stored in the byte order of the machine that wrote the file,
+as in storage.py.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import TYPE_CHECKING, Iterator
+
+from .newick import newick_taxa, parse_newick_nodes
+from .utils import Record, get_taxa_ids
+
+if TYPE_CHECKING:
+    import ete3
+else:
+    from .lazy import ete3
+
+MAGIC = b"PCTTS01\n"
+# magic, little endian flag, number of taxa, trees, nodes, words per clade id, bytes of taxa
+_HEADER = struct.Struct("<8s6Q")
+# to change with the format or the encoding of clade ids, names the store files
+FORMAT = 1
+
+
+def _pad(size: int) -> int:
+    """Round a section size up to a multiple of 8"""
+    return -(-size // 8) * 8
+
+
+def file_hash(path: str) -> str:
+    """The sha256 of the content of a file, as a hexadecimal string"""
+    h = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_store(input_file: str, path: str, taxa: list[str] | None = None) -> None:
+    """Encode the trees of a file with a tree on each line into a store
+
+    Args:
+        input_file: Path to the input file.
+        path: the output file path
+        taxa: the ordered list of taxa to map against, by default the
+            sorted leaf names of the first tree
+    """
+    offsets = array("q", [0])
+    lines = array("q")
+    ids: list[int] = []
+    parents = array("q")
+    dists = array("d")
+    supports = array("d")
+    is_leaf = bytearray()
+
+    taxa_ids = None
+    position = 0
+    with open(input_file, "rb") as file:
+        for line in file:
+            newick = line.decode("utf-8").strip()
+            if newick:
+                if taxa_ids is None:
+                    taxa = taxa or sorted(newick_taxa(newick))
+                    taxa_ids = get_taxa_ids(taxa)
+                tree_supports: dict[int, float] = {}
+                nids, nparents, ndists, nleaves = parse_newick_nodes(
+                    newick, taxa_ids, tree_supports
+                )
+                supports.extend(tree_supports.get(k, 1.0) for k in range(len(nids)))
+                ids += nids
+                parents.extend(nparents)
+                dists.extend(ndists)
+                is_leaf.extend(nleaves)
+                offsets.append(len(ids))
+                lines.append(position)
+            position += len(line)
+    lines.append(position)
+
+    taxa = taxa or []
+    taxa_bytes = "\n".join(taxa).encode("utf-8")
+    mask_words = max(1, -(-max((nid.bit_length() for nid in ids), default=0) // 64))
+    masks = array("Q")
+    for nid in ids:
+        for _ in range(mask_words):
+            masks.append(nid & 0xFFFFFFFFFFFFFFFF)
+            nid >>= 64
+
+    with open(path, "wb") as file:
+        file.write(
+            _HEADER.pack(
+                MAGIC,
+                sys.byteorder == "little",
+                len(taxa),
+                len(lines) - 1,
+                len(ids),
+                mask_words,
+                len(taxa_bytes),
+            )
+        )
+        for section in [
+            taxa_bytes,
+            offsets,
+            lines,
+            masks,
+            parents,
+            dists,
+            supports,
+            is_leaf,
+        ]:
+            data = bytes(section)
+            file.write(data)
+            file.write(bytes(_pad(len(data)) - len(data)))
+
+
+class TreeStore:
+    """The encoded trees of a store file, memory mapped. A sequence whose
+    items are the records of each tree (see newick.parse_newick()), which
+    build_graph(), SuperGraph.from_trees() and primconstree() accept in
+    place of Newick strings.
+
+    Attributes:
+        path: the store file
+        taxa: the ordered list of taxa clade ids are mapped against
+        source: the input file the trees were read from, if known, to read
+            their Newick strings (see newick())
+    """
+
+    def __init__(self, path: str, source: str | None = None) -> None:
+        self.path = path
+        self.source = source
+        with open(path, "rb") as file:
+            buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+        magic, little, nb_taxa, nb_trees, n, mask_words, taxa_bytes = (
+            _HEADER.unpack_from(buffer)
+        )
+        if magic != MAGIC:
+            raise Exception(f"{path} is not a PCT tree store file")
+        if bool(little) != (sys.byteorder == "little"):
+            raise Exception(f"{path} was written on a machine with another byte order")
+
+        offset = _HEADER.size
+
+        def section(size: int, fmt: str = "B") -> memoryview:
+            nonlocal offset
+            view = buffer[offset : offset + size]
+            offset += _pad(size)
+            return view.cast(fmt)
+
+        self.taxa = bytes(section(taxa_bytes)).decode("utf-8").split("\n")[:nb_taxa]
+        self.offsets = section(8 * (nb_trees + 1), "q")
+        self.lines = section(8 * (nb_trees + 1), "q")
+        self.masks = section(8 * n * mask_words, "Q")
+        self.parents = section(8 * n, "q")
+        self.dists = section(8 * n, "d")
+        self.supports = section(8 * n, "d")
+        self.is_leaf = section(n)
+        self.mask_words = mask_words
+        self.names = {leaf_id: t for t, leaf_id in get_taxa_ids(self.taxa).items()}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("tree index out of range")
+        return i
+
+    def __iter__(self) -> Iterator[list[Record]]:
+        return (self[i] for i in range(len(self)))
+
+    def ids(self, i: int) -> list[int]:
+        """The clade id of each node of tree i, in preorder"""
+        i = self._index(i)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        w = self.mask_words
+        words = self.masks[start * w : end * w].tolist()
+        ids = words[::w]
+        for j in range(1, w):
+            ids = [nid | word << (64 * j) for nid, word in zip(ids, words[j::w])]
+        return ids
+
+    def __getitem__(self, i: int) -> list[Record]:
+        """The records of tree i, as given by newick.parse_newick()"""
+        i = self._index(i)
+        ids = self.ids(i)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [
+            (nid, ids[p] if p != -1 else -1, d, bool(leaf))
+            for nid, p, d, leaf in zip(
+                ids,
+                self.parents[start:end].tolist(),
+                self.dists[start:end].tolist(),
+                self.is_leaf[start:end],
+            )
+        ]
+
+    def tree(self, i: int) -> ete3.Tree:
+        """Tree i as an ete3.Tree, built from the arrays without parsing,
+        leaves named after their taxon and internal nodes with their support
+        """
+        i = self._index(i)
+        ids = self.ids(i)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        root = ete3.Tree()
+        root.dist = self.dists[start]
+        root.support = self.supports[start]
+        nodes = [root]
+        for k in range(start + 1, end):
+            name = self.names.get(ids[k - start], "") if self.is_leaf[k] else ""
+            node = nodes[self.parents[k]].add_child(
+                name=name, dist=self.dists[k], support=self.supports[k]
+            )
+            nodes.append(node)
+        return root
+
+    def trees(self) -> list[ete3.Tree]:
+        """Every tree as an ete3.Tree, see tree()"""
+        return [self.tree(i) for i in range(len(self))]
+
+    def newick(self, i: int) -> str:
+        """The Newick string of tree i, read from the input file at its offset"""
+        if self.source is None:
+            raise Exception(f"PCT input file of {self.path} unknown")
+        i = self._index(i)
+        with open(self.source, "rb") as file:
+            file.seek(self.lines[i])
+            return file.read(self.lines[i + 1] - self.lines[i]).decode("utf-8").strip()
+
+
+def open_store(input_file: str, cache_dir: str) -> TreeStore:
+    """The store of a file with a tree on each line, kept in a directory under
+    the hash of the file, and written there first if it is missing. Several
+    processes can open the same store, each writes a temporary file renamed
+    once complete.
+
+    Args:
+        input_file: Path to the input file.
+        cache_dir: the directory of the stores, created if needed
+
+    Return:
+        TreeStore: the encoded trees of the file
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{file_hash(input_file)}-{FORMAT}.trees")
+    if not os.path.exists(path):
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            write_store(input_file, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    return TreeStore(path, input_file)
@@ -1,6 +1,25 @@
 """Useful funtion to manipulate trees and encode node ids"""
 
-import ete3
+from __future__ import annotations
+
+import random
+import sys
+from functools import lru_cache
+from typing import TYPE_CHECKING, Generator, cast
+
+if TYPE_CHECKING:
+    import ete3
+else:
+    from .lazy import ete3
+
+
+# an encoded node (node id, parent id, edge length, is leaf), see tree_to_records()
+Record = tuple[int, int, float, bool]
+
+# above this number of taxa, clade ids are fingerprints, see get_leaf_ids()
+MAX_BITMASK_TAXA = 64
+FINGERPRINT_SEED = 0x5EED
+FINGERPRINT_BITS = 112
 
 
 def read_trees(input_file: str, nwk_format: int = 0) -> list[ete3.Tree]:
@@ -22,11 +41,26 @@ def read_trees(input_file: str, nwk_format: int = 0) -> list[ete3.Tree]:
     return trees
 
 
+def read_newicks(input_file: str) -> list[str]:
+    """Read the trees from the input file as Newick strings, without parsing them
+
+    Args:
+        input_file (str): Path to the input file.
+
+    Returns:
+        list[str]: list of the Newick strings
+    """
+    with open(input_file, "r") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
 def clade_to_id(clade: list[str], taxa: list[str]) -> int:
     """Build the node id as the binary representations of
     the clade for example the clade ABD within the taxa
     A,B,C,D,E get the binary representation 11010 which give
     id 26
+    Above MAX_BITMASK_TAXA taxa, the id is a fingerprint instead,
+    see get_leaf_ids(), in both cases the sum of the ids of its leaves
 
     Args:
         clade: the list of taxon in the clade
@@ -36,25 +70,147 @@ def clade_to_id(clade: list[str], taxa: list[str]) -> int:
         int: the binary mapping as an integer
     """
     identifier = 0
-    for i, t in enumerate(taxa):
+    for t, leaf_id in zip(taxa, get_leaf_ids(taxa)):
         if t in clade:
-            identifier += 1 << i
+            identifier += leaf_id
     return identifier
 
 
+@lru_cache(maxsize=8)
+def _fingerprint_keys(nb_taxa: int) -> tuple[int, ...]:
+    """The fingerprint of each taxon, the random part drawn from a fixed seed"""
+    rng = random.Random(FINGERPRINT_SEED)
+    keys = tuple(1 << FINGERPRINT_BITS | rng.getrandbits(96) for _ in range(nb_taxa))
+    if len(set(keys)) != nb_taxa:
+        raise Exception("Collision between taxa fingerprints")
+    return keys
+
+
+def get_leaf_ids(taxa: list[str], bitmask: bool | None = None) -> list[int]:
+    """Get the id of the leaf of each taxon, in the order of taxa.
+    The id of a clade is the sum of the ids of its leaves (see clade_to_id()).
+
+    Up to MAX_BITMASK_TAXA taxa leaf ids are single bits, so clade ids are
+    exact bitmasks fitting a machine word. Above, bitmasks would cost a
+    machine word of work every 64 taxa for each hash, comparison or union,
+    so leaf ids are fingerprints 2^112 + r, where r is a random 96 bits
+    integer. The id of a clade then holds its number of leaves in its
+    upper bits (see clade_size()) and a random sum in its lower 112 bits,
+    two clades of the same size getting the same id with a probability of
+    about 2^-96. Clade ids stay under 128 bits up to 65536 taxa.
+    Collisions are not checked while building the supergraph, only with
+    --stats or --debug (see newick.check_clade_ids()), at the cost of
+    another pass over the trees.
+
+    Args:
+        taxa: the ordered list of all taxa
+        bitmask: force bitmask (True) or fingerprint (False) ids,
+            by default chosen on the number of taxa
+
+    Return:
+        list[int]: the id of each leaf
+    """
+    if bitmask is None:
+        bitmask = len(taxa) <= MAX_BITMASK_TAXA
+    if bitmask:
+        return [1 << i for i in range(len(taxa))]
+    return list(_fingerprint_keys(len(taxa)))
+
+
+def get_taxa_ids(taxa: list[str], bitmask: bool | None = None) -> dict[str, int]:
+    """Map each taxon to the id of its leaf, consistent with clade_to_id(),
+    see get_leaf_ids()
+    """
+    return dict(zip(taxa, get_leaf_ids(taxa, bitmask)))
+
+
+def get_leaf_id(name: str, taxa_ids: dict[str, int]) -> int:
+    """Get the id of a leaf from its name, 0 for a leaf without name (e.g. in
+    "(A,)"), an exception is raised if the name is not one of the taxa
+    """
+    if not name:
+        return 0
+    if name not in taxa_ids:
+        raise Exception(f"PCT taxon {name} unknown, not one of the taxa of the trees")
+    return taxa_ids[name]
+
+
+def clade_size(identifier: int, taxa: list[str]) -> int:
+    """Get the number of leaves of a clade from its id"""
+    if len(taxa) <= MAX_BITMASK_TAXA:
+        return identifier.bit_count()
+    return identifier >> FINGERPRINT_BITS
+
+
+def get_tie_ids(nb_nodes: int, taxa: list[str]) -> list[int]:
+    """Draw distinct random ids, used to break ties between nodes in the MST,
+    with the state of the random module.
+    Ids are drawn below the id of the root of a bitmask id (2^n - 1) as they
+    always were, capped to the largest range random.sample() accepts
+    """
+    return random.sample(range(0, min((1 << len(taxa)) - 1, sys.maxsize)), nb_nodes)
+
+
+def tree_to_ids(tree: ete3.Tree, taxa_ids: dict[str, int]) -> dict[ete3.Tree, int]:
+    """Compute the id of every node of the tree in a single postorder pass,
+    the id of a node being the sum of the ids of its children.
+    Give the same ids as calling clade_to_id() on each node, in linear time.
+
+    Args:
+        tree: the tree to encode
+        taxa_ids: the leaf ids, as given by get_taxa_ids()
+
+    Return:
+        dict: the id of each node of the tree
+    """
+    ids = {}
+    for node in cast(Generator[ete3.Tree, None, None], tree.traverse("postorder")):
+        if node.children:
+            nid = 0
+            for c in node.children:
+                nid += ids[c]
+            ids[node] = nid
+        else:
+            ids[node] = get_leaf_id(node.name, taxa_ids)
+    return ids
+
+
+def tree_to_records(tree: ete3.Tree, taxa_ids: dict[str, int]) -> list[Record]:
+    """Encode a tree into records (node id, parent id, edge length, is leaf),
+    one per node in preorder, the parent id of the root being -1.
+    This is the same encoding as newick.parse_newick()
+    """
+    ids = tree_to_ids(tree, taxa_ids)
+    return [
+        (ids[node], ids[node.up] if node.up else -1, node.dist, node.is_leaf())
+        for node in cast(
+            Generator[ete3.Tree, None, None], tree.traverse(strategy="preorder")
+        )
+    ]
+
+
 def get_root_id(taxa: list[str]) -> int:
     """Get the id for the root (clade with all taxa)
     one could just use clade_to_id but this is faster
     """
-    return sum(1 << i for i in range(len(taxa)))
+    return sum(get_leaf_ids(taxa))
 
 
 def id_to_clade(identifier: int, taxa: list[str]) -> list[str]:
     """Get the clade contend as a list of taxon from
     the id infered with the method of clade_to_id
+    Fingerprint ids (above MAX_BITMASK_TAXA taxa) can only be
+    turned back into a clade for leaves and for the root
     """
     if identifier < 0:
         raise Exception("invalid id")
+    if len(taxa) > MAX_BITMASK_TAXA:
+        if identifier == get_root_id(taxa):
+            return sorted(taxa)
+        for t, leaf_id in zip(taxa, get_leaf_ids(taxa)):
+            if identifier == leaf_id:
+                return [t]
+        raise Exception(f"Clade of fingerprint id {identifier} unknown")
     clade = []
     for i, t in enumerate(taxa):
         if identifier & (1 << i) == (1 << i):
@@ -0,0 +1,118 @@
+import ete3
+import pytest
+
+from primconstree.criteria import VERSIONS
+from primconstree.newick import (
+    check_clade_ids,
+    exact_clade_ids,
+    get_taxa,
+    newick_taxa,
+    parse_newick,
+)
+from primconstree.primconstree import primconstree
+from primconstree.stats import Stats
+from primconstree.utils import get_taxa_ids, tree_to_records
+
+TAXA_IDS = get_taxa_ids(["A", "B", "C", "D"])
+
+
+@pytest.mark.parametrize(
+    "newick",
+    [
+        "",
+        "hello",
+        "hello;",
+        ">gene E",
+        "((A,B),(C,D)));",
+        "((A,B),(C,D)",
+        "((A,B),(C,D))",
+        "((A,B),(C,D)) ;x",
+        "((A,B),(C,D)); ((A,C),(B,D));",
+        "(A,B),(C,D);",
+        "((A,B)(C,D));",
+        "((A,B):x,(C,D));",
+    ],
+)
+def test_malformed(newick):
+    with pytest.raises(Exception, match="PCT invalid newick"):
+        parse_newick(newick, TAXA_IDS)
+
+
+@pytest.mark.parametrize(
+    "newick",
+    [
+        "((A:1[&&NHX:S=human:E=1.1.1],B:2)[&&NHX:D=N],(C,D));",
+        "((A:1,B:2)[comment],(C[x],D))[root];",
+        "[header]((A:1, B:2), (C, D));\n",
+    ],
+)
+def test_comments(newick):
+    assert parse_newick(newick, TAXA_IDS) == parse_newick(
+        "((A:1,B:2),(C,D));", TAXA_IDS
+    )
+    assert sorted(newick_taxa(newick)) == ["A", "B", "C", "D"]
+
+
+def test_empty_leaf():
+    assert parse_newick("(A,);", TAXA_IDS) == [
+        (1, -1, 0.0, False),
+        (1, 1, 1.0, True),
+        (0, 1, 1.0, True),
+    ]
+
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_consensus_of_malformed(engine):
+    with pytest.raises(Exception, match="PCT invalid newick"):
+        primconstree(["((A,B),(C,D));", "hello"], VERSIONS[1], engine=engine)
+
+
+def test_unknown_taxon():
+    with pytest.raises(Exception, match="PCT taxon E unknown"):
+        parse_newick("((A,B),(C,E));", TAXA_IDS)
+    with pytest.raises(Exception, match="PCT taxon E unknown"):
+        tree_to_records(ete3.Tree("((A,B),(C,E));"), TAXA_IDS)
+
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+def test_consensus_of_unknown_taxon(engine):
+    with pytest.raises(Exception, match="PCT taxon E unknown"):
+        primconstree(["((A,B),(C,D));", "((A,E),(C,D));"], VERSIONS[1], engine=engine)
+
+
+def test_exact_clade_ids():
+    tree = ete3.Tree()
+    tree.populate(100, names_library=[f"T{i}" for i in range(100)])
+    taxa = get_taxa(tree)
+    taxa_ids = get_taxa_ids(taxa)
+    leaf_bits = {leaf_id: 1 << i for i, leaf_id in enumerate(taxa_ids.values())}
+    exact = [nid for nid, _, _, _ in tree_to_records(tree, get_taxa_ids(taxa, True))]
+    assert exact_clade_ids(tree_to_records(tree, taxa_ids), leaf_bits) == exact
+    assert check_clade_ids([tree, tree.write()], taxa) == len(exact)
+
+
+def test_clade_id_collision():
+    # clade CD encoded with the id of clade AB
+    records = [
+        (15, -1, 0.0, False),
+        (3, 15, 1.0, False),
+        (1, 3, 1.0, True),
+        (2, 3, 1.0, True),
+        (3, 15, 1.0, False),
+        (4, 3, 1.0, True),
+        (8, 3, 1.0, True),
+    ]
+    with pytest.raises(Exception, match="Clade id 3 collision"):
+        check_clade_ids([records], ["A", "B", "C", "D"])
+
+
+def test_consensus_checks_clade_ids():
+    names = [f"T{i}" for i in range(100)]
+    trees = []
+    for _ in range(5):
+        tree = ete3.Tree()
+        tree.populate(100, names_library=names)
+        trees.append(tree.write())
+    stats = Stats()
+    primconstree(trees, VERSIONS[1], stats=stats)
+    assert "check_clade_ids" in stats.times
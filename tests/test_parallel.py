@@ -0,0 +1,23 @@
+import random
+
+import ete3
+
+from primconstree.algorithm import build_graph
+from primconstree.newick import get_taxa
+
+
+def test_build_graph_parallel():
+    random.seed(0)
+    names = [f"T{i}" for i in range(20)]
+    newicks = []
+    for _ in range(50):
+        tree = ete3.Tree()
+        tree.populate(20, names_library=random.sample(names, 20), random_branches=True)
+        newicks.append(tree.write(dist_formatter="%r"))
+    taxa = get_taxa(newicks[0])
+
+    serial = build_graph(newicks, taxa)
+    for jobs in [2, 3]:
+        graph = build_graph(newicks, taxa, jobs)
+        assert list(graph.nodes(data=True)) == list(serial.nodes(data=True))
+        assert list(graph.edges(data=True)) == list(serial.edges(data=True))
@@ -0,0 +1,17 @@
+import matplotlib
+import pytest
+
+from primconstree.criteria import VERSIONS
+from primconstree.primconstree import primconstree
+
+# debug draws the supergraph and the trees, without showing them
+matplotlib.use("Agg")
+
+TREES = ["((A,B),(C,D));", "((A,C),(B,D));", "((A,B),(C,D));"]
+
+
+@pytest.mark.parametrize("engine", ["networkx", "csr", "disk"])
+def test_debug(engine):
+    expected = primconstree(TREES, VERSIONS[1]).write()
+    consensus = primconstree(TREES, VERSIONS[1], engine=engine, debug=True)
+    assert consensus.write() == expected
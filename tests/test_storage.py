@@ -0,0 +1,53 @@
+import os
+import pickle
+
+import ete3
+import pytest
+
+from primconstree.criteria import VERSIONS
+from primconstree.diskgraph import build_disk_graph
+from primconstree.newick import get_taxa
+from primconstree.primconstree import graph_to_consensus, primconstree
+from primconstree.storage import load_supergraph, save_supergraph
+from primconstree.supergraph import SuperGraph
+
+
+@pytest.fixture(scope="module", params=[20, 100])
+def trees(request):
+    names = [f"T{i}" for i in range(request.param)]
+    trees = []
+    for _ in range(20):
+        tree = ete3.Tree()
+        tree.populate(request.param, names_library=names, random_branches=True)
+        trees.append(tree.write())
+    return trees
+
+
+def test_mapped_ids(trees, tmp_path):
+    taxa = get_taxa(trees[0])
+    sg = SuperGraph.from_trees(trees, taxa)
+    path = os.path.join(tmp_path, "supergraph.pct")
+    save_supergraph(sg, taxa, path)
+
+    loaded, loaded_taxa = load_supergraph(path)
+    assert loaded_taxa == taxa
+    assert list(loaded.ids) == sg.ids
+    assert all(loaded.index[nid] == i for i, nid in enumerate(sg.ids))
+    assert sum(sg.ids) + 1 not in loaded.index
+    with pytest.raises(KeyError):
+        loaded.index[sum(sg.ids) + 1]
+    assert pickle.loads(pickle.dumps(loaded)).ids == sg.ids
+
+
+def test_disk_consensus(trees, tmp_path):
+    taxa = get_taxa(trees[0])
+    expected = primconstree(trees, VERSIONS[1], engine="csr").write()
+    path = os.path.join(tmp_path, "supergraph.pct")
+    build_disk_graph(trees, taxa, path)
+    graph, _ = load_supergraph(path)
+    assert graph_to_consensus(graph, taxa, VERSIONS[1]).write() == expected
+    with open(path, "rb") as file:
+        data = file.read()
+    save_supergraph(SuperGraph.from_trees(trees, taxa), taxa, path)
+    with open(path, "rb") as file:
+        assert file.read() == data
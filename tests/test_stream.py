@@ -0,0 +1,46 @@
+import glob
+import os
+
+import pytest
+
+from primconstree.criteria import VERSIONS
+from primconstree.newick import get_taxa
+from primconstree.primconstree import primconstree
+from primconstree.stream import StreamingConsensus, window_consensus
+from primconstree.utils import read_newicks
+
+DATASETS = os.path.join(os.path.dirname(__file__), "..", "datasets")
+
+# input files whose trees share their taxa
+INPUTS = [
+    f
+    for f in sorted(glob.glob(os.path.join(DATASETS, "**", "*.txt"), recursive=True))
+    if len({tuple(get_taxa(nwk)) for nwk in read_newicks(f)}) == 1
+]
+
+
+@pytest.mark.parametrize("engine", ["networkx", "csr"])
+@pytest.mark.parametrize("input_file", INPUTS, ids=os.path.basename)
+def test_window_consensus(input_file, engine):
+    newicks = read_newicks(input_file)
+    window = max(2, len(newicks) // 3)
+    stride = max(1, window // 4)
+    consensus = list(
+        window_consensus(input_file, VERSIONS[1], window, stride, engine=engine)
+    )
+    assert len(consensus) == (len(newicks) - window) // stride + 1
+    for k, tree in enumerate(consensus):
+        trees = newicks[k * stride : k * stride + window]
+        assert tree.write() == primconstree(trees, VERSIONS[1], engine=engine).write()
+
+
+def test_remove_tree():
+    newicks = read_newicks(os.path.join(DATASETS, "simulated", "Trex_trees20.txt"))
+    stream = StreamingConsensus(VERSIONS[1])
+    records = [stream.add_tree(nwk) for nwk in newicks]
+    for tree in records[:5]:
+        stream.remove_tree(tree)
+    with pytest.raises(Exception, match="PCT the remaining trees are required"):
+        stream.consensus()
+    expected = primconstree(newicks[5:], VERSIONS[1]).write()
+    assert stream.consensus(records[5:]).write() == expected